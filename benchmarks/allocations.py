@@ -0,0 +1,97 @@
+# Counts the result objects the combinator engine allocates per token.
+#
+#   python benchmarks/allocations.py [--baseline REV]
+#
+# A result object is anything a parser hands back to its caller to describe a
+# step: a `ParseResult.Match` or `ParseResult.Error`, an `(item, position)`
+# tuple, or a `Stream` cursor. Items built by the grammar itself (tokens, AST
+# nodes, lists) are not counted. With `--baseline`, the same measurement is
+# run against another revision of the repository for comparison.
+import argparse
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+from harness import ROOT, at_revision, corpus
+
+
+def count_results(func: t.Callable[[], t.Any]) -> int:
+    from opyl.support.combinator import PR
+    from opyl.support.stream import Stream
+
+    stream_init = Stream.__init__.__code__
+    count = 0
+
+    def profile(frame: t.Any, event: str, arg: t.Any):
+        nonlocal count
+        if event == "call" and frame.f_code is stream_init:
+            count += 1
+        elif event == "return":
+            match arg:
+                case PR.Match() | PR.Error():
+                    count += 1
+                case (_, int()) if arg.__class__ is tuple:
+                    count += 1
+                case _:
+                    ...
+
+    sys.setprofile(profile)
+    try:
+        func()
+    finally:
+        sys.setprofile(None)
+    return count
+
+
+def measure(root: Path) -> dict[str, float]:
+    sys.path.insert(0, str(root))
+    from opyl.compile import lex, parse
+
+    source = corpus(root)
+    stream = lex.tokenize(source).stream
+    tokens = len(stream.spans)
+
+    start = time.perf_counter()
+    lex.tokenize(source)
+    lexed = time.perf_counter()
+    parse.parse(stream)
+    parsed = time.perf_counter()
+
+    return {
+        "tokens": tokens,
+        "lex_results_per_token": count_results(lambda: lex.tokenize(source)) / tokens,
+        "parse_results_per_token": count_results(lambda: parse.parse(stream)) / tokens,
+        "lex_us_per_token": (lexed - start) / tokens * 1e6,
+        "parse_us_per_token": (parsed - lexed) / tokens * 1e6,
+    }
+
+
+def report(name: str, results: dict[str, float]):
+    print(
+        f"{name:>12}: {int(results['tokens'])} tokens, "
+        f"lex {results['lex_results_per_token']:.2f} results/token "
+        f"({results['lex_us_per_token']:.2f} us/token), "
+        f"parse {results['parse_results_per_token']:.2f} results/token "
+        f"({results['parse_us_per_token']:.2f} us/token)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", help="git revision to compare against")
+    parser.add_argument("--root", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.root is not None:
+        print(repr(measure(args.root)))
+        return
+
+    if args.baseline is not None:
+        report(args.baseline, at_revision(args.baseline, __file__))
+
+    report("working tree", measure(ROOT))
+
+
+if __name__ == "__main__":
+    main()
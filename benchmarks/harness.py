@@ -0,0 +1,46 @@
+# What the benchmarks share: the corpus they run over, and running one of them
+# against another revision of the repository.
+import ast
+import subprocess
+import sys
+import tempfile
+import typing as t
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def corpus(root: Path) -> str:
+    from opyl.compile import lex, parse
+    from opyl.support.combinator import PR
+
+    # Concatenates every test case that parses on its own into one large file.
+    accepted = list[str]()
+    for path in sorted((root / "tests" / "test_cases").glob("*.opal")):
+        text = path.read_text()
+        if isinstance(
+            parse.parse(lex.tokenize("\n".join([*accepted, text])).stream), PR.Match
+        ):
+            accepted.append(text)
+
+    return "\n".join(accepted * 10)
+
+
+def at_revision(revision: str, script: str, *args: str) -> t.Any:
+    # Runs `script` with `args` over a checkout of `revision`, which it is
+    # given as `--root`, and returns the literal it printed last. The checkout
+    # is made with `git archive`, so it holds only committed files.
+    with tempfile.TemporaryDirectory() as directory:
+        archive = subprocess.run(
+            ["git", "-C", str(ROOT), "archive", revision],
+            check=True,
+            capture_output=True,
+        ).stdout
+        subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+        output = subprocess.run(
+            [sys.executable, script, "--root", directory, *args],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    return ast.literal_eval(output.splitlines()[-1])
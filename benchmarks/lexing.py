@@ -0,0 +1,51 @@
+# Finds the source size from which lexing in parallel beats lexing serially.
+#
+#   python benchmarks/lexing.py [--workers N] [--engine NAME] [--rounds N]
+#
+# Lexes copies of the corpus of `harness.py` of doubling size, serially and
+# with `lex.Parallel`, and reports the best time of each. The first size at
+# which the parallel time is lower is the one to set `Parallel.threshold` to.
+import argparse
+import sys
+import time
+
+from harness import ROOT, corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--engine", default="Regex")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--doublings", type=int, default=8)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    from opyl.compile import lex
+
+    engine = lex.Engine[args.engine]
+    parallel = lex.Parallel(workers=args.workers, threshold=0)
+    text = corpus(ROOT)
+
+    crossover = None
+    for doubling in range(args.doublings):
+        source = "\n".join([text] * 2**doubling)
+        times = {"serial": float("inf"), "parallel": float("inf")}
+        for _ in range(args.rounds):
+            for name, mode in (("serial", None), ("parallel", parallel)):
+                start = time.perf_counter()
+                lex.tokenize(source, engine=engine, parallel=mode)
+                times[name] = min(times[name], time.perf_counter() - start)
+
+        print(
+            f"{len(source):>10} chars: serial {times['serial'] * 1e3:.1f} ms, "
+            f"parallel {times['parallel'] * 1e3:.1f} ms"
+        )
+        if crossover is None and times["parallel"] < times["serial"]:
+            crossover = len(source)
+
+    print(f"crossover: {crossover if crossover is not None else 'not reached'}")
+
+
+if __name__ == "__main__":
+    main()
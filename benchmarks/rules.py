@@ -0,0 +1,43 @@
+# Profiles the labelled rules of the parser over a corpus.
+#
+#   python benchmarks/rules.py [--folded PATH] [--interpreted] [FILE ...]
+#
+# Prints, for each rule, its calls, matches, failures and errors, its inclusive
+# and exclusive time, and the tokens it consumed and backtracked over. With
+# `--folded`, the exclusive time under each stack of rules is also written in
+# the folded stack format read by flame graph tools such as `flamegraph.pl`
+# or speedscope. Without files, the corpus of `harness.py` is used.
+import argparse
+import sys
+from pathlib import Path
+
+from harness import ROOT, corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--folded", type=Path, help="write folded stacks here")
+    parser.add_argument(
+        "--interpreted", action="store_true", help="profile the uncompiled grammar"
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    from opyl.compile import lex, parse
+    from opyl.support.combinator import Profile
+
+    grammar = parse.decl_lines if args.interpreted else parse.compiled_decl_lines
+    sources = [path.read_text() for path in args.files] or [corpus(ROOT)]
+
+    profile = Profile()
+    for source in sources:
+        grammar.parse(lex.tokenize(source).stream, profile=profile)
+
+    print(profile.report())
+    if args.folded is not None:
+        args.folded.write_text(profile.folded())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Measures what tracing costs a parse, both when it is off and when it is on.
+#
+#   python benchmarks/tracing.py [--baseline REV] [--rounds N]
+#
+# Parses the corpus of `harness.py` with the compiled and the interpreted
+# grammar, without a trace and with one, and reports the best time of each
+# over interleaved rounds. Without a trace, the only cost is one check per
+# branch tried by an ordered choice; `--baseline` runs the untraced parses
+# against another revision of the repository, such as one from before tracing
+# existed, for comparison.
+import argparse
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+from harness import ROOT, at_revision, corpus
+
+
+def best(rounds: int, runs: dict[str, t.Callable[[], float]]) -> dict[str, float]:
+    # Interleaves the runs so that they see the same machine noise.
+    times = {name: float("inf") for name in runs}
+    for _ in range(rounds):
+        for name, run in runs.items():
+            times[name] = min(times[name], run())
+    return times
+
+
+def measure(root: Path, rounds: int, traced: bool) -> dict[str, float]:
+    sys.path.insert(0, str(root))
+    from opyl.compile import lex, parse
+
+    source = corpus(root)
+    tokens = len(lex.tokenize(source).stream.spans)
+
+    def timed(parser: t.Any, **kwargs: t.Any) -> t.Callable[[], float]:
+        def run() -> float:
+            # Older revisions kept memo tables across parses of one token
+            # buffer, so every run gets a fresh one for a fair baseline.
+            stream = lex.tokenize(source).stream
+            start = time.perf_counter()
+            parser.parse(stream, **kwargs)
+            return time.perf_counter() - start
+
+        return run
+
+    runs = {
+        "compiled": timed(parse.compiled_decl_lines),
+        "interpreted": timed(parse.decl_lines),
+    }
+    if traced:
+        from opyl.support.combinator import Trace
+
+        runs["compiled traced"] = timed(parse.compiled_decl_lines, trace=Trace())
+        runs["interpreted traced"] = timed(parse.decl_lines, trace=Trace())
+
+    times = best(rounds, runs)
+    return {name: elapsed / tokens * 1e6 for name, elapsed in times.items()}
+
+
+def report(name: str, results: dict[str, float]):
+    print(
+        f"{name:>12}: "
+        + ", ".join(f"{run} {elapsed:.2f} us/token" for run, elapsed in results.items())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", help="git revision to compare against")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--root", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.root is not None:
+        print(repr(measure(args.root, args.rounds, traced=False)))
+        return
+
+    if args.baseline is not None:
+        report(
+            args.baseline,
+            at_revision(args.baseline, __file__, "--rounds", str(args.rounds)),
+        )
+
+    report("working tree", measure(ROOT, args.rounds, traced=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Compares the lexing engines on a large source.
+#
+#   python benchmarks/vectorized.py [--size MB] [--rounds N] [--engines NAME ...]
+#
+# Lexes copies of the corpus of `harness.py` joined up to about `--size`
+# megabytes with each engine, and reports the best time of each and its speed
+# relative to each engine listed before it. `Engine.Vector` needs NumPy,
+# without which it lexes as `Engine.Regex` does.
+#
+# On a 10 MB source:
+#
+#   Combinator: 37931 ms, 0.3 MB/s
+#        Regex: 6894 ms, 1.4 MB/s, 5.5x Combinator
+#       Vector: 1909 ms, 5.2 MB/s, 19.9x Combinator, 3.6x Regex
+import argparse
+import sys
+import time
+
+from harness import ROOT, corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--engines", nargs="+", default=["Combinator", "Regex", "Vector"]
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    from opyl.compile import lex
+
+    if lex.np is None:
+        print("NumPy is not installed: Vector lexes as Regex")
+
+    text = corpus(ROOT)
+    source = "\n".join([text] * max(1, round(args.size * 2**20 / len(text))))
+    times = dict[str, float]()
+    for name in args.engines:
+        engine = lex.Engine[name]
+        times[name] = float("inf")
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            lex.tokenize(source, engine=engine)
+            times[name] = min(times[name], time.perf_counter() - start)
+
+    print(f"{len(source)} chars")
+    for index, (name, seconds) in enumerate(times.items()):
+        relative = "".join(
+            f", {times[other] / seconds:.1f}x {other}" for other in list(times)[:index]
+        )
+        print(
+            f"{name:>10}: {seconds * 1e3:.0f} ms, "
+            f"{len(source) / seconds / 2**20:.1f} MB/s{relative}"
+        )
+
+
+if __name__ == "__main__":
+    main()
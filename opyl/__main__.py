@@ -13,7 +13,7 @@ def main():
         case Result.Err(err):
             error.fatal_io_error(err)
         case Result.Ok(text):
-            compile.compile(args.source_file, text)
+            compile.compile(args.source_file, text, args.engine)
 
 
 if __name__ == "__main__":
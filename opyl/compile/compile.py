@@ -1,25 +1,40 @@
 from pprint import pprint
 from pathlib import Path
+import os
+import signal
+import sys
 from opyl.support.stream import Source
-from opyl.support.combinator import PR
+from opyl.support.combinator import PR, Failure, Trace
 from opyl.compile import lex
 from opyl.compile import parse
 from opyl.compile import symbols
-from opyl.compile.error import report_lex_errors, report_parse_error
+from opyl.compile.token import Token
+from opyl.compile.error import report_lex_errors, report_parse_error, farthest_error
 
 
-def compile(source_fpath: Path, text: str):
+def compile(source_fpath: Path, text: str, engine: lex.Engine = lex.Engine.Combinator):
     source = Source(text, source_fpath)
-    lex_result = lex.tokenize(source=text, file_handle=source_fpath)
+    lex_result = lex.tokenize(source=text, file_handle=source_fpath, engine=engine)
 
     report_lex_errors(lex_result.errors, source)
 
-    match parse.parse(lex_result.stream):
+    # Setting OPYL_TRACE records the branches the parser tries, which are
+    # dumped if the parse fails, or on SIGUSR1 while it runs.
+    trace = None
+    if os.environ.get("OPYL_TRACE"):
+        trace = Trace(on_error=sys.stderr)
+        if hasattr(signal, "SIGUSR1"):
+            trace.dump_on(signal.SIGUSR1)
+
+    failure = Failure[Token]()
+    match parse.parse(lex_result.stream, failure=failure, trace=trace):
         case PR.Match(decls):
             ...
             pprint(decls)
         case PR.NoMatch:
-            print("No Match! (wtf?)")
+            report_parse_error(
+                farthest_error(failure, lex_result.stream), failure.span, source
+            )
             exit()
         case PR.Error(err, span):
             report_parse_error(err, span, source)
@@ -4,8 +4,30 @@ from copy import copy
 import enum
 
 from opyl.support.span import Span
-from opyl.support.stream import Source
-from opyl.support.combinator import ParseResult
+from opyl.support.stream import Source, Stream
+from opyl.support.combinator import (
+    Parser,
+    ParseResult,
+    Failure,
+    Just,
+    Filter,
+    OneOf,
+    Nothing,
+    Alternative,
+    Choice,
+    First,
+    branches,
+)
+from opyl.compile.token import (
+    Token,
+    Basic,
+    Keyword,
+    Identifier,
+    IntegerLiteral,
+    StringLiteral,
+    CharacterLiteral,
+    basic_text,
+)
 from opyl.console.color import colors
 from opyl.io import file
 
@@ -58,10 +80,91 @@ class ParseError:
     following: str
 
 
+# Produced when a parse runs out of its step or time budget, which says nothing
+# about whether the input is well formed.
+@dataclass
+class BudgetExhausted(ParseError):
+    expected: str = "less backtracking"
+    following: str = "this point"
+
+
+def describe(token: Token) -> str:
+    match token:
+        case Basic.NewLine:
+            return "newline"
+        case Basic():
+            return f"'{basic_text.get(token, token.name)}'"
+        case Keyword():
+            return f"'{token.value}'"
+        case Identifier(identifier):
+            return f"identifier '{identifier}'"
+        case IntegerLiteral():
+            return "integer literal"
+        case StringLiteral():
+            return "string literal"
+        case CharacterLiteral():
+            return "character literal"
+
+
+def describe_first(item: Token | First.Kind) -> str:
+    match item:
+        case First.End:
+            return "end of input"
+        case First.Other:
+            return "input"
+        case _:
+            return describe(item)
+
+
+def describe_expected(parser: Parser[Token, t.Any, ParseError]) -> list[str]:
+    match parser:
+        case Just(pattern):
+            return [describe(pattern)]
+        case OneOf(choices):
+            return [describe(choice) for choice in choices]
+        case Filter(_, label) if label is not None:
+            return [label]
+        case Nothing():
+            return ["end of input"]
+        case Alternative() | Choice():
+            # Recorded when the upcoming item ruled out some of the branches,
+            # which are described by the items they could have started with.
+            described = list[str]()
+            for branch in branches(t.cast(Parser[Token, t.Any, ParseError], parser)):
+                items = branch.first_set().items or frozenset()
+                described.extend(sorted(map(describe_first, items)))
+            return described
+        case _:
+            return []
+
+
+def farthest_error(failure: Failure[Token], stream: Stream[Token]) -> ParseError:
+    # An error for the farthest item a parse failed on, naming everything that
+    # could have been there.
+    expected = list[str]()
+    for parser in failure.expected:
+        for description in describe_expected(parser):
+            if description not in expected:
+                expected.append(description)
+
+    if failure.position > 0:
+        following = describe(stream.spans[failure.position - 1].item)
+    else:
+        following = "start of input"
+
+    return ParseError(expected=" or ".join(expected) or "input", following=following)
+
+
 def report_parse_error(error: ParseError, span: Span, source: Source):
     start, _ = to_location(span, source.text)
 
-    message = f"{colors.bold}{source.file}:{start.line+1}:{start.column}: {colors.red}syntax error:{colors.reset}{colors.bold} expected {error.expected} following {error.following}{colors.reset}"
+    match error:
+        case BudgetExhausted():
+            summary = "parse budget exhausted"
+        case _:
+            summary = f"expected {error.expected} following {error.following}"
+
+    message = f"{colors.bold}{source.file}:{start.line+1}:{start.column}: {colors.red}syntax error:{colors.reset}{colors.bold} {summary}{colors.reset}"
     message += f"\n    {source.line(start.line)}"
     message += (
         "\n    " + (start.column) * " " + f"{colors.bold}{colors.green}^{colors.reset}"
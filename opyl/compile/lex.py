@@ -1,6 +1,18 @@
 import typing as t
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import Enum, IntEnum, auto
 import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, repeat
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional. Without it, `Engine.Vector` lexes as `Engine.Regex`.
+    np = None
 
 from opyl.compile.error import LexError
 from opyl.compile.token import (
@@ -13,6 +25,7 @@ from opyl.compile.token import (
     CharacterLiteral,
     Comment,
     Whitespace,
+    basic_text,
 )
 from opyl.support.combinator import (
     Filter,
@@ -20,19 +33,121 @@ from opyl.support.combinator import (
     ParseResult,
     PR,
     OneOf,
-    choice,
     startswith,
     Parser,
     Nothing,
+    char_class,
+    take_while,
+    take_while1,
+    Trie,
+    optimize,
 )
+from opyl.support.compiler import compile_parser
+from opyl.support.analysis import check
 from opyl.support.stream import Stream
-from opyl.support.span import Spanned
+from opyl.support.buffer import SplicedArray, TokenBuffer
+from opyl.support.span import Spanned, Span
+
+
+@dataclass
+class Interner:
+    # Equal identifiers and string literals found while lexing share one token,
+    # so names can be compared by identity. Identifiers are also numbered in
+    # the order they were first found, for later phases to key tables on.
+    ids: dict[str, int] = field(default_factory=dict)
+    identifiers: list[Identifier] = field(default_factory=list)
+    strings: dict[str, StringLiteral] = field(default_factory=dict)
+
+    def identifier(self, spelling: str) -> Identifier:
+        number = self.ids.get(spelling)
+        if number is None:
+            number = self.ids[spelling] = len(self.identifiers)
+            self.identifiers.append(Identifier(spelling))
+        return self.identifiers[number]
+
+    def string(self, string: str) -> StringLiteral:
+        literal = self.strings.get(string)
+        if literal is None:
+            literal = self.strings[string] = StringLiteral(string)
+        return literal
+
+    def intern[T](self, token: T) -> T:
+        match token:
+            case Identifier(spelling):
+                return t.cast(T, self.identifier(spelling))
+            case StringLiteral(string):
+                return t.cast(T, self.string(string))
+            case _:
+                return token
+
+    def id(self, identifier: Identifier) -> int:
+        return self.ids[identifier.identifier]
+
+
+@dataclass
+class Trivia:
+    # The comments of a token stream, kept beside it rather than in it, for
+    # tools such as formatters. `positions` holds the number of tokens before
+    # each comment, so the comments between two tokens are found by bisecting.
+    # Whitespace is not kept, since it lies between the spans of the tokens
+    # and comments. Trivia made by `splice` shares its comments and positions
+    # with the trivia it was spliced from, and is not added to.
+    comments: TokenBuffer[Comment] = field(
+        default_factory=lambda: TokenBuffer[Comment](vocabulary)
+    )
+    positions: array[int] | SplicedArray = field(default_factory=lambda: array("I"))
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def add(self, comment: Comment, position: int, start: int, end: int):
+        assert isinstance(self.positions, array)
+        self.comments.append(comment, start, end)
+        self.positions.append(position)
+
+    def truncate(self, length: int):
+        assert isinstance(self.positions, array)
+        self.comments.truncate(length)
+        del self.positions[length:]
+
+    def join(self, other: "Trivia", position: int):
+        # Appends the comments of `other`, which follows `position` tokens.
+        assert isinstance(self.positions, array)
+        self.comments.join(other.comments)
+        self.positions.extend(array("I", map(position.__add__, other.positions)))
+
+    def before(self, position: int) -> list[Spanned[Comment]]:
+        # The comments between the token at `position` and the one before it.
+        start = bisect_left(self.positions, position)
+        stop = bisect_right(self.positions, position)
+        return self.comments[start:stop]
+
+    def splice(
+        self,
+        start: int,
+        stop: int,
+        other: "Trivia",
+        position: int,
+        tokens: int,
+        shift: int,
+    ) -> "Trivia":
+        # As `TokenBuffer.splice`, where `other` follows `position` tokens and
+        # the comments from `stop` on follow `tokens` more tokens than before.
+        return Trivia(
+            self.comments.splice(start, stop, other.comments, shift),
+            SplicedArray.of(self.positions).splice(
+                start, stop, SplicedArray.of(other.positions, position), tokens
+            ),
+        )
 
 
 @dataclass
 class LexResult[T]:
     stream: Stream[T]
     errors: list[ParseResult.Error[LexError]]
+    names: Interner = field(default_factory=Interner, compare=False, repr=False)
+    # The comments of `stream`, when they were kept out of it.
+    trivia: Trivia = field(default_factory=Trivia, repr=False)
 
 
 just = Just[str, LexError]
@@ -40,9 +155,9 @@ filt = Filter[str, LexError]
 one_of = OneOf[str, LexError]
 eof = Nothing[str, LexError]()
 
-bin = one_of("01")
-dec = one_of("0123456789")
-hex = one_of("0123456789abcdefABCDEF")
+bin = take_while1(char_class("01"))
+dec = take_while1(char_class("0123456789"))
+hex = take_while1(char_class("0123456789abcdefABCDEF"))
 
 
 def padded(
@@ -51,6 +166,8 @@ def padded(
     return padder.or_not().ignore_then(parser).then_ignore(padder.or_not())
 
 
+# Digits are consumed in runs, with at most one underscore on either side of
+# each run, and the runs are joined by `integer_mapper`.
 def integer_digits(
     digs: Parser[str, str, LexError]
 ) -> Parser[str, list[str], LexError]:
@@ -69,9 +186,11 @@ bin_integer = (
     .map(integer_mapper(2))
 )
 
-dec_integer = (
-    dec.and_check(lambda char: char != "0").chain((padded(just("_"), dec).repeated()))
-).map(integer_mapper(10))
+# The first digit stands alone, so that an underscore after it must be
+# followed by more digits.
+dec_integer = (one_of("123456789").chain(padded(just("_"), dec).repeated())).map(
+    integer_mapper(10)
+)
 
 hex_integer = (
     startswith("0x")
@@ -88,66 +207,34 @@ integer = (
     | just("0").map(lambda char: IntegerLiteral(int(char, base=10)))
 )
 
+keywords: t.Final = {keyword.value: keyword for keyword in Keyword}
+
+
+def classify(word: str) -> Keyword | Identifier:
+    keyword = keywords.get(word)
+    return Identifier(word) if keyword is None else keyword
+
+
+# Words are scanned once and looked up among the keywords, so `identifier`
+# also produces keywords.
 identifier = (
     filt(lambda char: char.isalpha() or char == "_")
-    .chain(filt(lambda char: char.isalnum() or char == "_").repeated())
-    .map(lambda chars: "".join(chars))
-).map(Identifier)
-
-keyword = identifier.and_check(lambda ident: ident.identifier in Keyword).map(
-    lambda ident: Keyword(ident.identifier)
+    .then(take_while(lambda char: char.isalnum() or char == "_"))
+    .map(lambda first_rest: classify(first_rest[0] + first_rest[1]))
 )
 
-basic = choice(
-    (
-        just("+").ignore_then(just("=").to(Basic.PlusEqual).or_else(Basic.Plus)),
-        just("-").ignore_then(
-            (just(">").to(Basic.RightArrow) | just("=").to(Basic.HyphenEqual)).or_else(
-                Basic.Hyphen
-            )
-        ),
-        just("*").ignore_then(
-            just("=").to(Basic.AsteriskEqual).or_else(Basic.Asterisk)
-        ),
-        just("/").ignore_then(
-            just("=").to(Basic.ForwardSlashEqual).or_else(Basic.ForwardSlash)
-        ),
-        just("^").to(Basic.Caret),
-        just("%").to(Basic.Percent),
-        just("@").to(Basic.At),
-        just("&").ignore_then(just("&").to(Basic.Ampersand2).or_else(Basic.Ampersand)),
-        just("!").ignore_then(just("=").to(Basic.BangEqual).or_else(Basic.Bang)),
-        just("~").to(Basic.Tilde),
-        just(":").ignore_then(just(":").to(Basic.Colon2).or_else(Basic.Colon)),
-        just("=").ignore_then(just("=").to(Basic.Equal2).or_else(Basic.Equal)),
-        just("{").to(Basic.LeftBrace),
-        just("}").to(Basic.RightBrace),
-        just("(").to(Basic.LeftParenthesis),
-        just(")").to(Basic.RightParenthesis),
-        just("<").ignore_then(
-            (
-                just("<").to(Basic.LeftAngle2) | just("=").to(Basic.LeftAngleEqual)
-            ).or_else(Basic.LeftAngle)
-        ),
-        just(">").ignore_then(
-            (
-                just(">").to(Basic.RightAngle2) | just("=").to(Basic.RightAngleEqual)
-            ).or_else(Basic.RightAngle)
-        ),
-        just("[").to(Basic.LeftBracket),
-        just("]").to(Basic.RightBracket),
-        just(",").to(Basic.Comma),
-        just(".").to(Basic.Period),
-        just("|").ignore_then(just("|").to(Basic.Pipe2).or_else(Basic.Pipe)),
-        just("\n").to(Basic.NewLine),
-    )
-)
+# Operators are matched by maximal munch over their spellings.
+operators = {text: basic for basic, text in basic_text.items()} | {"\n": Basic.NewLine}
+
+basic = Trie[Basic, LexError](operators)
+# The lengths of the spellings, longest first, for maximal munch outside of
+# `basic`.
+operator_widths = sorted({len(text) for text in operators}, reverse=True)
 
 string = (
     just('"')
-    .ignore_then(filt(lambda char: char not in {"\n", '"'}).repeated())
+    .ignore_then(take_while(lambda char: char not in {"\n", '"'}))
     .then_ignore(just('"').require(LexError.UnterminatedStringLiteral))
-    .map(lambda chars: "".join(chars))
 ).map(StringLiteral)
 
 character = (
@@ -156,19 +243,13 @@ character = (
     .then_ignore(just("'").require(LexError.UnterminatedCharacterLiteral))
 ).map(CharacterLiteral)
 
-whitespace = just(" ").then(filt(str.isspace).repeated()).map(lambda _: Whitespace)
+whitespace = just(" ").then(take_while(str.isspace)).map(lambda _: Whitespace)
 
-comment = (
-    just("#")
-    .ignore_then(filt(lambda char: char != "\n").repeated())
-    .map(lambda chars: "".join(chars))
-).map(Comment)
+comment = (just("#").ignore_then(take_while(lambda char: char != "\n"))).map(Comment)
 
 strip = whitespace.repeated().or_not()
 
-# TODO: Update identifier / keyword parsers so that this isn't
-# position dependent.
-token = keyword | identifier | basic | string | character | integer
+token = identifier | basic | string | character | integer
 
 tokenizer = (
     strip.ignore_then((token | comment).spanned())
@@ -177,56 +258,794 @@ tokenizer = (
     .require(LexError.UnexpectedCharacter)
 )
 
+check(tokenizer, "lex.tokenizer")
+compiled_tokenizer = compile_parser(optimize(tokenizer))
 
-def tokenize_with_comments(
-    source: str,
+
+class Engine(Enum):
+    # `Combinator` runs `tokenizer`. `Regex` runs the same token definitions as
+    # one regular expression over the text of each line, and produces the same
+    # tokens and errors. The character classes of identifiers and whitespace
+    # are only spelled out for ASCII, so other lines go through `tokenizer`.
+    # `Vector` classifies every character of the source at once with NumPy to
+    # find where tokens may start, so that Python runs once per token rather
+    # than once per character. Literals and comments, which take more than
+    # their first character to tell apart, are matched as `Regex` does.
+    Combinator = auto()
+    Regex = auto()
+    Vector = auto()
+
+
+@dataclass
+class Parallel:
+    # Lexes sources of at least `threshold` characters across `workers`
+    # processes, one per CPU by default, in chunks of whole lines of about
+    # `chunk` characters each. Below `threshold`, starting the processes costs
+    # more than it saves.
+    workers: int | None = None
+    threshold: int = 1 << 20
+    chunk: int = 1 << 18
+
+
+# The items of every lexed buffer, in a fixed order, so that buffers lexed
+# apart can be joined by copying.
+vocabulary = (
+    *Keyword,
+    *Basic,
+    Identifier,
+    IntegerLiteral,
+    StringLiteral,
+    CharacterLiteral,
+    Comment,
+)
+
+
+# PEG repetitions and ordered choices never give back what they matched, which
+# possessive quantifiers and atomic groups reproduce.
+spaces = re.escape("".join(char for char in map(chr, range(128)) if char.isspace()))
+operator_pattern = "|".join(
+    re.escape(text) for text in sorted(operators, key=len, reverse=True)
+)
+
+token_pattern = re.compile(
+    rf"""
+    (?:\ [{spaces}]*+)?+
+    (?:
+        (?P<identifier>[A-Za-z_][A-Za-z0-9_]*+)
+      | (?P<basic>{operator_pattern})
+      | (?P<string>"(?P<string_body>[^"\n]*+)(?P<string_end>")?)
+      | (?P<character>'(?P<character_body>[^'])(?P<character_end>')?)
+      | (?P<bin_integer>0b(?P<bin_digits>(?>_?+[01]++_?+)*+))
+      | (?P<dec_integer>[1-9](?>_?+[0-9]++_?+)*+)
+      | (?P<hex_integer>0x(?P<hex_digits>(?>_?+[0-9a-fA-F]++_?+)*+))
+      | (?P<zero>0)
+      | (?P<comment>\#(?P<comment_body>[^\n]*+))
+    )
+    """,
+    re.VERBOSE,
+)
+
+
+class CharKind(IntEnum):
+    # What a character can start, for `Engine.Vector`. Blanks and other
+    # spaces make up runs of whitespace, and letters and digits runs of word
+    # characters. Every other character starts a run of its own.
+    Blank = auto()
+    Space = auto()
+    NewLine = auto()
+    Letter = auto()
+    Digit = auto()
+    Operator = auto()
+    Other = auto()
+    # Any character outside of ASCII, whose line goes through `tokenizer`.
+    Wide = auto()
+
+
+def char_kind(char: str) -> CharKind:
+    if char == " ":
+        return CharKind.Blank
+    if char == "\n":
+        return CharKind.NewLine
+    if char.isspace():
+        return CharKind.Space
+    if char.isalpha() or char == "_":
+        return CharKind.Letter
+    if char.isdigit():
+        return CharKind.Digit
+    if char in operators:
+        return CharKind.Operator
+    return CharKind.Other
+
+
+# Indexed by code point, with every code point from 128 on clamped to 128.
+char_kinds = [*map(char_kind, map(chr, range(128))), CharKind.Wide]
+# The run each kind continues. Kinds not listed make runs of their own.
+kind_runs = {
+    CharKind.Blank: 1,
+    CharKind.Space: 1,
+    CharKind.Letter: 2,
+    CharKind.Digit: 2,
+}
+
+
+def match_line(
+    line: str,
+    span_base: int,
+    tokens: TokenBuffer[Token | Comment],
+    names: Interner,
+    trivia: Trivia | None = None,
+) -> ParseResult.Error[LexError] | None:
+    # `tokenizer` over `line`, with its terminating newline, as a regular
+    # expression, appending to `tokens`, or comments to `trivia` if given. On
+    # an error, whatever was appended is left for the caller to truncate.
+    text = f"{line}\n"
+    position = 0
+    match = token_pattern.match
+
+    while (found := match(text, position)) is not None:
+        position = found.end()
+        if (error := match_token(found, span_base, tokens, names, trivia)) is not None:
+            return error
+
+    if position != len(text):
+        # As `tokenizer`, which requires the end of the line from its start.
+        return PR.Error(
+            LexError.UnexpectedCharacter,
+            Span(span_base + len(line), span_base + len(text)),
+        )
+    return None
+
+
+def match_token(
+    found: re.Match[str],
+    span_base: int,
+    tokens: TokenBuffer[Token | Comment],
+    names: Interner,
+    trivia: Trivia | None = None,
+) -> ParseResult.Error[LexError] | None:
+    # Appends the token `token_pattern` found, or returns its error.
+    # Every alternative of `token_pattern` is a named group.
+    kind = found.lastgroup
+    assert kind is not None
+    start = found.start(kind)
+    position = found.end()
+
+    item: Token | Comment
+    match kind:
+        case "identifier":
+            word = found[kind]
+            keyword = keywords.get(word)
+            item = names.identifier(word) if keyword is None else keyword
+        case "basic":
+            item = operators[found[kind]]
+        case "string":
+            if found["string_end"] is None:
+                return PR.Error(
+                    LexError.UnterminatedStringLiteral,
+                    Span(span_base + position - 1, span_base + position),
+                )
+            item = names.string(found["string_body"])
+        case "character":
+            if found["character_end"] is None:
+                return PR.Error(
+                    LexError.UnterminatedCharacterLiteral,
+                    Span(span_base + start + 1, span_base + start + 2),
+                )
+            item = CharacterLiteral(found["character_body"])
+        case "bin_integer":
+            if not found["bin_digits"]:
+                return PR.Error(
+                    LexError.MalformedBinaryIntegerLiteral,
+                    Span(span_base + start + 1, span_base + start + 2),
+                )
+            item = IntegerLiteral(
+                int(found["bin_digits"].replace("_", ""), base=2), base=2
+            )
+        case "dec_integer":
+            item = IntegerLiteral(int(found[kind].replace("_", ""), base=10))
+        case "hex_integer":
+            if not found["hex_digits"]:
+                return PR.Error(
+                    LexError.MalformedHexadecimalIntegerLiteral,
+                    Span(span_base + start + 1, span_base + start + 2),
+                )
+            item = IntegerLiteral(
+                int(found["hex_digits"].replace("_", ""), base=16), base=16
+            )
+        case "zero":
+            item = IntegerLiteral(0)
+        case _:
+            item = Comment(found["comment_body"])
+            if trivia is not None:
+                trivia.add(item, len(tokens), span_base + start, span_base + position)
+                return None
+
+    tokens.append(item, span_base + start, span_base + position)
+    return None
+
+
+def lex_line(
+    line: str,
+    span_base: int,
+    tokens: TokenBuffer[Token | Comment],
+    names: Interner,
     file_handle: os.PathLike[str] | None = None,
-) -> LexResult[Token | Comment]:
-    tokens = list[Spanned[Token | Comment]]()
+    engine: Engine = Engine.Combinator,
+    trivia: Trivia | None = None,
+) -> ParseResult.Error[LexError] | None:
+    # Appends the tokens of `line` to `tokens`, and its comments to `trivia`
+    # if given, or appends nothing and returns the error that stopped it.
+    if engine is not Engine.Combinator and line.isascii():
+        length = len(tokens)
+        comments = 0 if trivia is None else len(trivia)
+        if (error := match_line(line, span_base, tokens, names, trivia)) is not None:
+            tokens.truncate(length)
+            if trivia is not None:
+                trivia.truncate(comments)
+        return error
+
+    match compiled_tokenizer.parse(
+        Stream.from_text(f"{line}\n", file_handle, span_base)
+    ):
+        case PR.Match(toks, rem):
+            for spanned in toks:
+                item = names.intern(spanned.item)
+                if trivia is not None and isinstance(item, Comment):
+                    trivia.add(item, len(tokens), spanned.span.start, spanned.span.end)
+                else:
+                    tokens.append(item, spanned.span.start, spanned.span.end)
+            # TODO: Don't assert.
+            assert rem.position == (
+                len(line) + 1
+            ), "Top level `require` should prevent stream from being incompletely consumed."
+            return None
+        case PR.NoMatch:
+            # TODO: Don't assert.
+            assert (
+                False
+            ), "Top level `require` should prevent this from being reachable."
+        case PR.Error() as error:
+            return error
+
+
+def scan_lines(
+    lines: t.Sequence[str],
+    span_base: int,
+    tokens: TokenBuffer[Token | Comment],
+    names: Interner,
+    file_handle: os.PathLike[str] | None = None,
+    trivia: Trivia | None = None,
+) -> list[ParseResult.Error[LexError]]:
+    # `lex_line` over each of `lines` with `Engine.Vector`, which needs NumPy.
+    # The runs of characters tokens may start at are found over all the lines
+    # at once: words, whitespace, and single characters of any other kind.
+    # Most lines hold only words, decimal numbers, operators, and single
+    # blanks between them, and their tokens are found over all of them at
+    # once and appended to `tokens` in bulk, boxing only identifiers and
+    # numbers. The other lines are scanned a token at a time: a word that
+    # starts with a letter is an identifier or keyword, and an operator is
+    # found from its first two characters. Other tokens are matched with
+    # `token_pattern`, from which scanning goes on at the next run.
+    assert np is not None
     errors = list[ParseResult.Error[LexError]]()
-    span_base = 0
+    if not lines:
+        return errors
 
-    for line in source.splitlines():
-        match tokenizer.parse(Stream.from_source(f"{line}\n", file_handle, span_base)):
-            case PR.Match(toks, rem):
-                tokens.extend(toks)
-                # TODO: Don't assert.
-                assert rem.position == (
-                    len(line) + 1
-                ), "Top level `require` should prevent stream from being incompletely consumed."
-            case PR.NoMatch:
-                # TODO: Don't assert.
-                assert (
-                    False
-                ), "Top level `require` should prevent this from being reachable."
-            case PR.Error() as error:
-                errors.append(error)
+    text = "\n".join(lines) + "\n"
+    narrow = text.isascii()
+    if narrow:
+        codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(
+            text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        codes = np.minimum(codes, 128)
+    kinds = np.array(char_kinds, dtype=np.uint8)[codes]
+    runs = np.zeros(max(CharKind) + 1, dtype=np.uint8)
+    for kind, run in kind_runs.items():
+        runs[kind] = run
+    runs = runs[kinds]
+    starts_at = np.ones(len(kinds), dtype=np.bool_)
+    starts_at[1:] = (runs[1:] != runs[:-1]) | (runs[1:] == 0)
+    run_starts = np.flatnonzero(starts_at)
+    run_kinds = kinds[run_starts]
+    breaks = np.flatnonzero(run_kinds == CharKind.NewLine)
 
+    # Lines with characters outside of ASCII go through `tokenizer`.
+    wide = set[int]()
+    if not narrow:
+        wide.update(
+            np.searchsorted(
+                run_starts[breaks], np.flatnonzero(kinds == CharKind.Wide)
+            ).tolist()
+        )
+
+    # The code of the operator each run starts, and whether it is two
+    # characters long, taking the run after it along. Any longer operator
+    # is left to the scan.
+    singles = np.full(129, -1, dtype=np.int32)
+    pairs = np.full((129, 129), -1, dtype=np.int32)
+    longer = np.zeros((129, 129), dtype=np.bool_)
+    for spelling, member in operators.items():
+        if len(spelling) == 1:
+            singles[ord(spelling)] = tokens.code(member)
+        elif len(spelling) == 2:
+            pairs[ord(spelling[0]), ord(spelling[1])] = tokens.code(member)
+        else:
+            longer[ord(spelling[0]), ord(spelling[1])] = True
+    firsts = codes[run_starts]
+    seconds = codes[np.minimum(run_starts + 1, len(codes) - 1)]
+    symbols = run_kinds == CharKind.Operator
+    paired = symbols & (pairs[firsts, seconds] >= 0)
+    operator_codes = np.where(paired, pairs[firsts, seconds], singles[firsts])
+
+    # Runs of digits that are a decimal number by themselves.
+    words = run_kinds == CharKind.Letter
+    numbers = run_kinds == CharKind.Digit
+    run_ends = np.append(run_starts[1:], len(text))
+    letters = np.zeros(len(text) + 1, dtype=np.int64)
+    np.cumsum(kinds == CharKind.Letter, out=letters[1:])
+    plain = (letters[run_ends] == letters[run_starts]) & (
+        (firsts != ord("0")) | (run_ends - run_starts == 1)
+    )
+
+    # Lines with any other run are scanned a token at a time, such as
+    # whitespace that does not start with a blank or takes a newline, and
+    # operators that may overlap, which maximal munch settles from the left.
+    following = np.append(run_kinds[1:], CharKind.NewLine)
+    slow = (
+        (run_kinds == CharKind.Other)
+        | (run_kinds == CharKind.Wide)
+        | (run_kinds == CharKind.Space)
+        | ((run_kinds == CharKind.Blank) & (following == CharKind.NewLine))
+        | (numbers & ~plain)
+        | (paired & np.append(paired[1:], False))
+        | (symbols & longer[firsts, seconds])
+    )
+    scanned = sorted(wide.union(np.searchsorted(breaks, np.flatnonzero(slow)).tolist()))
+
+    consumed = np.zeros(len(run_kinds), dtype=np.bool_)
+    consumed[1:] = paired[:-1]
+    new_lines = run_kinds == CharKind.NewLine
+    token_runs = np.flatnonzero(words | numbers | (symbols & ~consumed) | new_lines)
+    token_starts = run_starts[token_runs]
+    token_ends = np.where(words | numbers, run_ends, run_starts + 1 + paired)[
+        token_runs
+    ]
+    token_kinds = np.select(
+        [words, numbers, new_lines],
+        [
+            tokens.code(Identifier),
+            tokens.code(IntegerLiteral),
+            tokens.code(Basic.NewLine),
+        ],
+        operator_codes,
+    )[token_runs]
+    # The tokens of the lines before each line, and which tokens are words
+    # and numbers.
+    line_tokens = np.zeros(len(breaks) + 1, dtype=np.int64)
+    line_tokens[1:] = np.searchsorted(token_runs, breaks, side="right")
+    spelled = np.flatnonzero(words[token_runs])
+    valued = np.flatnonzero(numbers[token_runs])
+    keyword_codes = {
+        spelling: tokens.code(member) for spelling, member in keywords.items()
+    }
+
+    def spellings(at: t.Any) -> list[str]:
+        return [
+            text[start:end]
+            for start, end in zip(token_starts[at].tolist(), token_ends[at].tolist())
+        ]
+
+    def append(first: int, stop: int):
+        # Appends the tokens of lines `first` up to `stop` in bulk. Keywords
+        # are told from identifiers and the payloads put in order of their
+        # tokens over all of the tokens at once.
+        assert np is not None
+        low, high = int(line_tokens[first]), int(line_tokens[stop])
+        if low == high:
+            return
+        coded = token_kinds[low:high].astype(tokens.kinds.typecode)
+        word_at = spelled[spelled.searchsorted(low) : spelled.searchsorted(high)]
+        number_at = valued[valued.searchsorted(low) : valued.searchsorted(high)]
+        spelling = spellings(word_at)
+        found = np.fromiter(
+            map(keyword_codes.get, spelling, repeat(-1)), np.int32, len(spelling)
+        )
+        named = found < 0
+        coded[word_at[~named] - low] = found[~named]
+
+        boxes = np.empty(high - low, dtype=object)
+        boxes[word_at[named] - low] = list(
+            map(names.identifier, compress(spelling, named.tolist()))
+        )
+        boxes[number_at - low] = [
+            IntegerLiteral(int(digits)) for digits in spellings(number_at)
+        ]
+        carried = np.zeros(high - low, dtype=np.bool_)
+        carried[word_at[named] - low] = True
+        carried[number_at - low] = True
+        slots = np.cumsum(carried) - carried + len(tokens.payloads)
+        tokens.extend_raw(
+            coded.tobytes(),
+            (token_starts[low:high] + span_base)
+            .astype(tokens.starts.typecode)
+            .tobytes(),
+            (token_ends[low:high] + span_base).astype(tokens.ends.typecode).tobytes(),
+            slots.astype(tokens.slots.typecode).tobytes(),
+            boxes[carried].tolist(),
+        )
+
+    starts: list[int] = run_starts.tolist()
+    kinds_of = run_kinds.tobytes()
+    match = token_pattern.match
+    blank, new_line, letter, operator = (
+        CharKind.Blank,
+        CharKind.NewLine,
+        CharKind.Letter,
+        CharKind.Operator,
+    )
+    bulk = 0
+
+    for number in scanned:
+        append(bulk, number)
+        bulk = number + 1
+        # The line runs from `line_start` up to `stop`, after its newline, and
+        # its runs from `first` to `last`, the newline's.
+        first = 0 if number == 0 else int(breaks[number - 1]) + 1
+        last = int(breaks[number])
+        line_start = 0 if number == 0 else starts[first - 1] + 1
+        stop = starts[last] + 1
+        error: ParseResult.Error[LexError] | None = None
+        if number in wide:
+            error = lex_line(
+                lines[number],
+                span_base + line_start,
+                tokens,
+                names,
+                file_handle,
+                Engine.Combinator,
+                trivia,
+            )
+        else:
+            length = len(tokens)
+            comments = 0 if trivia is None else len(trivia)
+            position = line_start
+            index = first
+
+            while position < stop:
+                if starts[index] < position:
+                    index = bisect_left(starts, position, index, last + 1)
+                kind = kinds_of[index] if starts[index] == position else None
+
+                if kind == letter:
+                    index += 1
+                    word = text[position : starts[index]]
+                    keyword = keywords.get(word)
+                    tokens.append(
+                        names.identifier(word) if keyword is None else keyword,
+                        span_base + position,
+                        span_base + starts[index],
+                    )
+                    position = starts[index]
+                elif kind == blank:
+                    index += 1
+                    if index == last:
+                        # Whitespace would take the newline, and no token
+                        # would follow it.
+                        error = PR.Error(
+                            LexError.UnexpectedCharacter,
+                            Span(span_base + stop - 1, span_base + stop),
+                        )
+                        break
+                    position = starts[index]
+                elif kind == operator:
+                    for width in operator_widths:
+                        basic = operators.get(text[position : position + width])
+                        if basic is not None:
+                            break
+                    else:
+                        # The character itself is one of `operators`.
+                        raise AssertionError(text[position])
+                    tokens.append(
+                        basic, span_base + position, span_base + position + width
+                    )
+                    position += width
+                    # Every character of an operator is one itself, and so
+                    # starts a run of its own.
+                    index += width
+                elif kind == new_line:
+                    tokens.append(Basic.NewLine, span_base + position, span_base + stop)
+                    position = stop
+                else:
+                    found = match(text, position, stop)
+                    if found is None:
+                        error = PR.Error(
+                            LexError.UnexpectedCharacter,
+                            Span(span_base + stop - 1, span_base + stop),
+                        )
+                        break
+                    position = found.end()
+                    error = match_token(found, span_base, tokens, names, trivia)
+                    if error is not None:
+                        break
+
+            if error is not None:
+                tokens.truncate(length)
+                if trivia is not None:
+                    trivia.truncate(comments)
+
+        if error is not None:
+            errors.append(error)
+
+    append(bulk, len(lines))
+    return errors
+
+
+def lex_lines(
+    lines: t.Sequence[str],
+    span_base: int,
+    file_handle: os.PathLike[str] | None = None,
+    engine: Engine = Engine.Combinator,
+    comments: bool = True,
+    names: Interner | None = None,
+) -> tuple[TokenBuffer[Token | Comment], list[ParseResult.Error[LexError]], Trivia]:
+    # The tokens, errors and trivia of `lines`, the first of which starts at
+    # `span_base`. Comments are kept among the tokens if `comments` is set,
+    # and in the trivia otherwise.
+    tokens = TokenBuffer[Token | Comment](vocabulary)
+    errors = list[ParseResult.Error[LexError]]()
+    trivia = Trivia()
+    if names is None:
+        names = Interner()
+
+    if engine is Engine.Vector and np is not None:
+        errors = scan_lines(
+            lines, span_base, tokens, names, file_handle, None if comments else trivia
+        )
+        return tokens, errors, trivia
+
+    for line in lines:
+        if (
+            error := lex_line(
+                line,
+                span_base,
+                tokens,
+                names,
+                file_handle,
+                engine,
+                None if comments else trivia,
+            )
+        ) is not None:
+            errors.append(error)
         span_base += len(line) + 1
 
+    return tokens, errors, trivia
+
+
+def lex_source(
+    source: str,
+    file_handle: os.PathLike[str] | None = None,
+    engine: Engine = Engine.Combinator,
+    parallel: Parallel | None = None,
+    comments: bool = True,
+    names: Interner | None = None,
+) -> tuple[TokenBuffer[Token | Comment], list[ParseResult.Error[LexError]], Trivia]:
+    lines = source.splitlines()
+    if names is None:
+        names = Interner()
+    if parallel is None or len(source) < parallel.threshold:
+        return lex_lines(lines, 0, file_handle, engine, comments, names)
+
+    # Lines are lexed independently, so chunks of them can be lexed in any
+    # order and joined in the order of their lines. Each process interns its
+    # own tokens, which are interned again here.
+    chunks = list[t.Sequence[str]]()
+    bases = list[int]()
+    start = span_base = size = 0
+    for index, line in enumerate(lines):
+        size += len(line) + 1
+        if size >= parallel.chunk:
+            chunks.append(lines[start : index + 1])
+            bases.append(span_base)
+            start = index + 1
+            span_base += size
+            size = 0
+    if start < len(lines):
+        chunks.append(lines[start:])
+        bases.append(span_base)
+
+    tokens = TokenBuffer[Token | Comment](vocabulary)
+    errors = list[ParseResult.Error[LexError]]()
+    trivia = Trivia()
+    with ProcessPoolExecutor(parallel.workers) as pool:
+        for chunk_tokens, chunk_errors, chunk_trivia in pool.map(
+            lex_lines,
+            chunks,
+            bases,
+            repeat(file_handle),
+            repeat(engine),
+            repeat(comments),
+        ):
+            chunk_tokens.payloads = list(map(names.intern, chunk_tokens.payloads))
+            trivia.join(chunk_trivia, len(tokens))
+            tokens.join(chunk_tokens)
+            errors.extend(chunk_errors)
+    return tokens, errors, trivia
+
+
+def tokenize_with_comments(
+    source: str,
+    file_handle: os.PathLike[str] | None = None,
+    engine: Engine = Engine.Combinator,
+    parallel: Parallel | None = None,
+) -> LexResult[Token | Comment]:
+    names = Interner()
+    tokens, errors, _ = lex_source(source, file_handle, engine, parallel, names=names)
     return LexResult(
         stream=Stream(file_handle=file_handle, spans=tokens),
         errors=errors,
+        names=names,
     )
 
 
+@dataclass
+class Edit:
+    # Replaces the characters from `start` up to `end` with `text`. Offsets are
+    # those of spans, which are the source's own as long as each of its line
+    # breaks is a single character.
+    start: int
+    end: int
+    text: str
+
+    def apply(self, source: str) -> str:
+        return source[: self.start] + self.text + source[self.end :]
+
+
+# The characters `str.splitlines` breaks lines at.
+line_breaks = frozenset("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+
+def relex[
+    T: (Token, Token | Comment)
+](
+    source: str,
+    previous: LexResult[T],
+    edit: Edit,
+    file_handle: os.PathLike[str] | None = None,
+    engine: Engine = Engine.Combinator,
+    comments: bool = True,
+) -> LexResult[T]:
+    # The result of lexing `edit.apply(source)`, given `previous`, the result
+    # of lexing `source`. Only the lines the edit touches are lexed again; the
+    # tokens and errors of the others are reused, moved along by the change
+    # in length, and so are its interned names. The tokens and comments of
+    # the other lines are shared with `previous` rather than copied, and
+    # `previous` may not change afterwards. `comments` is whether `previous`
+    # kept comments among its tokens, as `tokenize_with_comments` does, or in
+    # its trivia, as `tokenize` does.
+    line_start = edit.start
+    while line_start > 0 and source[line_start - 1] not in line_breaks:
+        line_start -= 1
+    line_end = edit.end
+    while line_end < len(source) and source[line_end] not in line_breaks:
+        line_end += 1
+
+    region = source[line_start : edit.start] + edit.text + source[edit.end : line_end]
+    # The last line of the source ends without a break, and other lines end
+    # with the one at `line_end`.
+    at_end = line_end == len(source)
+    lines = region.splitlines() if at_end else f"{region}\n".splitlines()
+    relexed, relexed_errors, relexed_trivia = lex_lines(
+        lines, line_start, file_handle, engine, comments, previous.names
+    )
+
+    spans = previous.stream.spans
+    if not isinstance(spans, TokenBuffer):
+        spans = TokenBuffer[T](vocabulary)
+        spans.extend(previous.stream.spans)
+
+    # Tokens of the old lines start from `line_start`, up to the break at
+    # `line_end` that the last of them ends with.
+    first = spans.bisect(line_start)
+    last = len(spans) if at_end else spans.bisect(line_end, after=True)
+    shift = len(edit.text) - (edit.end - edit.start)
+
+    # Comments of the old lines are found as their tokens are. Those after
+    # them follow as many more tokens as the lines gained.
+    trivia = previous.trivia
+    comments_first = trivia.comments.bisect(line_start)
+    comments_last = (
+        len(trivia) if at_end else trivia.comments.bisect(line_end, after=True)
+    )
+
+    errors = [error for error in previous.errors if error.span.start < line_start]
+    errors.extend(relexed_errors)
+    errors.extend(
+        PR.Error(error.value, Span(error.span.start + shift, error.span.end + shift))
+        for error in previous.errors
+        if error.span.start > line_end
+    )
+
+    return LexResult(
+        stream=Stream(
+            file_handle=file_handle,
+            spans=spans.splice(first, last, t.cast(TokenBuffer[T], relexed), shift),
+        ),
+        errors=errors,
+        names=previous.names,
+        trivia=trivia.splice(
+            comments_first,
+            comments_last,
+            relexed_trivia,
+            first,
+            len(relexed) - (last - first),
+            shift,
+        ),
+    )
+
+
+def iter_tokens(
+    source: str,
+    file_handle: os.PathLike[str] | None = None,
+    engine: Engine = Engine.Combinator,
+    errors: list[ParseResult.Error[LexError]] | None = None,
+    names: Interner | None = None,
+) -> t.Iterator[Spanned[Token]]:
+    # The tokens of `tokenize`, lexed a line at a time as they are consumed,
+    # so that only one line's tokens are held. Errors are appended to `errors`
+    # as the lines holding them are reached.
+    tokens = TokenBuffer[Token | Comment](vocabulary)
+    trivia = Trivia()
+    span_base = 0
+    if names is None:
+        names = Interner()
+
+    for line in source.splitlines():
+        error = lex_line(line, span_base, tokens, names, file_handle, engine, trivia)
+        if error is not None and errors is not None:
+            errors.append(error)
+        for item, start, end in zip(tokens.items(), tokens.starts, tokens.ends):
+            yield Spanned(t.cast(Token, item), Span(start, end))
+        tokens.truncate(0)
+        trivia.truncate(0)
+        span_base += len(line) + 1
+
+
 def tokenize(
-    source: str, file_handle: os.PathLike[str] | None = None
+    source: str,
+    file_handle: os.PathLike[str] | None = None,
+    engine: Engine = Engine.Combinator,
+    parallel: Parallel | None = None,
 ) -> LexResult[Token]:
-    with_comments = tokenize_with_comments(source, file_handle)
+    # Comments are lexed into the trivia, so the stream is the parser's as
+    # lexed, with no pass to drop them.
+    names = Interner()
+    tokens, errors, trivia = lex_source(
+        source, file_handle, engine, parallel, comments=False, names=names
+    )
     return LexResult(
-        stream=filter_comments(with_comments.stream), errors=with_comments.errors
+        stream=Stream(
+            file_handle=file_handle, spans=t.cast(TokenBuffer[Token], tokens)
+        ),
+        errors=errors,
+        names=names,
+        trivia=trivia,
     )
 
 
+def is_token(item: Token | Comment) -> t.TypeGuard[Token]:
+    return not isinstance(item, Comment)
+
+
 def filter_comments(with_comments: Stream[Token | Comment]) -> Stream[Token]:
-    def is_token(
-        spanned: Spanned[Token | Comment],
-    ) -> t.TypeGuard[Spanned[Token]]:
-        return not isinstance(spanned.item, Comment)
+    spans = with_comments.spans
+    if not isinstance(spans, TokenBuffer):
+        spans = TokenBuffer[Token | Comment](vocabulary)
+        spans.extend(with_comments.spans)
 
     return Stream(
         file_handle=with_comments.file_handle,
-        spans=list(filter(is_token, with_comments.spans)),
+        spans=t.cast(TokenBuffer[Token], spans.select(is_token)),
         position=with_comments.position,
     )
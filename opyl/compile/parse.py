@@ -1,33 +1,32 @@
 import typing as t
+import os
 
 from opyl.compile import ast
 from opyl.compile.token import Token, Keyword, Basic, Identifier
-from opyl.compile.error import ParseError
+from opyl.compile.error import ParseError, BudgetExhausted, farthest_error
 from opyl.compile.pratt import expr
-from opyl.support.stream import Stream
-from opyl.support.combinator import Parser, ParseResult, Nothing, OneOf, choice
+from opyl.support.stream import Stream, Window
+from opyl.support.span import Spanned
+from opyl.support.combinator import (
+    Parser,
+    ParseResult,
+    Budget,
+    Failure,
+    Trace,
+    PR,
+    Recursive,
+    Nothing,
+    OneOf,
+    choice,
+    recursive,
+    optimize,
+)
+from opyl.support.compiler import compile_parser
+from opyl.support.analysis import check
 from opyl.support.union import Maybe
 from opyl.support.atoms import just, ident, newlines
 
 
-class Statement(Parser[Token, ast.Statement, ParseError]):
-    @t.override
-    def parse(
-        self, input: Stream[Token]
-    ) -> ParseResult.Type[Token, ast.Statement, ParseError]:
-        return (
-            assign_stmt
-            | return_stmt
-            | if_stmt
-            | for_loop
-            | while_loop
-            | when_stmt
-            | let_decl
-            | const_decl
-            | expr
-        ).parse(input)
-
-
 def block[
     T
 ](these: Parser[Token, T, ParseError], label: str = "block") -> Parser[
@@ -38,7 +37,7 @@ def block[
             just(Basic.LeftBrace),
             just(Basic.RightBrace).require(ParseError(expected="}", following=label)),
         )
-    )
+    ).memoized()
 
 
 def block_pair[
@@ -102,14 +101,18 @@ builtin_type = choice(
     )
 )
 
-type = ident | builtin_type
+type = (ident | builtin_type).memoized().labelled("type")
 
 
-field = ident.then(
-    just(Basic.Colon).ignore_then(
-        type.require(ParseError(expected="type", following="':'"))
+field = (
+    ident.then(
+        just(Basic.Colon).ignore_then(
+            type.require(ParseError(expected="type", following="':'"))
+        )
     )
-).map(lambda items: ast.Field(*items))
+    .map(lambda items: ast.Field(*items))
+    .labelled("field")
+)
 
 initializer = (
     just(Basic.Equal)
@@ -131,6 +134,7 @@ const_decl = (
             initializer=items[1],
         )
     )
+    .labelled("const_decl")
 )
 
 let_decl = (
@@ -149,6 +153,7 @@ let_decl = (
             initializer=items[1][1],
         )
     )
+    .labelled("let_decl")
 )
 
 # TODO: Error handling: Identifier should not be required if `anon` wasn't
@@ -168,6 +173,7 @@ param_spec = (
             type=items[1],
         )
     )
+    .labelled("param_spec")
 )
 
 param_list = (
@@ -176,6 +182,7 @@ param_list = (
     .allow_trailing()
     .then_ignore(newlines)
     .delimited_by(just(Basic.LeftParenthesis), just(Basic.RightParenthesis))
+    .labelled("param_list")
 )
 
 func_sig = (
@@ -197,9 +204,12 @@ func_sig = (
             return_type=items[1],
         )
     )
+    .labelled("func_sig")
 )
 
-stmt = Statement()
+# Statements nest through blocks, so the rule is declared here and defined once
+# every kind of statement has been built.
+stmt: Recursive[Token, ast.Statement, ParseError] = recursive()
 
 assign_operator = choice(
     (
@@ -211,14 +221,20 @@ assign_operator = choice(
     )
 )
 
-assign_stmt = expr.then(
-    assign_operator.then(
-        expr.require(ParseError(expected="expression", following="assignment operator"))
+assign_stmt = (
+    expr.then(
+        assign_operator.then(
+            expr.require(
+                ParseError(expected="expression", following="assignment operator")
+            )
+        )
     )
-).map(
-    lambda items: ast.AssignStatement(
-        target=items[0], operator=items[1][0], value=items[1][1]
+    .map(
+        lambda items: ast.AssignStatement(
+            target=items[0], operator=items[1][0], value=items[1][1]
+        )
     )
+    .labelled("assign_stmt")
 )
 
 break_stmt = just(Keyword.Break).to(ast.BreakStatement())
@@ -227,14 +243,23 @@ return_stmt = (
     just(Keyword.Return)
     .ignore_then(expr.or_not())
     .map(lambda item: ast.ReturnStatement(expression=item))
+    .labelled("return_stmt")
 )
 
-func_decl = func_sig.then(block(stmt, "function definition")).map(
-    lambda items: ast.FunctionDeclaration(
-        name=items[0].name,
-        signature=items[0],
-        body=items[1],
+# Nothing but a function declaration starts with a function signature outside
+# of a trait, so a declaration that fails to parse past it is missing its body
+# rather than a reason to backtrack.
+func_decl = (
+    func_sig.cut(ParseError(expected="function body", following="function signature"))
+    .then(block(stmt, "function definition"))
+    .map(
+        lambda items: ast.FunctionDeclaration(
+            name=items[0].name,
+            signature=items[0],
+            body=items[1],
+        )
     )
+    .labelled("func_decl")
 )
 
 struct_decl = (
@@ -247,6 +272,7 @@ struct_decl = (
             functions=items[1][1],
         )
     )
+    .labelled("struct_decl")
 )
 
 enum_decl = (
@@ -262,21 +288,27 @@ enum_decl = (
         )
     )
     .map(lambda items: ast.EnumDeclaration(name=items[0], members=items[1]))
+    .labelled("enum_decl")
 )
 
 type_def = (
-    named_decl(Keyword.Type).then(
-        just(Basic.Equal)
-        .require(ParseError(expected="=", following="'type' with identifier"))
-        .ignore_then(type.separated_by(just(Basic.Pipe)).at_least(1))
-        .require(ParseError(expected="type alias", following="'type' keyword"))
+    (
+        named_decl(Keyword.Type).then(
+            just(Basic.Equal)
+            .require(ParseError(expected="=", following="'type' with identifier"))
+            .ignore_then(type.separated_by(just(Basic.Pipe)).at_least(1))
+            .require(ParseError(expected="type alias", following="'type' keyword"))
+        )
     )
-).map(lambda items: ast.TypeDefinition(*items))
+    .map(lambda items: ast.TypeDefinition(*items))
+    .labelled("type_def")
+)
 
 trait_decl = (
     named_decl(Keyword.Trait)
     .then(block(func_sig, "trait definition"))
     .map(lambda items: ast.TraitDeclaration(*items))
+    .labelled("trait_decl")
 )
 
 
@@ -296,6 +328,7 @@ if_stmt = (
             else_statements=items[1],
         )
     )
+    .labelled("if_stmt")
 )
 
 loop_stmt = stmt | break_stmt | continue_stmt
@@ -307,6 +340,7 @@ while_loop = (
     )
     .then(block(loop_stmt))
     .map(lambda items: ast.WhileLoop(*items))
+    .labelled("while_loop")
 )
 
 for_loop = (
@@ -321,6 +355,7 @@ for_loop = (
             target=items[0][0], iterator=items[0][1], statements=items[1]
         )
     )
+    .labelled("for_loop")
 )
 
 is_arm = (
@@ -328,19 +363,40 @@ is_arm = (
     .ignore_then(type.require(ParseError(expected="type", following="'is' keyword")))
     .then(block(stmt, "is arm"))
     .map(lambda items: ast.IsClause(*items))
+    .labelled("is_arm")
 )
 
 # TODO: Parse `else` blocks in when statements.
 when_stmt = (
-    kw_expr(Keyword.When).then(
-        just(Keyword.As)
-        .ignore_then(
-            ident.require(ParseError(expected="identifier", following="'as' keyword"))
+    (
+        kw_expr(Keyword.When).then(
+            just(Keyword.As)
+            .ignore_then(
+                ident.require(
+                    ParseError(expected="identifier", following="'as' keyword")
+                )
+            )
+            .or_not()
+            .then(block(is_arm))
         )
-        .or_not()
-        .then(block(is_arm))
     )
-).map(lambda item: ast.WhenStatement(item[0], item[1][0], item[1][1], []))
+    .map(lambda item: ast.WhenStatement(item[0], item[1][0], item[1][1], []))
+    .labelled("when_stmt")
+)
+
+stmt.define(
+    (
+        assign_stmt
+        | return_stmt
+        | if_stmt
+        | for_loop
+        | while_loop
+        | when_stmt
+        | let_decl
+        | const_decl
+        | expr
+    ).labelled("stmt")
+)
 
 eof = Nothing[Token, ParseError]()
 
@@ -348,15 +404,27 @@ decl = (
     enum_decl | struct_decl | const_decl | let_decl | func_decl | type_def | trait_decl
 )
 
-decls = (
-    lines(decl)
-    .then_ignore(eof)
-    .require(ParseError(expected="end of input", following="declaration"))
-)
+# `parse` reports a file that stops parsing before its end at the farthest
+# point any parser got to, so it runs `decl_lines`, which leaves that case a
+# NoMatch. `decls` reports it where the declarations stopped instead.
+decl_lines = lines(decl).then_ignore(eof)
+decls = decl_lines.require(ParseError(expected="end of input", following="declaration"))
+
+check(decls, "parse.decls")
+compiled_decl_lines = compile_parser(optimize(decl_lines))
+
+
+def budget(
+    steps: int | None = None, seconds: float | None = None
+) -> Budget[ParseError]:
+    return Budget(BudgetExhausted(), steps, seconds)
 
 
 def parse(
     stream: Stream[Token],
+    budget: Budget[ParseError] | None = None,
+    failure: Failure[Token] | None = None,
+    trace: Trace | None = None,
 ) -> ParseResult.Type[Token, list[ast.Declaration], ParseError]:
     """
     TODO: Actually do this vvvvvvvvvv
@@ -413,4 +481,66 @@ def parse(
     # # pprint(len(stre`am.spans))
     # print(pairs)
     # exit()
-    return decls.parse(stream)
+    if failure is None:
+        failure = Failure()
+
+    result = compiled_decl_lines.parse(stream, budget, failure, trace)
+    if result is PR.NoMatch:
+        return PR.Error(farthest_error(failure, stream), failure.span)
+    return result
+
+
+# Items that may start a declaration.
+decl_starts = t.cast(frozenset[Token], decl.first_set().items)
+
+
+def splits_decls() -> t.Callable[[Token], bool]:
+    # Splits a token stream before every declaration that starts a line outside
+    # any brackets. No rule backtracks over such a split, since a declaration
+    # never continues with one.
+    depth = 0
+    previous: Token | None = None
+
+    def splits(token: Token) -> bool:
+        nonlocal depth, previous
+        after, previous = previous, token
+        match token:
+            case Basic.LeftBrace | Basic.LeftParenthesis | Basic.LeftBracket:
+                depth += 1
+            case Basic.RightBrace | Basic.RightParenthesis | Basic.RightBracket:
+                depth -= 1
+            case Keyword() if depth <= 0 and after is Basic.NewLine:
+                return token in decl_starts
+            case _:
+                ...
+        return False
+
+    return splits
+
+
+def iter_parse(
+    tokens: t.Iterable[Spanned[Token]],
+    file_handle: os.PathLike[str] | None = None,
+    budget: Budget[ParseError] | None = None,
+    trace: Trace | None = None,
+) -> t.Iterator[ParseResult.Type[Token, list[ast.Declaration], ParseError]]:
+    # `parse` over tokens pulled from `tokens` as they are needed, such as
+    # those of `lex.iter_tokens`, so lexing and parsing overlap. Only the
+    # tokens of the declaration being parsed are held. Yields the result of
+    # parsing each declaration, up to the first error; `budget` applies to
+    # each declaration separately.
+    window = Window(iter(tokens), file_handle)
+    while (stream := window.take(splits_decls())) is not None:
+        result = parse(stream, budget, trace=trace)
+        rest = None if isinstance(result, PR.Match) else window.take(lambda _: False)
+        if rest is not None:
+            # A malformed declaration may not end where it was split, and
+            # would be reported at the split rather than as far as `parse`
+            # gets over the whole file. It is parsed again with every token
+            # after it, which are only held once there is an error.
+            result = parse(
+                Stream(file_handle, [*stream.spans, *rest.spans]), budget, trace=trace
+            )
+        yield result
+        if not isinstance(result, PR.Match):
+            return
@@ -1,5 +1,6 @@
 import typing as t
 from dataclasses import dataclass
+import functools
 
 from opyl.compile.token import Token, Basic, Keyword
 from opyl.compile.error import ParseError
@@ -15,64 +16,69 @@ from opyl.compile.expr import (
     MemberAccessExpression,
     PrefixExpression,
 )
-from opyl.support.combinator import PR, Parser, ParseResult, choice
+from opyl.support.combinator import Parser, State, choice, optimize
 from opyl.support.stream import Stream
 from opyl.support.atoms import just, filt, ident, integer, newlines, string, char
-from opyl.support.union import Maybe
 
 
 # TODO: Move into expr.py once precedence solution has been decided on.
-def check_precedence(input: Stream[Token]) -> int:
-    match input.peek():
-        case Maybe.Just(tok):
-            match tok.item:
-                case op if isinstance(op, Basic) and op in BinOp:
-                    return BinOp(op).precedence()
-                case paren if paren is Basic.LeftParenthesis:
-                    return 8
-                case brack if brack is Basic.LeftBracket:
-                    return 8
-                case period if period is Basic.Period:
-                    return 8
-                case _:
-                    return 0
-        case Maybe.Nothing:
+def check_precedence(input: Stream[Token], position: int) -> int:
+    try:
+        tok = input.items[position]
+    except IndexError:
+        return 0
+
+    match tok:
+        case op if isinstance(op, Basic) and op in BinOp:
+            return BinOp(op).precedence()
+        case paren if paren is Basic.LeftParenthesis:
+            return 8
+        case brack if brack is Basic.LeftBracket:
+            return 8
+        case period if period is Basic.Period:
+            return 8
+        case _:
             return 0
 
 
+# Infix parsers run after the left operand has been parsed, and produce a
+# function that completes the expression from it. This lets them be built once
+# instead of per operand.
+type Infix[T] = t.Callable[[ex.Expression], T]
+
+
 @dataclass
 class Expression(Parser[Token, ex.Expression, ParseError]):
     precedence: int
 
     @t.override
-    def parse(
-        self, input: Stream[Token]
-    ) -> ParseResult.Type[Token, ex.Expression, ParseError]:
-        match prefix_parser.parse(input):
-            case PR.Match(left, pos):
-                ...
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as error:
-                return error
-
-        while self.precedence < check_precedence(pos):
-            match infix_parser(left).parse(pos):
-                case PR.Match(expr, pos):
-                    left = expr
-                case PR.NoMatch:
-                    return PR.NoMatch
-                case PR.Error() as error:
-                    return error
-
-        return PR.Match(left, pos)
+    def run(self, state: State[Token], position: int) -> int:
+        pos = prefix_parser.run(state, position)
+        if pos < 0:
+            return pos
+
+        left = state.item
+        while self.precedence < check_precedence(state.input, pos):
+            pos = infix_parser.run(state, pos)
+            if pos < 0:
+                return pos
+            left = state.item(left)
+
+        state.item = left
+        return pos
+
+    @t.override
+    def children(self) -> t.Iterator[Parser[Token, t.Any, ParseError]]:
+        yield prefix_parser
+        yield infix_parser
 
 
+@functools.cache
 def expression(precedence: int) -> Expression:
     return Expression(precedence)
 
 
-expr = expression(0)
+expr = expression(0).memoized().labelled("expr")
 
 grouped_expr = (
     newlines.ignore_then(expr)
@@ -83,45 +89,35 @@ grouped_expr = (
             ParseError(expected="')'", following="grouped expression")
         ),
     )
+).labelled("grouped_expr")
+
+bin_op_expr: Parser[Token, Infix[BinaryExpression], ParseError] = (
+    # TODO: Don't like isinstance here and elsewhere
+    filt(lambda tok: tok in BinOp, "binary operator")
+    .map(BinOp)
+    .then_with(lambda op: expression(op.adjusted_precedence()))
+    .map(lambda op_right: lambda left: BinaryExpression(op_right[0], left, op_right[1]))
+    .labelled("bin_op_expr")
 )
 
-
-def bin_op_expr(left: ex.Expression) -> Parser[Token, BinaryExpression, ParseError]:
-    return (
-        # TODO: Don't like isinstance here and elsewhere
-        filt(lambda tok: tok in BinOp)
-        .map(BinOp)
-        .map(lambda op: (op, op.adjusted_precedence()))
-        .then_with_ctx(lambda op_prec, input: expression(op_prec[1]).parse(input))
-        .map(
-            lambda op_prec_right: BinaryExpression(
-                op_prec_right[0][0], left, op_prec_right[1]
-            )
-        )
+call_expr: Parser[Token, Infix[CallExpression], ParseError] = (
+    newlines.ignore_then(
+        expr.separated_by(just(Basic.Comma).then_ignore(newlines))
+        .allow_trailing()
+        .then_ignore(newlines)
     )
-
-
-def call_expr(function: ex.Expression) -> Parser[Token, CallExpression, ParseError]:
-    return (
-        newlines.ignore_then(
-            expr.separated_by(just(Basic.Comma).then_ignore(newlines))
-            .allow_trailing()
-            .then_ignore(newlines)
-        )
-        .delimited_by(
-            just(Basic.LeftParenthesis),
-            just(Basic.RightParenthesis).require(
-                ParseError(expected="')'", following="call argument list")
-            ),
-        )
-        .map(lambda args: CallExpression(function, args))
+    .delimited_by(
+        just(Basic.LeftParenthesis),
+        just(Basic.RightParenthesis).require(
+            ParseError(expected="')'", following="call argument list")
+        ),
     )
+    .map(lambda args: lambda function: CallExpression(function, args))
+    .labelled("call_expr")
+)
 
-
-def subscript_expr(
-    base: ex.Expression,
-) -> Parser[Token, SubscriptExpression, ParseError]:
-    return (
+subscript_expr: Parser[Token, Infix[SubscriptExpression], ParseError] = (
+    (
         newlines.ignore_then(expr)
         .then_ignore(newlines)
         .delimited_by(
@@ -130,30 +126,28 @@ def subscript_expr(
                 ParseError(expected="']'", following="subscript expression (foo[bar])")
             ),
         )
-    ).map(lambda index: SubscriptExpression(base, index))
-
-
-def member_access_expr(
-    base: ex.Expression,
-) -> Parser[Token, MemberAccessExpression, ParseError]:
-    return (
-        just(Basic.Period)
-        .ignore_then(
-            ident.require(
-                ParseError(
-                    expected="identifier", following="member access operator '.'"
-                )
-            )
-        )
-        .map(lambda member: MemberAccessExpression(base, member))
     )
+    .map(lambda index: lambda base: SubscriptExpression(base, index))
+    .labelled("subscript_expr")
+)
 
+member_access_expr: Parser[Token, Infix[MemberAccessExpression], ParseError] = (
+    just(Basic.Period)
+    .ignore_then(
+        ident.require(
+            ParseError(expected="identifier", following="member access operator '.'")
+        )
+    )
+    .map(lambda member: lambda base: MemberAccessExpression(base, member))
+    .labelled("member_access_expr")
+)
 
 prefix_op_expr = (
-    filt(lambda op: isinstance(op, Basic) and op in PrefixOperator)
+    filt(lambda op: isinstance(op, Basic) and op in PrefixOperator, "prefix operator")
     .map(PrefixOperator)
-    .then_with_ctx(lambda op, input: expression(op.precedence()).parse(input))
+    .then_with(lambda op: expression(op.precedence()))
     .map(lambda op_right: PrefixExpression(op_right[0], op_right[1]))
+    .labelled("prefix_op_expr")
 )
 
 boolean = choice(
@@ -163,13 +157,10 @@ boolean = choice(
     )
 )
 
-prefix_parser = grouped_expr | prefix_op_expr | ident | integer | string | char
-
+prefix_parser = optimize(
+    grouped_expr | prefix_op_expr | ident | integer | string | char
+)
 
-def infix_parser(left: ex.Expression) -> Parser[Token, InfixExpression, ParseError]:
-    return (
-        bin_op_expr(left)
-        | call_expr(left)
-        | subscript_expr(left)
-        | member_access_expr(left)
-    )
+infix_parser: Parser[Token, Infix[InfixExpression], ParseError] = optimize(
+    bin_op_expr | call_expr | subscript_expr | member_access_expr
+)
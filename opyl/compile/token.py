@@ -80,6 +80,48 @@ class Basic(Enum):
     Eof = auto()  # TODO
 
 
+# Source text of each basic token, for messages.
+basic_text: t.Final[dict[Basic, str]] = {
+    Basic.Plus: "+",
+    Basic.PlusEqual: "+=",
+    Basic.Hyphen: "-",
+    Basic.HyphenEqual: "-=",
+    Basic.RightArrow: "->",
+    Basic.Asterisk: "*",
+    Basic.AsteriskEqual: "*=",
+    Basic.ForwardSlash: "/",
+    Basic.ForwardSlashEqual: "/=",
+    Basic.Caret: "^",
+    Basic.Percent: "%",
+    Basic.At: "@",
+    Basic.Ampersand2: "&&",
+    Basic.Ampersand: "&",
+    Basic.BangEqual: "!=",
+    Basic.Bang: "!",
+    Basic.Tilde: "~",
+    Basic.Colon2: "::",
+    Basic.Colon: ":",
+    Basic.Equal2: "==",
+    Basic.Equal: "=",
+    Basic.LeftBrace: "{",
+    Basic.RightBrace: "}",
+    Basic.LeftParenthesis: "(",
+    Basic.RightParenthesis: ")",
+    Basic.LeftAngle2: "<<",
+    Basic.LeftAngleEqual: "<=",
+    Basic.LeftAngle: "<",
+    Basic.RightAngle2: ">>",
+    Basic.RightAngleEqual: ">=",
+    Basic.RightAngle: ">",
+    Basic.LeftBracket: "[",
+    Basic.RightBracket: "]",
+    Basic.Comma: ",",
+    Basic.Period: ".",
+    Basic.Pipe2: "||",
+    Basic.Pipe: "|",
+}
+
+
 class TokenKind(Enum):
     Keyword = auto()
     Basic = auto()
@@ -97,7 +139,7 @@ type IntegerLiteralBase = t.Literal[2] | t.Literal[10] | t.Literal[16]
 Whitespace: t.Final[t.Literal[TokenKind.Whitespace]] = TokenKind.Whitespace
 
 
-@dataclass()
+@dataclass(frozen=True)
 class Identifier:
     identifier: str
 
@@ -107,23 +149,23 @@ class Identifier:
     #     return self.identifier == other.identifier
 
 
-@dataclass
+@dataclass(frozen=True)
 class StringLiteral:
     string: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class IntegerLiteral:
     integer: int
     base: IntegerLiteralBase = 10
 
 
-@dataclass
+@dataclass(frozen=True)
 class Comment:
     comment: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class CharacterLiteral:
     char: str
 
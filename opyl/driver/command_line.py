@@ -4,6 +4,8 @@ import typing as t
 import argparse
 import pathlib
 
+from opyl.compile.lex import Engine
+
 
 # TODO: If argparse.ArgumentParser.parse_args fails, it will print to stdout/sterr and then exit immediately.
 # I would like to:
@@ -13,6 +15,7 @@ import pathlib
 @dataclass
 class CommandLineArguments:
     source_file: pathlib.Path
+    engine: Engine = Engine.Combinator
 
     @classmethod
     def parse_args(cls, args: list[str] | None = None) -> t.Self:
@@ -21,6 +24,14 @@ class CommandLineArguments:
 
         argparser = argparse.ArgumentParser()
         argparser.add_argument("source_file")
+        argparser.add_argument(
+            "--engine",
+            choices=[engine.name for engine in Engine],
+            default=Engine.Combinator.name,
+        )
         parsed_args = argparser.parse_args(args)
 
-        return cls(source_file=pathlib.Path(parsed_args.source_file))
+        return cls(
+            source_file=pathlib.Path(parsed_args.source_file),
+            engine=Engine[parsed_args.engine],
+        )
@@ -0,0 +1,368 @@
+# The checker leaves the output type of a parser taken apart by a class
+# pattern unknown, which these would report at every such pattern.
+# pyright: reportUnknownVariableType=false, reportUnknownArgumentType=false
+import typing as t
+from dataclasses import dataclass, field
+from collections import deque
+from enum import Enum
+import os
+
+from opyl.support.combinator import (
+    Parser,
+    Require,
+    Cut,
+    Labelled,
+    Spanned,
+    Alternative,
+    To,
+    Then,
+    ThenWithContext,
+    ThenWith,
+    IgnoreThen,
+    ThenIgnore,
+    SeparatedBy,
+    DelimitedBy,
+    OrNot,
+    OrElse,
+    Map,
+    AndCheck,
+    Repeated,
+    Just,
+    Nothing,
+    Boolean,
+    StartsWith,
+    TakeWhile,
+    Choice,
+    Memoized,
+    Recursive,
+    Sequence,
+    Factored,
+    branches,
+)
+
+# Static checks over a combinator graph. A parser is nullable if it may match
+# without consuming anything, and infallible if it never produces `NoMatch`
+# (it may still produce an error). Both are computed as least fixed points, so
+# parsers the analysis does not understand count as neither, and are only
+# walked through for reachability. This keeps the reported issues free of
+# false positives at the cost of missing some.
+
+type AnyParser = Parser[t.Any, t.Any, t.Any]
+
+
+@dataclass
+class Issue:
+    class Kind(Enum):
+        # `Repeated` or `SeparatedBy` over a parser that may match without
+        # consuming anything, which loops forever.
+        NullableRepetition = 0
+        # A rule that can reach itself without consuming anything.
+        LeftRecursion = 1
+        # An alternative that can never run, because an earlier one never
+        # produces `NoMatch` or is the same parser.
+        ShadowedAlternative = 2
+
+    kind: Kind
+    parser: AnyParser = field(repr=False)
+    path: str
+
+    def __str__(self) -> str:
+        return f"{self.kind.name} at {self.path}"
+
+
+class GrammarError(Exception):
+    def __init__(self, name: str, issues: list[Issue]):
+        self.issues = issues
+        super().__init__(
+            "\n".join([f"grammar '{name}' has issues:", *map(str, issues)])
+        )
+
+
+def analyze(grammar: AnyParser) -> list[Issue]:
+    paths = reachable(grammar)
+    nodes = [node for node, _ in paths.values()]
+    nullable = fixed_point(nodes, is_nullable)
+    infallible = fixed_point(nodes, is_infallible)
+
+    issues = list[Issue]()
+    for node, path in paths.values():
+        match node:
+            case Repeated(parser) if id(parser) in nullable:
+                issues.append(Issue(Issue.Kind.NullableRepetition, node, path))
+            case SeparatedBy(parser, separator) if (
+                id(parser) in nullable and id(separator) in nullable
+            ):
+                issues.append(Issue(Issue.Kind.NullableRepetition, node, path))
+            case Alternative() | Choice():
+                for index, branch in shadowed(node, infallible):
+                    issues.append(
+                        Issue(
+                            Issue.Kind.ShadowedAlternative,
+                            branch,
+                            f"{path}[{index}]",
+                        )
+                    )
+            case _:
+                ...
+
+    for cycle in left_cycles(nodes, nullable):
+        # Report the cycle at a forward declaration if it has one, since that
+        # is usually where the rule is named.
+        node = next((node for node in cycle if isinstance(node, Recursive)), cycle[0])
+        issues.append(Issue(Issue.Kind.LeftRecursion, node, paths[id(node)][1]))
+
+    return issues
+
+
+def check(grammar: AnyParser, name: str):
+    # Opt-in check for module-level grammars, enabled by setting the
+    # OPYL_CHECK_GRAMMAR environment variable.
+    if not os.environ.get("OPYL_CHECK_GRAMMAR"):
+        return
+
+    issues = analyze(grammar)
+    if issues:
+        raise GrammarError(name, issues)
+
+
+def reachable(grammar: AnyParser) -> dict[int, tuple[AnyParser, str]]:
+    # Every parser reachable from `grammar` keyed on identity, since comparing
+    # parsers by value could recurse through cycles, along with the shortest
+    # path to it.
+    paths = {id(grammar): (grammar, name(grammar))}
+    pending = deque([grammar])
+
+    while pending:
+        node = pending.popleft()
+        # Nested choices are flattened into the outermost one, so only its
+        # branches are visited.
+        match node:
+            case Alternative() | Choice():
+                children = branches(node)
+            case _:
+                children = list(node.children())
+
+        for child in children:
+            if id(child) not in paths:
+                paths[id(child)] = (
+                    child,
+                    f"{paths[id(node)][1]} > {name(child)}",
+                )
+                pending.append(child)
+
+    return paths
+
+
+def name(node: AnyParser) -> str:
+    match node:
+        case Labelled(_, label):
+            return f"{type(node).__name__}({label!r})"
+        case _:
+            return type(node).__name__
+
+
+def fixed_point(
+    nodes: list[AnyParser], rule: t.Callable[[AnyParser, set[int]], bool]
+) -> set[int]:
+    # The identities of the parsers for which `rule` holds, given the parsers
+    # it already holds for.
+    holds = set[int]()
+    changed = True
+    while changed:
+        changed = False
+        for node in nodes:
+            if id(node) not in holds and rule(node, holds):
+                holds.add(id(node))
+                changed = True
+    return holds
+
+
+def is_nullable(node: AnyParser, nullable: set[int]) -> bool:
+    match node:
+        case Nothing() | OrNot() | OrElse() | Boolean():
+            return True
+        case TakeWhile(_, at_least):
+            return at_least <= 0
+        case Repeated(parser, at_least):
+            return at_least <= 0 or id(parser) in nullable
+        case SeparatedBy(parser, _, _, _, at_least):
+            return at_least <= 0 or id(parser) in nullable
+        case Then(first, second) | IgnoreThen(first, second) | ThenIgnore(
+            first, second
+        ):
+            return id(first) in nullable and id(second) in nullable
+        case DelimitedBy(parser, start, end):
+            return (
+                id(start) in nullable and id(parser) in nullable and id(end) in nullable
+            )
+        case Sequence(parsers):
+            return all(id(parser) in nullable for parser in parsers)
+        case Factored(head, tails):
+            return id(head) in nullable and any(id(tail) in nullable for tail in tails)
+        case Alternative() | Choice():
+            return any(id(branch) in nullable for branch in branches(node))
+        case Spanned(parser) | To(parser) | Map(parser) | AndCheck(parser) | Cut(
+            parser
+        ) | Labelled(parser):
+            return id(parser) in nullable
+        case Memoized(parser) | Require(parser) | Recursive(parser):
+            return parser is not None and id(parser) in nullable
+        case _:
+            return False
+
+
+def is_infallible(node: AnyParser, infallible: set[int]) -> bool:
+    match node:
+        case OrNot() | OrElse() | Boolean() | Require():
+            return True
+        case TakeWhile(_, at_least):
+            return at_least <= 0
+        case Repeated(parser, at_least):
+            return at_least <= 0
+        case SeparatedBy(_, _, _, _, at_least):
+            return at_least <= 0
+        case Then(first, second) | IgnoreThen(first, second) | ThenIgnore(
+            first, second
+        ):
+            return id(first) in infallible and id(second) in infallible
+        case DelimitedBy(parser, start, end):
+            return (
+                id(start) in infallible
+                and id(parser) in infallible
+                and id(end) in infallible
+            )
+        case Sequence(parsers):
+            return all(id(parser) in infallible for parser in parsers)
+        case Factored(head, tails):
+            return id(head) in infallible and any(
+                id(tail) in infallible for tail in tails
+            )
+        case Alternative() | Choice():
+            return any(id(branch) in infallible for branch in branches(node))
+        case Spanned(parser) | To(parser) | Map(parser) | Cut(parser) | Labelled(
+            parser
+        ):
+            return id(parser) in infallible
+        case Memoized(parser) | Recursive(parser):
+            return parser is not None and id(parser) in infallible
+        case _:
+            return False
+
+
+def shadowed(
+    node: Alternative[t.Any, t.Any, t.Any, t.Any] | Choice[t.Any, t.Any, t.Any],
+    infallible: set[int],
+) -> t.Iterator[tuple[int, AnyParser]]:
+    # Branches that follow an infallible branch, or repeat an earlier one.
+    earlier = list[AnyParser]()
+    for index, branch in enumerate(branches(node)):
+        if any(id(previous) in infallible for previous in earlier) or any(
+            same(previous, branch) for previous in earlier
+        ):
+            yield index, branch
+        earlier.append(branch)
+
+
+def same(first: AnyParser, second: AnyParser) -> bool:
+    # Only leaves are compared by value; comparing other parsers by value
+    # could recurse through cycles.
+    match first, second:
+        case (Just(), Just()) | (StartsWith(), StartsWith()):
+            return first == second
+        case _:
+            return first is second
+
+
+def starts(node: AnyParser, nullable: set[int]) -> list[AnyParser]:
+    # The parsers that `node` may run at the position it starts at.
+    def sequence(*parsers: AnyParser) -> list[AnyParser]:
+        started = list[AnyParser]()
+        for parser in parsers:
+            started.append(parser)
+            if id(parser) not in nullable:
+                break
+        return started
+
+    match node:
+        case Then(first, second) | IgnoreThen(first, second) | ThenIgnore(
+            first, second
+        ):
+            return sequence(first, second)
+        case DelimitedBy(parser, start, end):
+            return sequence(start, parser, end)
+        case Sequence(parsers):
+            return sequence(*parsers)
+        case Factored(head, tails):
+            return [head, *tails] if id(head) in nullable else [head]
+        case SeparatedBy(parser, separator, allow_leading):
+            if allow_leading:
+                return sequence(separator, parser, separator)
+            return sequence(parser, separator)
+        case ThenWithContext(first) | ThenWith(first):
+            return [first]
+        case Alternative() | Choice():
+            return branches(node)
+        case Spanned(parser) | To(parser) | Map(parser) | AndCheck(parser) | Cut(
+            parser
+        ) | Labelled(parser):
+            return [parser]
+        case Memoized(parser) | Require(parser) | Repeated(parser) | OrNot(parser):
+            return [parser]
+        case OrElse(parser) | Boolean(parser) | Recursive(parser):
+            return [] if parser is None else [parser]
+        case _:
+            return []
+
+
+def left_cycles(nodes: list[AnyParser], nullable: set[int]) -> list[list[AnyParser]]:
+    # Strongly connected components of the "may start with" relation, found
+    # with an iterative version of Tarjan's algorithm. Every component with
+    # more than one parser, or with a parser that starts with itself, is a
+    # left-recursive cycle.
+    index = dict[int, int]()
+    low = dict[int, int]()
+    stack = list[AnyParser]()
+    on_stack = set[int]()
+    cycles = list[list[AnyParser]]()
+
+    for root in nodes:
+        if id(root) in index:
+            continue
+
+        work = [(root, iter(starts(root, nullable)))]
+        index[id(root)] = low[id(root)] = len(index)
+        stack.append(root)
+        on_stack.add(id(root))
+
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if id(successor) not in index:
+                    index[id(successor)] = low[id(successor)] = len(index)
+                    stack.append(successor)
+                    on_stack.add(id(successor))
+                    work.append((successor, iter(starts(successor, nullable))))
+                    break
+                if id(successor) in on_stack:
+                    low[id(node)] = min(low[id(node)], index[id(successor)])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[id(parent)] = min(low[id(parent)], low[id(node)])
+
+                if low[id(node)] == index[id(node)]:
+                    component = list[AnyParser]()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(id(member))
+                        component.append(member)
+                        if member is node:
+                            break
+
+                    if len(component) > 1 or any(
+                        child is node for child in starts(node, nullable)
+                    ):
+                        cycles.append(component[::-1])
+
+    return cycles
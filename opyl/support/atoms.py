@@ -14,16 +14,16 @@ filt = Filter[Token, ParseError]
 just = Just[Token, ParseError]
 one_of = OneOf[Token, ParseError]
 
-ident = filt(lambda tok: isinstance(tok, Identifier)).map(
+ident = filt(lambda tok: isinstance(tok, Identifier), "identifier").map(
     lambda tok: t.cast(Identifier, tok)
 )
-integer = filt(lambda tok: isinstance(tok, IntegerLiteral)).map(
+integer = filt(lambda tok: isinstance(tok, IntegerLiteral), "integer literal").map(
     lambda tok: t.cast(IntegerLiteral, tok)
 )
-string = filt(lambda tok: isinstance(tok, StringLiteral)).map(
+string = filt(lambda tok: isinstance(tok, StringLiteral), "string literal").map(
     lambda tok: t.cast(StringLiteral, tok)
 )
-char = filt(lambda tok: isinstance(tok, CharacterLiteral)).map(
+char = filt(lambda tok: isinstance(tok, CharacterLiteral), "character literal").map(
     lambda tok: t.cast(CharacterLiteral, tok)
 )
 newlines = just(Basic.NewLine).repeated()
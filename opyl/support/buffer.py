@@ -0,0 +1,493 @@
+import typing as t
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from enum import Enum
+
+from opyl.support.span import Spanned, Span
+
+# Pieces next to a splice are joined while they hold this many items between
+# them, so that a buffer edited many times is not left in pieces too small to
+# be worth sharing.
+CHUNK = 1024
+
+
+@dataclass(slots=True)
+class Piece[Source]:
+    # The items of `source` from `start` up to `stop`, with their offsets
+    # moved by `shift`.
+    source: Source
+    start: int
+    stop: int
+    shift: int
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+
+def edges[Source](pieces: list[Piece[Source]]) -> list[int]:
+    # The index at which each piece starts, and the length of them all.
+    found = [0]
+    for piece in pieces:
+        found.append(found[-1] + len(piece))
+    return found
+
+
+def cut[
+    Source
+](pieces: list[Piece[Source]], bounds: list[int], start: int, stop: int) -> list[
+    Piece[Source]
+]:
+    # The pieces of the items from `start` up to `stop`, given the `edges` of
+    # `pieces`.
+    found = list[Piece[Source]]()
+    for index in range(max(bisect_right(bounds, start) - 1, 0), len(pieces)):
+        if bounds[index] >= stop:
+            break
+        piece = pieces[index]
+        begin = piece.start + max(start, bounds[index]) - bounds[index]
+        end = piece.start + min(stop, bounds[index + 1]) - bounds[index]
+        if begin < end:
+            found.append(Piece(piece.source, begin, end, piece.shift))
+    return found
+
+
+def splice_pieces[
+    Source
+](
+    pieces: list[Piece[Source]],
+    start: int,
+    stop: int,
+    middle: list[Piece[Source]],
+    shift: int,
+    flatten: t.Callable[[list[Piece[Source]]], Source],
+) -> list[Piece[Source]]:
+    # The pieces of the items of `pieces` before `start`, those of `middle`,
+    # and those of `pieces` from `stop` on with their offsets moved by
+    # `shift`. Small pieces next to `middle` are flattened into one.
+    bounds = edges(pieces)
+    spliced = cut(pieces, bounds, 0, start)
+    first = len(spliced)
+    spliced.extend(middle)
+    last = len(spliced)
+    spliced.extend(
+        Piece(piece.source, piece.start, piece.stop, piece.shift + shift)
+        for piece in cut(pieces, bounds, stop, bounds[-1])
+    )
+
+    size = sum(map(len, middle))
+    while first > 0 and size + len(spliced[first - 1]) <= CHUNK:
+        first -= 1
+        size += len(spliced[first])
+    while last < len(spliced) and size + len(spliced[last]) <= CHUNK:
+        size += len(spliced[last])
+        last += 1
+    if last - first > 1:
+        spliced[first:last] = [Piece(flatten(spliced[first:last]), 0, size, 0)]
+    return spliced
+
+
+class TokenBuffer[Item](t.Sequence[Spanned[Item]]):
+    # A sequence of spanned items stored as a struct of arrays, so that a
+    # buffer costs a few bytes per item rather than a `Spanned` and a `Span`
+    # object each. `kinds` holds a code per item: enum members, which carry no
+    # data, are stored as their code alone, while other items are kept in the
+    # `payloads` side table under a code for their type. `slots` holds the
+    # number of payloads before each item, which is where the payload of an
+    # item that has one is found. `Spanned` objects are only built when items
+    # are indexed through the sequence interface; `items` and `span` read the
+    # arrays directly.
+    def __init__(self, meanings: t.Iterable[t.Any] = ()):
+        self.kinds = array("H")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.slots = array("I")
+        self.payloads = list[Item]()
+        # What each code stands for: an enum member, or the type of the items
+        # kept in `payloads`. Codes are keyed on identity, since enum members
+        # hash in Python.
+        self._meanings = list[t.Any]()
+        self._codes = dict[int, int]()
+        self._items: list[Item] | None = None
+        # Buffers given the same `meanings` code items alike, so they can be
+        # joined without recoding.
+        for meaning in meanings:
+            self.code(meaning)
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        # Identities do not survive pickling, so codes are rebuilt on load. A
+        # buffer made through a parameterized alias records it, and its type
+        # variables cannot be pickled.
+        state = self.__dict__.copy()
+        state.pop("__orig_class__", None)
+        del state["_codes"]
+        state["_items"] = None
+        return state
+
+    def __setstate__(self, state: dict[str, t.Any]):
+        self.__dict__.update(state)
+        self._codes = {id(meaning): code for code, meaning in enumerate(self._meanings)}
+
+    def code(self, meaning: t.Any) -> int:
+        code = self._codes.get(id(meaning))
+        if code is None:
+            code = self._codes[id(meaning)] = len(self._meanings)
+            self._meanings.append(meaning)
+        return code
+
+    def recode(
+        self, other: "TokenBuffer[Item]", start: int = 0, stop: int | None = None
+    ) -> array[int]:
+        # The kinds of the items of `other` from `start` up to `stop`, in the
+        # codes of this buffer.
+        kinds = other.kinds[start:stop]
+        codes = array("H", map(self.code, other._meanings))
+        if codes == array("H", range(len(codes))):
+            return kinds
+        return array("H", map(codes.__getitem__, kinds))
+
+    def append(self, item: Item, start: int, end: int):
+        self.slots.append(len(self.payloads))
+        if isinstance(item, Enum):
+            meaning = item
+        else:
+            meaning = type(item)
+            self.payloads.append(item)
+        code = self._codes.get(id(meaning))
+        self.kinds.append(self.code(meaning) if code is None else code)
+        self.starts.append(start)
+        self.ends.append(end)
+        self._items = None
+
+    def extend(self, spans: t.Iterable[Spanned[Item]]):
+        for spanned in spans:
+            self.append(spanned.item, spanned.span.start, spanned.span.end)
+
+    def extend_raw(
+        self,
+        kinds: bytes,
+        starts: bytes,
+        ends: bytes,
+        slots: bytes,
+        payloads: t.Iterable[Item],
+    ):
+        # Appends items given as the machine values of each of their arrays,
+        # such as those of NumPy arrays, without visiting them one by one.
+        # `kinds` are in the codes of this buffer, and `slots` count the
+        # payloads already in it.
+        self.kinds.frombytes(kinds)
+        self.starts.frombytes(starts)
+        self.ends.frombytes(ends)
+        self.slots.frombytes(slots)
+        self.payloads.extend(payloads)
+        self._items = None
+
+    def join(
+        self,
+        other: "TokenBuffer[Item]",
+        start: int = 0,
+        stop: int | None = None,
+        shift: int = 0,
+    ):
+        # Appends the items of `other` from `start` up to `stop`, with their
+        # offsets moved by `shift`, copying its arrays rather than its items.
+        if stop is None:
+            stop = len(other)
+        first = other.slot(start)
+        last = other.slot(stop)
+        self.kinds.extend(self.recode(other, start, stop))
+        self.slots.extend(moved(other.slots[start:stop], len(self.payloads) - first))
+        self.payloads.extend(other.payloads[first:last])
+        self.starts.extend(moved(other.starts[start:stop], shift))
+        self.ends.extend(moved(other.ends[start:stop], shift))
+        self._items = None
+
+    def splice(
+        self, start: int, stop: int, other: "TokenBuffer[Item]", shift: int
+    ) -> "TokenBuffer[Item]":
+        # A new buffer of the items of this one before `start`, those of
+        # `other`, and those of this one from `stop` on with their offsets
+        # moved by `shift`. The new buffer is made of pieces of this one and
+        # of `other`, which it shares rather than copies, so a splice takes
+        # time in the length of `other` and the number of pieces. Neither
+        # buffer may change afterwards.
+        return SplicedBuffer(
+            splice_pieces(
+                self.pieces(),
+                start,
+                stop,
+                other.pieces(),
+                shift,
+                SplicedBuffer[Item].flatten,
+            )
+        )
+
+    def pieces(self) -> list[Piece["TokenBuffer[Item]"]]:
+        return [Piece(self, 0, len(self), 0)] if len(self) else []
+
+    def flat(self) -> "TokenBuffer[Item]":
+        # The buffer as one set of arrays.
+        return self
+
+    def truncate(self, length: int):
+        # Drops every item from `length` on, such as those of a line that
+        # turned out to hold an error.
+        if length < len(self):
+            del self.payloads[self.slots[length] :]
+        del self.kinds[length:]
+        del self.starts[length:]
+        del self.ends[length:]
+        del self.slots[length:]
+        self._items = None
+
+    def slot(self, index: int) -> int:
+        # The number of payloads before the item at `index`.
+        if index >= len(self):
+            return len(self.payloads)
+        return self.slots[index]
+
+    def item(self, index: int) -> Item:
+        meaning = self._meanings[self.kinds[index]]
+        if isinstance(meaning, Enum):
+            return t.cast(Item, meaning)
+        return self.payloads[self.slots[index]]
+
+    def span(self, index: int) -> Span:
+        return Span(self.starts[index], self.ends[index])
+
+    def bisect(self, offset: int, after: bool = False) -> int:
+        # The index of the first item that starts at `offset` or later, or
+        # later than `offset` if `after` is set.
+        find = bisect_right if after else bisect_left
+        return find(self.starts, offset)
+
+    def items(self) -> list[Item]:
+        # The items without their spans, built once for the parser to index.
+        items = self._items
+        if items is None:
+            meanings = self._meanings
+            payloads = self.payloads
+            items = self._items = [
+                t.cast(Item, meaning) if isinstance(meaning, Enum) else payloads[slot]
+                for meaning, slot in zip(
+                    map(meanings.__getitem__, self.kinds), self.slots
+                )
+            ]
+        return items
+
+    def select(self, keep: t.Callable[[Item], bool]) -> "TokenBuffer[Item]":
+        selected = TokenBuffer[Item](self._meanings)
+        for index, item in enumerate(self.items()):
+            if keep(item):
+                selected.append(item, self.starts[index], self.ends[index])
+        return selected
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @t.overload
+    def __getitem__(self, index: int) -> Spanned[Item]:
+        ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> list[Spanned[Item]]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Spanned[Item] | list[Spanned[Item]]:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token buffer index out of range")
+        return Spanned(self.item(index), self.span(index))
+
+    def __iter__(self) -> t.Iterator[Spanned[Item]]:
+        for item, start, end in zip(self.items(), self.starts, self.ends):
+            yield Spanned(item, Span(start, end))
+
+    def __eq__(self, other: object) -> bool:
+        match other:
+            case TokenBuffer():
+                flat = self.flat()
+                other = t.cast(TokenBuffer[t.Any], other).flat()
+                return (
+                    flat.starts == other.starts
+                    and flat.ends == other.ends
+                    and flat.items() == other.items()
+                )
+            case list():
+                return list(self) == other
+            case _:
+                return NotImplemented
+
+    def __repr__(self) -> str:
+        # As the list of `Spanned` items it stands for.
+        return repr(list(self))
+
+
+def moved(values: array[int], by: int) -> array[int]:
+    # `values`, each moved by `by`.
+    if not by:
+        return values
+    return array("I", [value + by for value in values])
+
+
+class SplicedBuffer[Item](TokenBuffer[Item]):
+    # A buffer spliced together from pieces of others, which it reads through
+    # rather than copies. Items and spans are found by bisecting the pieces,
+    # and passes over the whole buffer read it flattened into one set of
+    # arrays, which is built once.
+    def __init__(self, pieces: list[Piece[TokenBuffer[Item]]]):
+        self._pieces = pieces
+        self._edges = edges(pieces)
+        self._items = None
+        self._flat: TokenBuffer[Item] | None = None
+
+    def __reduce__(self) -> tuple[t.Any, ...]:
+        return (TokenBuffer, (), self.flat().__getstate__())
+
+    @t.override
+    def pieces(self) -> list[Piece[TokenBuffer[Item]]]:
+        return self._pieces
+
+    @t.override
+    def flat(self) -> TokenBuffer[Item]:
+        if self._flat is None:
+            self._flat = self.flatten(self._pieces)
+        return self._flat
+
+    @staticmethod
+    def flatten(pieces: list[Piece[TokenBuffer[Item]]]) -> TokenBuffer[Item]:
+        flat = TokenBuffer[Item](pieces[0].source._meanings if pieces else ())
+        for piece in pieces:
+            flat.join(piece.source, piece.start, piece.stop, piece.shift)
+        return flat
+
+    def locate(self, index: int) -> tuple[Piece[TokenBuffer[Item]], int]:
+        # The piece holding the item at `index`, and its index in the source.
+        found = bisect_right(self._edges, index) - 1
+        piece = self._pieces[found]
+        return piece, piece.start + index - self._edges[found]
+
+    @t.override
+    def item(self, index: int) -> Item:
+        piece, index = self.locate(index)
+        return piece.source.item(index)
+
+    @t.override
+    def span(self, index: int) -> Span:
+        piece, index = self.locate(index)
+        source = piece.source
+        return Span(
+            source.starts[index] + piece.shift, source.ends[index] + piece.shift
+        )
+
+    @t.override
+    def bisect(self, offset: int, after: bool = False) -> int:
+        # The piece holding the item is the first whose last item starts at
+        # `offset` or later, or later than `offset` if `after` is set.
+        find = bisect_right if after else bisect_left
+        pieces = self._pieces
+        found = find(
+            pieces,
+            offset,
+            key=lambda piece: piece.source.starts[piece.stop - 1] + piece.shift,
+        )
+        if found == len(pieces):
+            return len(self)
+        piece = pieces[found]
+        index = find(piece.source.starts, offset - piece.shift, piece.start, piece.stop)
+        return self._edges[found] + index - piece.start
+
+    @t.override
+    def items(self) -> list[Item]:
+        items = self._items
+        if items is None:
+            items = self._items = []
+            for piece in self._pieces:
+                items.extend(piece.source.items()[piece.start : piece.stop])
+        return items
+
+    @t.override
+    def select(self, keep: t.Callable[[Item], bool]) -> TokenBuffer[Item]:
+        return self.flat().select(keep)
+
+    @t.override
+    def __len__(self) -> int:
+        return self._edges[-1]
+
+    @t.override
+    def __iter__(self) -> t.Iterator[Spanned[Item]]:
+        return iter(self.flat())
+
+
+class SplicedArray(t.Sequence[int]):
+    # An array of numbers spliced together from pieces of others, as a
+    # `SplicedBuffer` is, where the numbers themselves are moved by the shift
+    # of their piece.
+    def __init__(self, pieces: list[Piece[array[int]]]):
+        self.pieces = pieces
+        self._edges = edges(pieces)
+
+    @staticmethod
+    def of(values: "array[int] | SplicedArray", shift: int = 0) -> "SplicedArray":
+        # `values`, each moved by `shift`.
+        if isinstance(values, SplicedArray):
+            return SplicedArray(
+                [
+                    Piece(piece.source, piece.start, piece.stop, piece.shift + shift)
+                    for piece in values.pieces
+                ]
+            )
+        return SplicedArray([Piece(values, 0, len(values), shift)] if values else [])
+
+    def splice(
+        self, start: int, stop: int, other: "SplicedArray", shift: int
+    ) -> "SplicedArray":
+        # As `TokenBuffer.splice`.
+        return SplicedArray(
+            splice_pieces(self.pieces, start, stop, other.pieces, shift, flatten_array)
+        )
+
+    def __len__(self) -> int:
+        return self._edges[-1]
+
+    @t.overload
+    def __getitem__(self, index: int) -> int:
+        ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> list[int]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> int | list[int]:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("spliced array index out of range")
+        found = bisect_right(self._edges, index) - 1
+        piece = self.pieces[found]
+        return piece.source[piece.start + index - self._edges[found]] + piece.shift
+
+    def __iter__(self) -> t.Iterator[int]:
+        return iter(flatten_array(self.pieces))
+
+    def __eq__(self, other: object) -> bool:
+        match other:
+            case SplicedArray() | array() | list():
+                return list(self) == list(t.cast(t.Iterable[int], other))
+            case _:
+                return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(flatten_array(self.pieces))
+
+
+def flatten_array(pieces: list[Piece[array[int]]]) -> array[int]:
+    flat = array("I")
+    for piece in pieces:
+        flat.extend(moved(piece.source[piece.start : piece.stop], piece.shift))
+    return flat
@@ -1,7 +1,15 @@
 import typing as t
-from dataclasses import dataclass
-from abc import ABC, abstractmethod
+import dataclasses
+from dataclasses import dataclass, field
+from abc import ABC
+from collections import OrderedDict
+from array import array
 import copy
+import itertools
+import signal
+import sys
+import time
+import types
 from enum import Enum
 
 from opyl.support.stream import Stream
@@ -11,7 +19,16 @@ from opyl.support.span import Span
 
 
 class ParseResult:
-    type Type[In, Out, Err] = Match[In, Out] | t.Literal[Kind.NoMatch] | Error[Err]
+    # Qualified, since the checker does not look names up in the class body
+    # from an alias.
+    type Type[In, Out, Err] = (
+        ParseResult.Match[In, Out]
+        | t.Literal[ParseResult.Kind.NoMatch]
+        | ParseResult.Error[Err]
+    )
+    type Step[Out, Err] = (
+        tuple[Out, int] | t.Literal[ParseResult.Kind.NoMatch] | ParseResult.Error[Err]
+    )
 
     class Kind(Enum):
         Match = 0
@@ -62,11 +79,564 @@ class ParseResult:
 PR = ParseResult
 
 
+# Internally, parsers return the position after a match, or one of these
+# sentinels. The matched item or the error is left in the `State` of the parse,
+# so the hot path allocates no result objects.
+NO_MATCH: t.Final = -1
+ERROR: t.Final = -2
+
+# How many steps a parse with a deadline may take between reading the clock.
+CLOCK_INTERVAL: t.Final = 1024
+
+
+@dataclass
+class Budget[Err]:
+    # Limits on the work done by one parse. `steps` bounds the number of
+    # branches tried by ordered choices, which is where backtracking blows up,
+    # and `seconds` bounds the wall-clock time. Running out of either stops the
+    # parse with `error`. After the parse, `used` holds the number of steps
+    # taken and `reexamined` the number of items read again by a branch after
+    # an earlier branch of the same choice failed.
+    error: Err
+    steps: int | None = None
+    seconds: float | None = None
+
+    used: int = field(default=0, init=False)
+    reexamined: int = field(default=0, init=False)
+
+
+@dataclass
+class Failure[In]:
+    # Filled in by a parse with the farthest item a leaf parser failed on, and
+    # the leaves that failed there in the order they first did. Reports where
+    # the input stopped making sense even when the parse produced `NoMatch` or
+    # an error from somewhere earlier.
+    position: int = field(default=0, init=False)
+    span: Span = field(default_factory=lambda: Span(0, 0), init=False)
+    expected: list["Parser[In, t.Any, t.Any]"] = field(default_factory=list, init=False)
+
+
+@dataclass
+class Trace:
+    # Ring buffer of the last `capacity` branches tried by ordered choices: the
+    # branch, the position it ran at and the position it returned. Events are
+    # stored in preallocated arrays, so recording one allocates nothing. A
+    # parse given a trace with `on_error` set dumps it there when it produces
+    # an error or `NoMatch`.
+    capacity: int = 4096
+    on_error: t.TextIO | None = None
+
+    recorded: int = field(default=0, init=False)
+    parsers: list[t.Any] = field(init=False, repr=False)
+    positions: array[int] = field(init=False, repr=False)
+    outcomes: array[int] = field(init=False, repr=False)
+    _next: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        self.parsers = [None] * self.capacity
+        self.positions = array("q", bytes(8 * self.capacity))
+        self.outcomes = array("q", bytes(8 * self.capacity))
+
+    def record(self, parser: t.Any, position: int, outcome: int):
+        index = self._next
+        self.parsers[index] = parser
+        self.positions[index] = position
+        self.outcomes[index] = outcome
+        index += 1
+        self._next = 0 if index == self.capacity else index
+        self.recorded += 1
+
+    def events(self) -> list[tuple[t.Any, int, int]]:
+        # The events still in the buffer, oldest first.
+        if self.recorded < self.capacity:
+            indices = range(self._next)
+        else:
+            indices = itertools.chain(
+                range(self._next, self.capacity), range(self._next)
+            )
+        return [
+            (self.parsers[index], self.positions[index], self.outcomes[index])
+            for index in indices
+        ]
+
+    def dump(self, file: t.TextIO | None = None):
+        file = sys.stderr if file is None else file
+        events = self.events()
+        print(f"last {len(events)} of {self.recorded} traced events:", file=file)
+
+        labels = dict[int, str]()
+        for parser, position, outcome in events:
+            if id(parser) not in labels:
+                labels[id(parser)] = label(parser)
+
+            if outcome == NO_MATCH:
+                result = "no match"
+            elif outcome == ERROR:
+                result = "error"
+            else:
+                result = f"match to {outcome}"
+            print(f"{position:>8} {result:<16} {labels[id(parser)]}", file=file)
+
+    def dump_on(self, signum: int, file: t.TextIO | None = None):
+        # Dumps the trace whenever the process receives `signum`, to inspect a
+        # parse that is taking too long while it runs.
+        signal.signal(signum, lambda *_: self.dump(file))
+
+
+def label(parser: t.Any, width: int = 72) -> str:
+    # A one-line description of a traced parser: its rule name if it has one.
+    # Compiled branches are functions that carry the parser they were
+    # generated from, or the `run` of a parser the compiler left alone.
+    match parser:
+        case types.FunctionType():
+            parser = getattr(parser, "parser", parser)
+        case types.MethodType():
+            parser = parser.__self__
+        case _:
+            ...
+
+    if isinstance(parser, Labelled):
+        return t.cast(Labelled[t.Any, t.Any, t.Any], parser).name
+
+    text = repr(parser)
+    return text if len(text) <= width else text[: width - 3] + "..."
+
+
+@dataclass
+class Rule:
+    # What a `Profile` measured for one rule. Times are in nanoseconds.
+    # `inclusive` counts the time of recursive calls once, and `exclusive`
+    # leaves out the time spent in the rules it called. `consumed` counts the
+    # items matched, and `backtracked` the items examined by calls that then
+    # failed to match.
+    calls: int = 0
+    matches: int = 0
+    failures: int = 0
+    errors: int = 0
+    inclusive: int = 0
+    exclusive: int = 0
+    consumed: int = 0
+    backtracked: int = 0
+
+
+@dataclass(slots=True)
+class Frame:
+    # A call of a rule being profiled: its stack of rules, and the time spent
+    # in the rules it called.
+    path: str
+    nested: int = 0
+
+
+@dataclass
+class Profile:
+    # Per-rule statistics over the `Labelled` rules run by the parses it is
+    # given to. `stacks` holds the exclusive time spent under each stack of
+    # rules, keyed on the rule names joined by ";", which is the folded stack
+    # format flame graph tools read.
+    rules: dict[str, Rule] = field(default_factory=dict)
+    stacks: dict[str, int] = field(default_factory=dict)
+
+    _frames: list[Frame] = field(default_factory=list, init=False, repr=False)
+    _active: dict[str, int] = field(default_factory=dict, init=False, repr=False)
+
+    def run[
+        In
+    ](
+        self,
+        name: str,
+        run: t.Callable[["State[In]", int], int],
+        state: "State[In]",
+        position: int,
+    ) -> int:
+        frames = self._frames
+        path = f"{frames[-1].path};{name}" if frames else name
+        frame = Frame(path)
+        frames.append(frame)
+        active = self._active.get(name, 0)
+        self._active[name] = active + 1
+
+        # `reach` is restarted so that the items examined by this call alone
+        # are known afterwards.
+        outer = state.reach
+        state.reach = position
+        start = time.perf_counter_ns()
+        try:
+            pos = run(state, position)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            frames.pop()
+            self._active[name] = active
+
+        reach = state.reach
+        state.reach = outer if outer > reach else reach
+
+        try:
+            rule = self.rules[name]
+        except KeyError:
+            rule = self.rules[name] = Rule()
+
+        rule.calls += 1
+        if pos >= 0:
+            rule.matches += 1
+            rule.consumed += pos - position
+        elif pos == NO_MATCH:
+            rule.failures += 1
+            rule.backtracked += reach - position
+        else:
+            rule.errors += 1
+
+        exclusive = elapsed - frame.nested
+        if not active:
+            rule.inclusive += elapsed
+        rule.exclusive += exclusive
+        self.stacks[path] = self.stacks.get(path, 0) + exclusive
+        if frames:
+            frames[-1].nested += elapsed
+        return pos
+
+    def folded(self) -> str:
+        return "".join(f"{path} {elapsed}\n" for path, elapsed in self.stacks.items())
+
+    def report(self) -> str:
+        # The rules as a table, the most expensive first.
+        lines = [
+            f"{'rule':<24} {'calls':>8} {'match':>8} {'fail':>8} {'error':>6}"
+            f" {'incl ms':>9} {'excl ms':>9} {'consumed':>9} {'backtrack':>9}"
+        ]
+        for name, rule in sorted(
+            self.rules.items(), key=lambda entry: entry[1].exclusive, reverse=True
+        ):
+            lines.append(
+                f"{name:<24} {rule.calls:>8} {rule.matches:>8} {rule.failures:>8}"
+                f" {rule.errors:>6} {rule.inclusive / 1e6:>9.2f}"
+                f" {rule.exclusive / 1e6:>9.2f} {rule.consumed:>9}"
+                f" {rule.backtracked:>9}"
+            )
+        return "\n".join(lines)
+
+
+class Exhausted(Exception):
+    def __init__(self, position: int):
+        self.position = position
+
+
+@dataclass(slots=True)
+class State[In]:
+    # Per-parse state shared by every parser invoked by one `Parser.parse`.
+    # `item` holds the item of the most recent match and `error` the error of
+    # the most recent failure; both are only valid directly after the call
+    # that produced them.
+    #
+    # `reach` is one past the farthest item examined by a parser that failed to
+    # match, within the current branch of the innermost ordered choice. `fuel`
+    # is the number of steps left before the budget has to be consulted.
+    #
+    # `committed` holds the error of the last `Cut` passed within the current
+    # branch of the innermost ordered choice, and `cut` the farthest position
+    # a `Cut` has passed, behind which no memoized result is needed again.
+    #
+    # Unlike `reach`, `farthest` is never reset: it is one past the farthest
+    # item any leaf parser failed on during the parse, and `expected` holds
+    # the leaves that failed there, keyed on identity.
+    #
+    # `memos` holds the table of each `Memoized` parser run, keyed on the
+    # parser's identity, so that no result outlives the parse.
+    input: Stream[In]
+    budget: Budget[t.Any] | None = None
+    trace: Trace | None = None
+    profile: Profile | None = None
+    items: t.Sequence[In] = field(init=False, repr=False)
+    spans: t.Sequence[span.Spanned[In]] = field(init=False, repr=False)
+    item: t.Any = field(default=None, init=False, repr=False)
+    error: t.Any = field(default=None, init=False, repr=False)
+    reach: int = field(default=0, init=False, repr=False)
+    reexamined: int = field(default=0, init=False)
+    fuel: int = field(default=sys.maxsize, init=False, repr=False)
+    allotted: int = field(default=0, init=False, repr=False)
+    deadline: float | None = field(default=None, init=False, repr=False)
+    committed: t.Any = field(default=None, init=False, repr=False)
+    cut: int = field(default=0, init=False, repr=False)
+    farthest: int = field(default=0, init=False, repr=False)
+    expected: dict[int, "Parser[In, t.Any, t.Any]"] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    memos: dict[int, "Memo"] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.items = self.input.items
+        self.spans = self.input.spans
+
+        if self.budget is not None:
+            self.fuel = 0
+            if self.budget.seconds is not None:
+                self.deadline = time.monotonic() + self.budget.seconds
+
+    def fail(self, reach: int, expected: "Parser[In, t.Any, t.Any]") -> int:
+        # Called by a leaf parser that examined items up to `reach` and failed
+        # to match.
+        if reach > self.reach:
+            self.reach = reach
+        if reach >= self.farthest:
+            if reach > self.farthest:
+                self.farthest = reach
+                self.expected = {}
+            self.expected[id(expected)] = expected
+        return NO_MATCH
+
+    def recall(self, farthest: int, expected: dict[int, "Parser[In, t.Any, t.Any]"]):
+        # Records the failures of leaves that ran apart from this state, such
+        # as those of a memoized result, as if they had failed here.
+        if farthest > self.farthest:
+            self.farthest = farthest
+            self.expected = dict(expected)
+        elif farthest == self.farthest:
+            self.expected.update(expected)
+
+    def refuel(self, position: int):
+        # Called by a step that found `fuel` exhausted. Either grants more fuel,
+        # counting that step, or stops the parse.
+        budget = self.budget
+        assert budget is not None
+
+        steps = budget.steps
+        if steps is not None and self.allotted >= steps:
+            raise Exhausted(position)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise Exhausted(position)
+
+        grant = sys.maxsize if self.deadline is None else CLOCK_INTERVAL
+        if steps is not None:
+            grant = min(grant, steps - self.allotted)
+
+        self.allotted += grant
+        self.fuel = grant - 1
+
+    def used(self) -> int:
+        return self.allotted - max(self.fuel, 0)
+
+    def abandon(self, position: int) -> int:
+        # Turns a `NoMatch` from `position` after a `Cut` into the cut's error,
+        # reported at the farthest item examined.
+        self.error = PR.Error(
+            self.committed,
+            self.span(self.reach - 1 if self.reach > position else position),
+        )
+        return ERROR
+
+    def span(self, position: int) -> Span:
+        if position < len(self.spans):
+            return self.spans[position].span
+        if self.spans:
+            return self.spans[-1].span
+        return Span(0, 0)
+
+    def result[Out, Err](self, position: int) -> ParseResult.Type[In, Out, Err]:
+        if position >= 0:
+            return PR.Match(self.item, self.input.at(position))
+        if position == NO_MATCH and self.committed is None:
+            return PR.NoMatch
+        if position == NO_MATCH:
+            self.abandon(self.input.position)
+        return self.error
+
+    def step[Out, Err](self, position: int) -> ParseResult.Step[Out, Err]:
+        if position >= 0:
+            return self.item, position
+        if position == NO_MATCH and self.committed is None:
+            return PR.NoMatch
+        if position == NO_MATCH:
+            self.abandon(self.input.position)
+        return self.error
+
+    def resume[Out, Err](self, result: ParseResult.Type[In, Out, Err]) -> int:
+        match result:
+            case PR.Match(item, remaining):
+                self.item = item
+                return remaining.position
+            case PR.Error() as error:
+                self.error = error
+                return ERROR
+            case _:
+                return NO_MATCH
+
+    def resume_step[Out, Err](self, step: ParseResult.Step[Out, Err]) -> int:
+        match step:
+            case (item, position):
+                self.item = item
+                return position
+            case PR.Error() as error:
+                self.error = error
+                return ERROR
+            case _:
+                return NO_MATCH
+
+
+@dataclass(frozen=True)
+class First:
+    # The FIRST set of a parser: the items it can begin a match with. A parser
+    # is guaranteed to produce `PR.NoMatch` when the next item is not in
+    # `items`, unless it is `nullable`, in which case it may instead match
+    # without consuming anything. `items is None` means the set is unknown, and
+    # the parser has to be tried on every input.
+    class Kind(Enum):
+        End = 0
+        Other = 1
+
+    End: t.ClassVar[t.Literal[Kind.End]] = Kind.End
+    Other: t.ClassVar[t.Literal[Kind.Other]] = Kind.Other
+
+    items: frozenset[t.Any] | None
+    nullable: bool = False
+
+    @staticmethod
+    def of(items: t.Iterable[t.Any]) -> "First":
+        try:
+            return First(frozenset(items))
+        except TypeError:
+            return First.unknown()
+
+    @staticmethod
+    def unknown() -> "First":
+        return First(None)
+
+    def optional(self) -> "First":
+        return First(self.items, nullable=True)
+
+    def union(self, other: "First") -> "First":
+        if self.items is None or other.items is None:
+            return First.unknown()
+        return First(self.items | other.items, self.nullable or other.nullable)
+
+    def then(self, other: t.Callable[[], "First"]) -> "First":
+        if self.items is None or not self.nullable:
+            return self
+        return First(self.items).union(other())
+
+
+@dataclass
+class Dispatch[In, Out, Err]:
+    # Predictive dispatch table for an ordered choice. `table` maps an upcoming
+    # item to the branches that could match it, in their original order.
+    # `fallback` holds the branches that must be tried for any other item:
+    # those with an unknown FIRST set, and nullable ones.
+    branches: tuple["Parser[In, Out, Err]", ...]
+    table: dict[t.Any, tuple["Parser[In, Out, Err]", ...]]
+    fallback: tuple["Parser[In, Out, Err]", ...]
+
+    @staticmethod
+    def build(branches: t.Sequence["Parser[In, Out, Err]"]) -> "Dispatch[In, Out, Err]":
+        table = dict[t.Any, list[Parser[In, Out, Err]]]()
+        fallback = list[Parser[In, Out, Err]]()
+
+        firsts = [branch.first_set() for branch in branches]
+        for first in firsts:
+            for key in first.items or ():
+                table.setdefault(key, [])
+
+        for branch, first in zip(branches, firsts):
+            if first.items is None or first.nullable:
+                fallback.append(branch)
+                for entry in table.values():
+                    entry.append(branch)
+            else:
+                for key in first.items:
+                    table[key].append(branch)
+
+        return Dispatch(
+            tuple(branches),
+            {key: tuple(entry) for key, entry in table.items()},
+            tuple(fallback),
+        )
+
+    def select(
+        self, items: t.Sequence[In], position: int
+    ) -> tuple["Parser[In, Out, Err]", ...]:
+        if not self.table:
+            return self.fallback
+
+        try:
+            item = items[position]
+        except IndexError:
+            item = First.End
+
+        try:
+            return self.table.get(item, self.fallback)
+        except TypeError:
+            # Unhashable items cannot be in any known FIRST set.
+            return self.fallback
+
+    def backtracking(self) -> dict[t.Any, int]:
+        # Items for which more than one branch may have to be tried, mapped to
+        # the number of branches. Items outside of the table are reported
+        # under `First.Other`.
+        counts = {key: len(branches) for key, branches in self.table.items()}
+        counts[First.Other] = len(self.fallback)
+        return {key: count for key, count in counts.items() if count > 1}
+
+
 class Parser[In, Out, Err](ABC):
-    @abstractmethod
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
+    # Parsers run over an integer cursor into a shared buffer via `run`, which
+    # returns the position after the match or `NO_MATCH`/`ERROR`, leaving the
+    # item or error in `state`. `parse` is the public boundary that converts
+    # this back into a `ParseResult`, and `parse_at` into an `(item, position)`
+    # step. Subclasses implement `run`, or may override `parse_at` or `parse`
+    # alone, in which case `run` falls back to calling them.
+    def parse(
+        self,
+        input: Stream[In],
+        budget: Budget[Err] | None = None,
+        failure: Failure[In] | None = None,
+        trace: Trace | None = None,
+        profile: Profile | None = None,
+    ) -> ParseResult.Type[In, Out, Err]:
+        state = State(input, budget, trace, profile)
+        try:
+            position = self.run(state, input.position)
+        except Exhausted as exhausted:
+            assert budget is not None
+            state.error = PR.Error(budget.error, state.span(exhausted.position))
+            position = ERROR
+
+        if budget is not None:
+            budget.used = state.used()
+            budget.reexamined = state.reexamined
+        if failure is not None:
+            failure.position = max(state.farthest - 1, input.position)
+            failure.span = state.span(failure.position)
+            failure.expected = list(state.expected.values())
+
+        result = state.result(position)
+        if trace is not None and trace.on_error is not None and position < 0:
+            trace.dump(trace.on_error)
+        return result
+
+    def parse_at(self, input: Stream[In], position: int) -> ParseResult.Step[Out, Err]:
+        state = State(input)
+        return state.step(self.run(state, position))
+
+    def run(self, state: State[In], position: int) -> int:
+        if type(self).parse_at is not Parser.parse_at:
+            return state.resume_step(self.parse_at(state.input, position))
+        if type(self).parse is not Parser.parse:
+            return state.resume(self.parse(state.input.at(position)))
         raise NotImplementedError()
 
+    def first_set(self) -> First:
+        return First.unknown()
+
+    def children(self) -> t.Iterator["Parser[In, t.Any, Err]"]:
+        if not dataclasses.is_dataclass(self):
+            return
+
+        for fld in dataclasses.fields(self):
+            value = getattr(self, fld.name)
+            if isinstance(value, Parser):
+                yield t.cast(Parser[In, t.Any, Err], value)
+            elif isinstance(value, (tuple, list)):
+                for element in t.cast(t.Sequence[t.Any], value):
+                    if isinstance(element, Parser):
+                        yield t.cast(Parser[In, t.Any, Err], element)
+
     @t.final
     def alternative[
         U
@@ -102,6 +672,14 @@ class Parser[In, Out, Err](ABC):
     ) -> "ThenWithContext[In, Out, SecondOut, Err]":
         return ThenWithContext(self, other_func)
 
+    @t.final
+    def then_with[
+        SecondOut
+    ](
+        self, other_func: t.Callable[[Out], "Parser[In, SecondOut, Err]"]
+    ) -> "ThenWith[In, Out, SecondOut, Err]":
+        return ThenWith(self, other_func)
+
     @t.final
     def separated_by[
         U
@@ -130,10 +708,18 @@ class Parser[In, Out, Err](ABC):
     def require(self, kind: Err) -> "Require[In, Out, Err]":
         return Require(self, kind)
 
+    @t.final
+    def cut(self, kind: Err) -> "Cut[In, Out, Err]":
+        return Cut(self, kind)
+
     @t.final
     def spanned(self) -> "Spanned[In, Out, Err]":
         return Spanned(self)
 
+    @t.final
+    def labelled(self, name: str) -> "Labelled[In, Out, Err]":
+        return Labelled(self, name)
+
     @t.final
     def map[U](self, func: t.Callable[[Out], U]) -> "Map[In, Out, U, Err]":
         return Map(self, func)
@@ -160,6 +746,10 @@ class Parser[In, Out, Err](ABC):
     def boolean(self) -> "Boolean[In, Err]":
         return Boolean(self)
 
+    @t.final
+    def memoized(self, capacity: int = 1024) -> "Memoized[In, Out, Err]":
+        return Memoized(self, capacity)
+
 
 @dataclass
 class Require[In, Out, Err](Parser[In, Out, Err]):
@@ -167,14 +757,58 @@ class Require[In, Out, Err](Parser[In, Out, Err]):
     error: Err
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
-        match self.required.parse(input):
-            case PR.Match(item, pos):
-                return PR.Match(item, pos)
-            case PR.NoMatch:
-                return PR.Error(self.error, input.spans[input.position - 1].span)
-            case PR.Error() as errs:
-                return errs
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.required.run(state, position)
+        if pos == NO_MATCH:
+            state.error = PR.Error(self.error, state.spans[position - 1].span)
+            return ERROR
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return First.unknown()
+
+
+@dataclass
+class Cut[In, Out, Err](Parser[In, Out, Err]):
+    # Commits the innermost enclosing ordered choice to the current branch once
+    # `parser` has matched: if the branch goes on to produce `NoMatch`, the
+    # choice produces `error` instead of trying the remaining branches.
+    # Positions before the match are not backtracked to again, so memoized
+    # results for them are dropped.
+    parser: Parser[In, Out, Err]
+    error: Err
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.parser.run(state, position)
+        if pos >= 0:
+            state.committed = self.error
+            if pos > state.cut:
+                state.cut = pos
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
+
+
+@dataclass
+class Labelled[In, Out, Err](Parser[In, Out, Err]):
+    # Names a rule of the grammar, for traces, grammar issues and profiles.
+    # Without a `Profile`, `parser` runs as if it were not labelled.
+    parser: Parser[In, Out, Err]
+    name: str
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        if state.profile is None:
+            return self.parser.run(state, position)
+        return state.profile.run(self.name, self.parser.run, state, position)
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
 
 
 @dataclass
@@ -182,21 +816,17 @@ class Spanned[In, Out, Err](Parser[In, span.Spanned[Out], Err]):
     parser: Parser[In, Out, Err]
 
     @t.override
-    def parse(self, input: Stream[In]) -> PR.Type[In, span.Spanned[Out], Err]:
-        match self.parser.parse(input):
-            case PR.Match(item, pos):
-                return PR.Match(
-                    span.Spanned(
-                        item,
-                        input.spans[input.position].span
-                        + pos.spans[pos.position - 1].span,
-                    ),
-                    pos,
-                )
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as err:
-                return err
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.parser.run(state, position)
+        if pos >= 0:
+            state.item = span.Spanned(
+                state.item, state.spans[position].span + state.spans[pos - 1].span
+            )
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
 
 
 @dataclass
@@ -204,25 +834,22 @@ class Alternative[In, FirstOut, SecondOut, Err](Parser[In, FirstOut | SecondOut,
     first_choice: Parser[In, FirstOut, Err]
     second_choice: Parser[In, SecondOut, Err]
 
+    _dispatch: Dispatch[In, FirstOut | SecondOut, Err] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
     @t.override
-    def parse(
-        self, input: Stream[In]
-    ) -> ParseResult.Type[In, FirstOut | SecondOut, Err]:
-        match self.first_choice.parse(input):
-            case PR.Match(item, pos):
-                return PR.Match(item, pos)
-            case PR.NoMatch:
-                ...
-            case PR.Error() as errors:
-                return errors
-
-        match self.second_choice.parse(input):
-            case PR.Match(item, pos):
-                return PR.Match(item, pos)
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as errors:
-                return errors
+    def run(self, state: State[In], position: int) -> int:
+        return attempt(state, self.dispatch(), position, self)
+
+    @t.override
+    def first_set(self) -> First:
+        return self.first_choice.first_set().union(self.second_choice.first_set())
+
+    def dispatch(self) -> Dispatch[In, FirstOut | SecondOut, Err]:
+        if self._dispatch is None:
+            self._dispatch = Dispatch.build(branches(self))
+        return self._dispatch
 
 
 @dataclass
@@ -231,14 +858,15 @@ class To[In, Out, Into, Err](Parser[In, Into, Err]):
     convert_to: Into
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Into, Err]:
-        match self.parser.parse(input):
-            case PR.Match(_, pos):
-                return PR.Match(self.convert_to, pos)
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as error:
-                return error
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.parser.run(state, position)
+        if pos >= 0:
+            state.item = self.convert_to
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
 
 
 @dataclass
@@ -247,26 +875,20 @@ class Then[In, FirstOut, SecondOut, Err](Parser[In, tuple[FirstOut, SecondOut],
     second: Parser[In, SecondOut, Err]
 
     @t.override
-    def parse(
-        self, input: Stream[In]
-    ) -> ParseResult.Type[In, tuple[FirstOut, SecondOut], Err]:
-        first_result = self.first.parse(input)
-
-        match first_result:
-            case PR.Match():
-                ...
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as err:
-                return err
-
-        match self.second.parse(first_result.remaining):
-            case PR.Match(second_item, pos):
-                return PR.Match((first_result.item, second_item), pos)
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as error:
-                return error
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.first.run(state, position)
+        if pos < 0:
+            return pos
+
+        first_item = state.item
+        pos = self.second.run(state, pos)
+        if pos >= 0:
+            state.item = (first_item, state.item)
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.first.first_set().then(self.second.first_set)
 
 
 @dataclass
@@ -277,29 +899,44 @@ class ThenWithContext[In, Context, SecondOut, Err](
     second: t.Callable[[Context, Stream[In]], ParseResult.Type[In, SecondOut, Err]]
 
     @t.override
-    def parse(
-        self, input: Stream[In]
-    ) -> ParseResult.Type[In, tuple[Context, SecondOut], Err]:
-        first_result = self.first.parse(input)
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.first.run(state, position)
+        if pos < 0:
+            return pos
+
+        context = state.item
+        pos = state.resume(self.second(context, state.input.at(pos)))
+        if pos >= 0:
+            state.item = (context, state.item)
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.first.first_set().then(First.unknown)
+
+
+@dataclass
+class ThenWith[In, Context, SecondOut, Err](Parser[In, tuple[Context, SecondOut], Err]):
+    # Like `ThenWithContext`, but `second` returns the parser to continue with
+    # rather than running it, so the continuation runs within the same parse.
+    first: Parser[In, Context, Err]
+    second: t.Callable[[Context], Parser[In, SecondOut, Err]]
 
-        match first_result:
-            case PR.Match():
-                ...
-            case PR.NoMatch as nm:
-                return nm
-            case PR.Error() as err:
-                return err
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.first.run(state, position)
+        if pos < 0:
+            return pos
 
-        context = first_result.item
-        first_pos = first_result.remaining
+        context = state.item
+        pos = self.second(context).run(state, pos)
+        if pos >= 0:
+            state.item = (context, state.item)
+        return pos
 
-        match self.second(context, first_pos):
-            case PR.Match(second_item, pos):
-                return PR.Match((context, second_item), pos)
-            case PR.NoMatch as nm:
-                return nm
-            case PR.Error() as err:
-                return err
+    @t.override
+    def first_set(self) -> First:
+        return self.first.first_set().then(First.unknown)
 
 
 @dataclass
@@ -308,12 +945,15 @@ class IgnoreThen[In, IgnoreOut, Out, Err](Parser[In, Out, Err]):
     second: Parser[In, Out, Err]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
-        match self.first.parse(input):
-            case PR.Match(_, pos):
-                return self.second.parse(pos)
-            case no_match_or_err:
-                return no_match_or_err
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.first.run(state, position)
+        if pos < 0:
+            return pos
+        return self.second.run(state, pos)
+
+    @t.override
+    def first_set(self) -> First:
+        return self.first.first_set().then(self.second.first_set)
 
 
 @dataclass
@@ -322,16 +962,20 @@ class ThenIgnore[In, Out, IgnoreOut, Err](Parser[In, Out, Err]):
     second: Parser[In, IgnoreOut, Err]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
-        match self.first.parse(input):
-            case PR.Match(item, pos):
-                match self.second.parse(pos):
-                    case PR.Match(_, pos):
-                        return PR.Match(item, pos)
-                    case no_match_or_err:
-                        return no_match_or_err
-            case no_match_or_err:
-                return no_match_or_err
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.first.run(state, position)
+        if pos < 0:
+            return pos
+
+        item = state.item
+        pos = self.second.run(state, pos)
+        if pos >= 0:
+            state.item = item
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.first.first_set().then(self.second.first_set)
 
 
 @dataclass
@@ -344,7 +988,7 @@ class SeparatedBy[In, Out, Sep, Err](Parser[In, list[Out], Err]):
     _at_least: int = 0
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, list[Out], Err]:
+    def run(self, state: State[In], position: int) -> int:
         # The general pattern is this:
         #   ````
         #   self.parser
@@ -364,53 +1008,61 @@ class SeparatedBy[In, Out, Sep, Err](Parser[In, list[Out], Err]):
         #       c. Chain these to form one list.
         #   3. If self._allow_trailing, try to parse a separator.
 
-        pos = input
+        pos = position
 
         if self._allow_leading:
-            match self.separator.parse(pos):
-                case PR.Match(_, pos):
-                    ...
-                case PR.NoMatch:
-                    ...
-                case PR.Error() as error:
-                    return error
-
-        match self.parser.parse(pos):
-            case PR.Match(first_item, pos):
-                ...
-            case PR.NoMatch:
-                if self._at_least > 0:
-                    return PR.NoMatch
-                return PR.Match([], input)
-            case PR.Error() as error:
-                return error
-
-        rest = (
-            self.separator.ignore_then(self.parser)
-            .repeated()
-            .at_least(self._at_least - 1)
-        )
-
-        match rest.parse(pos):
-            case PR.Match(items, pos):
-                ...
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as error:
-                return error
-
-        items.insert(0, first_item)
+            leading = self.separator.run(state, pos)
+            if leading == ERROR:
+                return ERROR
+            if leading >= 0:
+                pos = leading
+
+        pos = self.parser.run(state, pos)
+        if pos == NO_MATCH:
+            if self._at_least > 0:
+                return NO_MATCH
+            state.item = []
+            return position
+        if pos == ERROR:
+            return ERROR
+
+        items = [state.item]
+
+        # Separator followed by item, repeated. A separator that is not
+        # followed by an item is left unconsumed.
+        while True:
+            after = self.separator.run(state, pos)
+            if after >= 0:
+                after = self.parser.run(state, after)
+            if after == NO_MATCH:
+                break
+            if after == ERROR:
+                return ERROR
+            items.append(state.item)
+            pos = after
+
+        if len(items) < self._at_least:
+            return NO_MATCH
 
         if self._allow_trailing:
-            match self.separator.parse(pos):
-                case PR.Match(_, pos):
-                    ...
-                case PR.NoMatch:
-                    ...
-                case PR.Error() as error:
-                    return error
+            trailing = self.separator.run(state, pos)
+            if trailing == ERROR:
+                return ERROR
+            if trailing >= 0:
+                pos = trailing
 
-        return PR.Match(items, pos)
+        state.item = items
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        first = self.parser.first_set()
+        if self._allow_leading:
+            leading = self.separator.first_set().optional()
+            first = leading.then(self.parser.first_set)
+        if self._at_least <= 0:
+            first = first.optional()
+        return first
 
     def allow_leading(self) -> t.Self:
         other = copy.copy(self)
@@ -435,8 +1087,26 @@ class DelimitedBy[In, Out, Start, End, Err](Parser[In, Out, Err]):
     end: Parser[In, End, Err]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
-        return self.start.ignore_then(self.parser).then_ignore(self.end).parse(input)
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.start.run(state, position)
+        if pos < 0:
+            return pos
+
+        pos = self.parser.run(state, pos)
+        if pos < 0:
+            return pos
+
+        item = state.item
+        pos = self.end.run(state, pos)
+        if pos >= 0:
+            state.item = item
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return (
+            self.start.first_set().then(self.parser.first_set).then(self.end.first_set)
+        )
 
 
 @dataclass
@@ -444,14 +1114,19 @@ class OrNot[In, Out, Err](Parser[In, Maybe.Type[Out], Err]):
     maybe: Parser[In, Out, Err]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Maybe.Type[Out], Err]:
-        match self.maybe.parse(input):
-            case PR.Match(item, remaining):
-                return PR.Match(Maybe.Just(item), remaining)
-            case PR.NoMatch:
-                return PR.Match(Maybe.Nothing, input)
-            case PR.Error() as errors:
-                return errors
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.maybe.run(state, position)
+        if pos >= 0:
+            state.item = Maybe.Just(state.item)
+            return pos
+        if pos == NO_MATCH:
+            state.item = Maybe.Nothing
+            return position
+        return ERROR
+
+    @t.override
+    def first_set(self) -> First:
+        return self.maybe.first_set().optional()
 
 
 @dataclass
@@ -460,14 +1135,16 @@ class OrElse[In, Out, Err](Parser[In, Out, Err]):
     default: Out
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
-        match self.maybe.parse(input):
-            case PR.Match(item, remaining):
-                return PR.Match(item, remaining)
-            case PR.NoMatch:
-                return PR.Match(self.default, input)
-            case PR.Error() as errors:
-                return errors
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.maybe.run(state, position)
+        if pos == NO_MATCH:
+            state.item = self.default
+            return position
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.maybe.first_set().optional()
 
 
 @dataclass
@@ -476,29 +1153,34 @@ class Map[In, Out, Mapped, Err](Parser[In, Mapped, Err]):
     mapper: t.Callable[[Out], Mapped]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Mapped, Err]:
-        match self.parser.parse(input):
-            case PR.Match(item, pos):
-                return PR.Match(self.mapper(item), pos)
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as errors:
-                return errors
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.parser.run(state, position)
+        if pos >= 0:
+            state.item = self.mapper(state.item)
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
 
 
 @dataclass
 class Filter[In, Err](Parser[In, In, Err]):
     func: t.Callable[[In], bool]
+    # What the filter accepts, for error messages.
+    label: str | None = None
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, In, Err]:
-        match input.peek():
-            case Maybe.Just(spanned):
-                if self.func(spanned.item):
-                    return PR.Match(spanned.item, input.advance())
-                return PR.NoMatch
-            case Maybe.Nothing:
-                return PR.NoMatch
+    def run(self, state: State[In], position: int) -> int:
+        try:
+            item = state.items[position]
+        except IndexError:
+            return state.fail(position + 1, self)
+
+        if self.func(item):
+            state.item = item
+            return position + 1
+        return state.fail(position + 1, self)
 
 
 @dataclass
@@ -507,16 +1189,15 @@ class AndCheck[In, Out, Err](Parser[In, Out, Err]):
     predicate: t.Callable[[Out], bool]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
-        match self.parser.parse(input):
-            case PR.Match(item, remaining):
-                if self.predicate(item):
-                    return PR.Match(item, remaining)
-                return PR.NoMatch
-            case PR.NoMatch:
-                return PR.NoMatch
-            case PR.Error() as errors:
-                return errors
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.parser.run(state, position)
+        if pos >= 0 and not self.predicate(state.item):
+            return state.fail(pos, self)
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
 
 
 @dataclass
@@ -525,20 +1206,30 @@ class Repeated[In, Out, Err](Parser[In, list[Out], Err]):
     _at_least: int = 0
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, list[Out], Err]:
+    def run(self, state: State[In], position: int) -> int:
         items = list[Out]()
 
         while True:
-            match self.parser.parse(input):
-                case PR.Match(item, pos):
-                    input = pos
-                    items.append(item)
-                case PR.NoMatch:
-                    if len(items) < self._at_least:
-                        return PR.NoMatch
-                    return PR.Match(items, input)
-                case PR.Error() as err:
-                    return err
+            pos = self.parser.run(state, position)
+            if pos < 0:
+                break
+            items.append(state.item)
+            position = pos
+
+        if pos == ERROR:
+            return ERROR
+        if len(items) < self._at_least:
+            return NO_MATCH
+
+        state.item = items
+        return position
+
+    @t.override
+    def first_set(self) -> First:
+        first = self.parser.first_set()
+        if self._at_least <= 0:
+            return first.optional()
+        return first
 
     def at_least(self, minimum: int) -> t.Self:
         other = copy.copy(self)
@@ -551,14 +1242,20 @@ class OneOf[In, Err](Parser[In, In, Err]):
     choices: t.Sequence[In]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, In, Err]:
-        match input.peek():
-            case Maybe.Just(spanned):
-                if spanned.item in self.choices:
-                    return PR.Match(spanned.item, input.advance())
-                return PR.NoMatch
-            case Maybe.Nothing:
-                return PR.NoMatch
+    def run(self, state: State[In], position: int) -> int:
+        try:
+            item = state.items[position]
+        except IndexError:
+            return state.fail(position + 1, self)
+
+        if item in self.choices:
+            state.item = item
+            return position + 1
+        return state.fail(position + 1, self)
+
+    @t.override
+    def first_set(self) -> First:
+        return First.of(self.choices)
 
 
 @dataclass
@@ -566,25 +1263,34 @@ class Just[In, Err](Parser[In, In, Err]):
     pattern: In
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, In, Err]:
-        match input.peek():
-            case Maybe.Just(spanned):
-                if spanned.item == self.pattern:
-                    return PR.Match(self.pattern, input.advance())
-                return PR.NoMatch
-            case Maybe.Nothing:
-                return PR.NoMatch
+    def run(self, state: State[In], position: int) -> int:
+        try:
+            item = state.items[position]
+        except IndexError:
+            return state.fail(position + 1, self)
+
+        if item == self.pattern:
+            state.item = self.pattern
+            return position + 1
+        return state.fail(position + 1, self)
+
+    @t.override
+    def first_set(self) -> First:
+        return First.of((self.pattern,))
 
 
 @dataclass
 class Nothing[In, Err](Parser[In, Maybe.Type[In], Err]):
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Maybe.Type[In], Err]:
-        match input.peek():
-            case Maybe.Just():
-                return PR.NoMatch
-            case Maybe.Nothing:
-                return PR.Match(Maybe.Nothing, input.advance())
+    def run(self, state: State[In], position: int) -> int:
+        if position < len(state.items):
+            return state.fail(position + 1, self)
+        state.item = Maybe.Nothing
+        return position
+
+    @t.override
+    def first_set(self) -> First:
+        return First.of((First.End,))
 
 
 @dataclass
@@ -592,14 +1298,19 @@ class Boolean[In, Err](Parser[In, bool, Err]):
     parser: Parser[In, t.Any, Err]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, bool, Err]:
-        match self.parser.parse(input):
-            case PR.Match(_, pos):
-                return PR.Match(True, pos)
-            case PR.NoMatch:
-                return PR.Match(False, input)
-            case PR.Error() as err:
-                return err
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.parser.run(state, position)
+        if pos >= 0:
+            state.item = True
+            return pos
+        if pos == NO_MATCH:
+            state.item = False
+            return position
+        return ERROR
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set().optional()
 
 
 @dataclass
@@ -607,33 +1318,719 @@ class StartsWith[In](Parser[In, t.Sequence[In], t.Any]):
     pattern: t.Sequence[In]
 
     @t.override
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, t.Sequence[In], t.Any]:
-        if input.startswith(self.pattern):
-            return PR.Match(self.pattern, input.advance(len(self.pattern)))
-        return PR.NoMatch
+    def run(self, state: State[In], position: int) -> int:
+        if state.input.startswith(self.pattern, position):
+            state.item = self.pattern
+            return position + len(self.pattern)
+        return state.fail(position + 1, self)
+
+    @t.override
+    def first_set(self) -> First:
+        if len(self.pattern) == 0:
+            return First(frozenset())
+        return First.of((self.pattern[0],))
+
+
+@dataclass(frozen=True)
+class CharClass:
+    # A set of characters, given either explicitly or by a predicate. Predicates
+    # are tabulated over ASCII up front and only called for other characters.
+    members: frozenset[str]
+    predicate: t.Callable[[str], bool] | None = None
+
+    def __contains__(self, char: str) -> bool:
+        if char in self.members:
+            return True
+        return self.predicate is not None and char >= "\x80" and self.predicate(char)
+
+    def exact(self) -> bool:
+        return self.predicate is None
+
+
+@dataclass
+class TakeWhile[Err](Parser[str, str, Err]):
+    # Consumes the longest run of characters in `members` and produces it as a
+    # single slice of the input, which should be a `str`.
+    members: CharClass
+    _at_least: int = 0
+
+    @t.override
+    def run(self, state: State[str], position: int) -> int:
+        items = state.items
+        size = len(items)
+        members = self.members.members
+        predicate = self.members.predicate
+        end = position
+
+        while end < size:
+            char = items[end]
+            if char not in members and (
+                predicate is None or char < "\x80" or not predicate(char)
+            ):
+                break
+            end += 1
+
+        if end - position < self._at_least:
+            return state.fail(end + 1, self)
+
+        state.item = items[position:end]
+        return end
+
+    @t.override
+    def first_set(self) -> First:
+        if not self.members.exact():
+            return First.unknown()
+
+        first = First(self.members.members)
+        if self._at_least <= 0:
+            return first.optional()
+        return first
+
+
+@dataclass
+class Trie[Out, Err](Parser[str, Out, Err]):
+    # Produces the value of the longest spelling in `table` that the input
+    # starts with. The spellings are walked as a trie, one dict probe per
+    # character. Each node, from `root` on, maps the next character to its
+    # child, and the empty string to the value of the spelling ending there.
+    table: t.Mapping[str, Out]
+
+    root: dict[str, t.Any] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.root = {}
+        for spelling, value in self.table.items():
+            node = self.root
+            for char in spelling:
+                node = node.setdefault(char, {})
+            node[""] = value
+
+    @t.override
+    def run(self, state: State[str], position: int) -> int:
+        items = state.items
+        size = len(items)
+        node = self.root
+        pos = position
+        end = NO_MATCH
+        value = None
+
+        while pos < size:
+            node = node.get(items[pos])
+            if node is None:
+                break
+            pos += 1
+            if "" in node:
+                end = pos
+                value = node[""]
+
+        if end == NO_MATCH:
+            return state.fail(pos + 1, self)
+
+        state.item = value
+        return end
+
+    @t.override
+    def first_set(self) -> First:
+        return First.of(spelling[0] for spelling in self.table if spelling)
 
 
 @dataclass
 class Choice[In, Out, Err](Parser[In, Out, Err]):
     choices: t.Iterable[Parser[In, Out, Err]]
 
-    def parse(self, input: Stream[In]) -> ParseResult.Type[In, Out, Err]:
+    _dispatch: Dispatch[In, Out, Err] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        return attempt(state, self.dispatch(), position, self)
+
+    @t.override
+    def first_set(self) -> First:
+        first = First(frozenset())
         for choice in self.choices:
-            match choice.parse(input):
-                case PR.Match(item, pos):
-                    return PR.Match(item, pos)
-                case PR.NoMatch:
-                    continue
-                case PR.Error() as errors:
-                    return errors
+            first = first.union(choice.first_set())
+        return first
+
+    def dispatch(self) -> Dispatch[In, Out, Err]:
+        if self._dispatch is None:
+            self._dispatch = Dispatch.build(branches(self))
+        return self._dispatch
+
+
+@dataclass(slots=True)
+class Memo:
+    # The table of a `Memoized` parser for one parse, keyed on position.
+    # `floor` is the farthest `Cut` the table was pruned to.
+    table: OrderedDict[
+        int, tuple[int, t.Any, int, t.Any, int, dict[int, t.Any]]
+    ] = field(default_factory=OrderedDict)
+    floor: int = 0
+
+    def prune(self, cut: int):
+        for position in [position for position in self.table if position < cut]:
+            del self.table[position]
+        self.floor = cut
+
+
+@dataclass
+class Memoized[In, Out, Err](Parser[In, Out, Err]):
+    # Packrat-style cache of results keyed on stream position. The table is
+    # kept in the `State` of each parse, so results are never reused by
+    # another parse. It holds at most `capacity` entries, evicting the least
+    # recently used position first. Entries hold the position returned by the
+    # parser, the item or error it left in the `State`, the farthest item it
+    # examined, the error of the `Cut` it passed, if any, which commits the
+    # enclosing choice again when the entry is reused, and the farthest
+    # failure of its leaves, which is recorded again. Entries for
+    # positions behind the farthest `Cut` of the parse are dropped. `hits` and
+    # `misses` are counted over every parse.
+    parser: Parser[In, Out, Err]
+    capacity: int = 1024
+
+    hits: int = field(default=0, compare=False)
+    misses: int = field(default=0, compare=False)
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        memo = state.memos.get(id(self))
+        if memo is None:
+            memo = state.memos[id(self)] = Memo()
+        if state.cut > memo.floor:
+            memo.prune(state.cut)
+        table = memo.table
+
+        try:
+            pos, value, reach, committed, farthest, expected = table[position]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            table.move_to_end(position)
+            if pos >= 0:
+                state.item = value
+            elif pos == ERROR:
+                state.error = value
+            if reach > state.reach:
+                state.reach = reach
+            if committed is not None:
+                state.committed = committed
+            state.recall(farthest, expected)
+            return pos
+
+        # The parser runs as if no `Cut` had been passed, so that its result
+        # does not depend on where it is reused.
+        outer = state.reach
+        outer_committed = state.committed
+        outer_farthest, outer_expected = state.farthest, state.expected
+        state.reach = position
+        state.committed = None
+        state.farthest, state.expected = 0, {}
+        pos = self.parser.run(state, position)
+        reach = state.reach
+        committed = state.committed
+        farthest, expected = state.farthest, state.expected
+        state.reach = outer if outer > reach else reach
+        if committed is None:
+            state.committed = outer_committed
+        state.farthest, state.expected = outer_farthest, outer_expected
+        state.recall(farthest, expected)
+
+        table[position] = (
+            pos,
+            state.item if pos >= 0 else state.error,
+            reach,
+            committed,
+            farthest,
+            expected,
+        )
+        if len(table) > self.capacity:
+            table.popitem(last=False)
+
+        return pos
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
+
+
+@dataclass
+class Recursive[In, Out, Err](Parser[In, Out, Err]):
+    # Forward declaration of a parser, for rules that refer to themselves or to
+    # rules defined after them. The grammar is built once, and `define` ties
+    # the knot before the first parse.
+    parser: Parser[In, Out, Err] | None = None
+
+    _first: First | None = field(default=None, init=False, repr=False, compare=False)
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        if self.parser is None:
+            raise RuntimeError("Recursive parser used before being defined.")
+        return self.parser.run(state, position)
+
+    @t.override
+    def first_set(self) -> First:
+        if self.parser is None:
+            return First.unknown()
+
+        if self._first is None:
+            # A rule reached again while its own FIRST set is being computed
+            # contributes an unknown set, which keeps the result conservative.
+            self._first = First.unknown()
+            self._first = self.parser.first_set()
+        return self._first
 
-        return PR.NoMatch
+    def define(self, parser: Parser[In, Out, Err]):
+        self.parser = parser
+        self._first = None
+
+
+type Shape = int | tuple["Shape", "Shape"]
+
+
+@dataclass
+class Sequence[In, Out, Err](Parser[In, Out, Err]):
+    # Runs `parsers` one after another, in place of a chain of `Then`,
+    # `IgnoreThen`, `ThenIgnore` and `DelimitedBy` flattened by `optimize`.
+    # `shape` rebuilds the item the chain would have produced from the items
+    # of `parsers`, and `mapper` fuses a `Map` over the chain. A sequence that
+    # `resumes` continues after an item parsed elsewhere, which `shape` refers
+    # to as the first item; these are the branches of `Factored`.
+    #
+    # The chain is run by a function generated for it, which keeps the items
+    # in locals instead of collecting them.
+    parsers: tuple[Parser[In, t.Any, Err], ...]
+    shape: Shape
+    mapper: t.Callable[[t.Any], Out] | None = None
+    resumes: bool = False
+
+    _run: t.Callable[..., int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        offset = 1 if self.resumes else 0
+        used = set(shape_indices(self.shape))
+        namespace: dict[str, t.Any] = {"mapper": self.mapper}
+
+        lines = [
+            "def run(state, position, head):"
+            if self.resumes
+            else "def run(state, position):",
+            "    item0 = head" if self.resumes else "    pass",
+            "    pos = position",
+        ]
+        for index, parser in enumerate(self.parsers, offset):
+            namespace[f"run{index}"] = parser.run
+            lines += [
+                f"    pos = run{index}(state, pos)",
+                "    if pos < 0:",
+                "        return pos",
+            ]
+            if index in used:
+                lines.append(f"    item{index} = state.item")
+
+        item = shape_source(self.shape, "item{}".format)
+        if self.mapper is not None:
+            item = f"mapper({item})"
+        lines += [f"    state.item = {item}", "    return pos"]
+
+        exec("\n".join(lines), namespace)
+        self._run = namespace["run"]
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        return self._run(state, position)
+
+    def resume(self, state: State[In], position: int, head: t.Any) -> int:
+        return self._run(state, position, head)
+
+    @t.override
+    def first_set(self) -> First:
+        first = First(frozenset(), nullable=True)
+        for parser in self.parsers:
+            first = first.then(parser.first_set)
+        return first
+
+
+@dataclass
+class Factored[In, Out, Err](Parser[In, Out, Err]):
+    # Adjacent branches of an ordered choice that start with the same parser,
+    # left-factored by `optimize` so that `head` runs once. Each of `tails`
+    # resumes one branch after `head`. Budget steps, reach and cuts are
+    # accounted as if every branch ran `head` again.
+    head: Parser[In, t.Any, Err]
+    tails: tuple[Sequence[In, Out, Err], ...]
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        pos = self.head.run(state, position)
+        if pos < 0:
+            return pos
+
+        head = state.item
+        start = pos
+        base = state.reach
+        committed = state.committed
+        reach = base
+
+        for tail in self.tails:
+            state.fuel -= 1
+            if state.fuel < 0:
+                state.refuel(position)
+
+            state.reach = base
+            state.committed = committed
+            pos = tail.resume(state, start, head)
+            if pos != NO_MATCH or state.committed is not None:
+                # A committed branch is abandoned by the enclosing choice.
+                return pos
+            if state.reach > reach:
+                reach = state.reach
+
+        state.reach = reach
+        return NO_MATCH
+
+    @t.override
+    def first_set(self) -> First:
+        def tails() -> First:
+            first = First(frozenset())
+            for tail in self.tails:
+                first = first.union(tail.first_set())
+            return first
+
+        return self.head.first_set().then(tails)
+
+
+def attempt[
+    In
+](
+    state: State[In],
+    dispatch: Dispatch[In, t.Any, t.Any],
+    position: int,
+    choice: Parser[In, t.Any, t.Any],
+) -> int:
+    # Runs the branches of an ordered choice that `dispatch` selects in order
+    # until one does not produce `NoMatch`, or one that passed a `Cut` does.
+    # Every branch tried is a step of the budget, and the items examined by
+    # failed branches are counted as re-examined by the branches after them.
+    # Branches the dispatch table skipped failed on the upcoming item, which
+    # is recorded against `choice`.
+    branches = dispatch.select(state.items, position)
+    trace = state.trace
+    outer = state.reach
+    committed = state.committed
+    reach = position
+    pos = NO_MATCH
+
+    for branch in branches:
+        state.fuel -= 1
+        if state.fuel < 0:
+            state.refuel(position)
+
+        state.reexamined += reach - position
+        state.reach = position
+        state.committed = None
+        pos = branch.run(state, position)
+        if trace is not None:
+            trace.record(branch, position, pos)
+        if state.reach > reach:
+            reach = state.reach
+        if pos != NO_MATCH:
+            break
+        if state.committed is not None:
+            pos = state.abandon(position)
+            break
+
+    state.reach = outer if outer > reach else reach
+    state.committed = committed
+    if pos == NO_MATCH and len(branches) < len(dispatch.branches):
+        return state.fail(position + 1, choice)
+    return pos
+
+
+def branches[In, Err](parser: Parser[In, t.Any, Err]) -> list[Parser[In, t.Any, Err]]:
+    # Flattens nested ordered choices into a single list of branches.
+    match parser:
+        case Alternative(first_choice, second_choice):
+            return [*branches(first_choice), *branches(second_choice)]
+        case Choice(choices):
+            return [branch for choice in choices for branch in branches(choice)]
+        case _:
+            return [parser]
+
+
+def backtracking[
+    In, Err
+](grammar: Parser[In, t.Any, Err]) -> list[
+    tuple[Alternative[In, t.Any, t.Any, Err] | Choice[In, t.Any, Err], dict[t.Any, int]]
+]:
+    # Walks a grammar and reports every ordered choice that may still try more
+    # than one branch for some upcoming item, along with those items.
+    found = list[
+        tuple[
+            Alternative[In, t.Any, t.Any, Err] | Choice[In, t.Any, Err],
+            dict[t.Any, int],
+        ]
+    ]()
+    seen = set[int]()
+    pending = [grammar]
+
+    while pending:
+        parser = pending.pop()
+        if id(parser) in seen:
+            continue
+        seen.add(id(parser))
+
+        match parser:
+            case Alternative() | Choice():
+                # Nested choices are flattened into this one and never run on
+                # their own, so only the flattened branches are visited.
+                dispatch = parser.dispatch()
+                counts = dispatch.backtracking()
+                if counts:
+                    found.append((parser, counts))
+                pending.extend(dispatch.branches)
+            case _:
+                pending.extend(parser.children())
+
+    return found
+
+
+def shape_source(shape: Shape, name: t.Callable[[int], str]) -> str:
+    # Python source for the item described by `shape`, given the source for
+    # each item it refers to.
+    match shape:
+        case int():
+            return name(shape)
+        case (first, second):
+            return f"({shape_source(first, name)}, {shape_source(second, name)})"
+
+
+def shape_indices(shape: Shape) -> t.Iterator[int]:
+    match shape:
+        case int():
+            yield shape
+        case (first, second):
+            yield from shape_indices(first)
+            yield from shape_indices(second)
+
+
+def optimize[In, Out, Err](grammar: Parser[In, Out, Err]) -> Parser[In, Out, Err]:
+    # Rewrites a built grammar into one that produces the same results with
+    # fewer calls: chains of sequencing combinators become one `Sequence`,
+    # `Map`s over `Map`s and sequences are fused, and adjacent branches of an
+    # ordered choice that start with the same parser are left-factored. The
+    # grammar itself is left untouched.
+    return Optimizer().rewrite(grammar)
+
+
+class Optimizer:
+    def __init__(self):
+        self.rewritten = dict[int, Parser[t.Any, t.Any, t.Any]]()
+
+    def rewrite[In, Out, Err](self, node: Parser[In, Out, Err]) -> Parser[In, Out, Err]:
+        try:
+            return self.rewritten[id(node)]
+        except KeyError:
+            ...
+
+        match node:
+            case Recursive(parser):
+                # Registered before its definition is rewritten, which may
+                # refer back to it.
+                declared = Recursive[In, Out, Err]()
+                self.rewritten[id(node)] = declared
+                if parser is not None:
+                    declared.define(self.rewrite(parser))
+                return declared
+            case Then() | IgnoreThen() | ThenIgnore() | DelimitedBy():
+                parsers = list[Parser[In, t.Any, Err]]()
+                shape = self.flatten(node, parsers)
+                if len(parsers) > 2:
+                    rewritten = Sequence(tuple(parsers), shape)
+                else:
+                    # Running a pair directly is cheaper than collecting items.
+                    rewritten = self.children(node)
+            case Map(parser, mapper):
+                match self.rewrite(parser):
+                    case Sequence(parsers, shape, None, False):
+                        rewritten = Sequence(parsers, shape, mapper)
+                    case Sequence(parsers, shape, first, False):
+                        rewritten = Sequence(parsers, shape, compose(first, mapper))
+                    case Map(parser, first):
+                        rewritten = Map(parser, compose(first, mapper))
+                    case parser:
+                        rewritten = Map(parser, mapper)
+            case Alternative() | Choice():
+                rewritten = self.factor(node)
+            case _:
+                rewritten = self.children(node)
+
+        self.rewritten[id(node)] = rewritten
+        return t.cast(Parser[In, Out, Err], rewritten)
+
+    def flatten(
+        self,
+        node: Parser[t.Any, t.Any, t.Any],
+        parsers: list[Parser[t.Any, t.Any, t.Any]],
+    ) -> Shape:
+        match node:
+            case Then(first, second):
+                return (self.flatten(first, parsers), self.flatten(second, parsers))
+            case IgnoreThen(first, second):
+                self.flatten(first, parsers)
+                return self.flatten(second, parsers)
+            case ThenIgnore(first, second):
+                shape = self.flatten(first, parsers)
+                self.flatten(second, parsers)
+                return shape
+            case DelimitedBy(parser, start, end):
+                self.flatten(start, parsers)
+                shape = self.flatten(parser, parsers)
+                self.flatten(end, parsers)
+                return shape
+            case _:
+                parsers.append(self.rewrite(node))
+                return len(parsers) - 1
+
+    def factor(
+        self,
+        node: Alternative[t.Any, t.Any, t.Any, t.Any] | Choice[t.Any, t.Any, t.Any],
+    ) -> Parser[t.Any, t.Any, t.Any]:
+        groups = list[list[Parser[t.Any, t.Any, t.Any]]]()
+        for branch in map(self.rewrite, branches(node)):
+            if groups and same_head(groups[-1][0], branch):
+                groups[-1].append(branch)
+            else:
+                groups.append([branch])
+
+        factored = list[Parser[t.Any, t.Any, t.Any]]()
+        for group in groups:
+            if len(group) == 1:
+                factored.extend(group)
+                continue
+
+            tails = list[Sequence[t.Any, t.Any, t.Any]]()
+            for branch in group:
+                match branch:
+                    case Sequence(parsers, shape, mapper):
+                        tails.append(Sequence(parsers[1:], shape, mapper, True))
+                    case _:
+                        tails.append(Sequence((), 0, None, True))
+            factored.append(Factored(head(group[0]), tuple(tails)))
+
+        # Kept as a choice even with a single branch, which is where a cut
+        # taken within a factored branch is abandoned.
+        return Choice(tuple(factored))
+
+    def children[
+        In, Out, Err
+    ](self, node: Parser[In, Out, Err]) -> Parser[In, Out, Err]:
+        if not dataclasses.is_dataclass(node):
+            return node
+
+        changes = dict[str, t.Any]()
+        for fld in dataclasses.fields(node):
+            if not fld.init:
+                continue
+
+            value = getattr(node, fld.name)
+            if isinstance(value, Parser):
+                rewritten = self.rewrite(t.cast(Parser[In, t.Any, Err], value))
+                if rewritten is not value:
+                    changes[fld.name] = rewritten
+            elif isinstance(value, (tuple, list)) and any(
+                isinstance(element, Parser)
+                for element in t.cast(t.Sequence[t.Any], value)
+            ):
+                elements = [
+                    self.rewrite(element) if isinstance(element, Parser) else element
+                    for element in t.cast(t.Sequence[t.Any], value)
+                ]
+                if any(
+                    new is not old
+                    for new, old in zip(elements, t.cast(t.Sequence[t.Any], value))
+                ):
+                    changes[fld.name] = type(value)(elements)
+
+        if not changes:
+            return node
+        return dataclasses.replace(node, **changes)
+
+
+def compose[
+    T, U, V
+](first: t.Callable[[T], U], second: t.Callable[[U], V]) -> t.Callable[[T], V]:
+    return lambda item: second(first(item))
+
+
+def head(parser: Parser[t.Any, t.Any, t.Any]) -> Parser[t.Any, t.Any, t.Any]:
+    match parser:
+        case Sequence(parsers) if parsers:
+            return parsers[0]
+        case _:
+            return parser
+
+
+def same_head(
+    first: Parser[t.Any, t.Any, t.Any], second: Parser[t.Any, t.Any, t.Any]
+) -> bool:
+    # Leaves are compared by value, other parsers by identity.
+    match head(first), head(second):
+        case (Just() as one, Just() as other) | (
+            StartsWith() as one,
+            StartsWith() as other,
+        ):
+            return one == other
+        case one, other:
+            return one is other
+
+
+def recursive[
+    In, Out, Err
+](
+    build: t.Callable[[Recursive[In, Out, Err]], Parser[In, Out, Err]] | None = None
+) -> Recursive[In, Out, Err]:
+    # `build` receives the declaration and returns its definition. Without it,
+    # the declaration is defined later through `Recursive.define`.
+    declaration = Recursive[In, Out, Err]()
+    if build is not None:
+        declaration.define(build(declaration))
+    return declaration
+
+
+def char_class(chars: t.Iterable[str] | t.Callable[[str], bool]) -> CharClass:
+    if callable(chars):
+        ascii = (chr(code) for code in range(128))
+        return CharClass(frozenset(char for char in ascii if chars(char)), chars)
+    return CharClass(frozenset(chars))
+
+
+def take_while(
+    chars: CharClass | t.Iterable[str] | t.Callable[[str], bool]
+) -> TakeWhile[t.Any]:
+    if not isinstance(chars, CharClass):
+        chars = char_class(chars)
+    return TakeWhile(chars)
+
+
+def take_while1(
+    chars: CharClass | t.Iterable[str] | t.Callable[[str], bool]
+) -> TakeWhile[t.Any]:
+    if not isinstance(chars, CharClass):
+        chars = char_class(chars)
+    return TakeWhile(chars, 1)
 
 
 def startswith[In](pattern: t.Sequence[In]) -> StartsWith[In]:
     return StartsWith(pattern)
 
 
+def trie[Out](table: t.Mapping[str, Out]) -> Trie[Out, t.Any]:
+    return Trie(table)
+
+
 def filter[In](func: t.Callable[[In], bool]) -> Filter[In, t.Any]:
     return Filter(func)
 
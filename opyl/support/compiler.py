@@ -0,0 +1,804 @@
+# The checker leaves the output type of a parser taken apart by a class
+# pattern unknown, which these would report at every such pattern.
+# pyright: reportUnknownVariableType=false, reportUnknownArgumentType=false
+import typing as t
+from dataclasses import dataclass, field
+import itertools
+
+from opyl.support import span
+from opyl.support.combinator import (
+    Parser,
+    PR,
+    NO_MATCH,
+    ERROR,
+    State,
+    First,
+    Require,
+    Cut,
+    Labelled,
+    Spanned,
+    Alternative,
+    To,
+    Then,
+    ThenWithContext,
+    ThenWith,
+    IgnoreThen,
+    ThenIgnore,
+    SeparatedBy,
+    DelimitedBy,
+    OrNot,
+    OrElse,
+    Map,
+    Filter,
+    AndCheck,
+    Repeated,
+    OneOf,
+    Just,
+    Nothing,
+    Boolean,
+    StartsWith,
+    TakeWhile,
+    Trie,
+    Choice,
+    Memo,
+    Memoized,
+    Recursive,
+    Sequence,
+    Factored,
+    branches,
+    shape_source,
+)
+from opyl.support.union import Maybe
+
+
+# Compiles a combinator graph into specialized Python source. Every combinator
+# that is not a leaf becomes one generated function with the same contract as
+# `Parser.run`. Leaves (`Just`, `Filter`, `OneOf`, `Nothing`, `StartsWith`,
+# `TakeWhile`, `Trie`) are inlined into their parents, chains of `Then`,
+# `IgnoreThen`, `ThenIgnore`, `DelimitedBy`, `Sequence`, `Map`, `To`, `Cut` and
+# `AndCheck` are flattened into straight-line code, `Repeated` becomes a direct
+# loop, and each branch of a `Factored` choice becomes a function that takes
+# the shared head. Parsers the compiler does not know about are called through
+# their own `run`, and `Recursive` declarations are replaced by their
+# definitions. A `Labelled` rule runs its parser inline unless the parse is
+# profiled.
+
+
+@dataclass
+class Compiled[In, Out, Err](Parser[In, Out, Err]):
+    parser: Parser[In, Out, Err]
+    source: str = field(repr=False, compare=False)
+    entry: t.Callable[[State[In], int], int] = field(repr=False, compare=False)
+
+    @t.override
+    def run(self, state: State[In], position: int) -> int:
+        return self.entry(state, position)
+
+    @t.override
+    def first_set(self) -> First:
+        return self.parser.first_set()
+
+
+_cache: dict[int, Compiled[t.Any, t.Any, t.Any]] = {}
+
+
+def compile_parser[
+    In, Out, Err
+](parser: Parser[In, Out, Err]) -> Compiled[In, Out, Err]:
+    # Compiled parsers are cached on the identity of the grammar they were built
+    # from. `Compiled` keeps that grammar alive, so the identity stays valid.
+    if isinstance(parser, Compiled):
+        return parser
+
+    try:
+        return _cache[id(parser)]
+    except KeyError:
+        ...
+
+    compiler = Compiler()
+    source, namespace, entry = compiler.compile(parser)
+    exec(compile(source, f"<compiled {type(parser).__name__}>", "exec"), namespace)
+    compiler.link(namespace)
+    for name, node in compiler.generated.items():
+        namespace[name].parser = node
+
+    compiled = Compiled(parser, source, namespace[entry])
+    _cache[id(parser)] = compiled
+    return compiled
+
+
+class Compiler:
+    def __init__(self):
+        self.namespace: dict[str, t.Any] = {
+            "NO_MATCH": NO_MATCH,
+            "ERROR": ERROR,
+            "END": First.End,
+            "Error": PR.Error,
+            "Spanned": span.Spanned,
+            "Just": Maybe.Just,
+            "NOTHING": Maybe.Nothing,
+            "Memo": Memo,
+        }
+        self.functions = dict[int, str]()
+        self.generated = dict[str, Parser[t.Any, t.Any, t.Any]]()
+        self.constants = dict[int, str]()
+        self.sources = list[str]()
+        self.pending = list[tuple[str, Parser[t.Any, t.Any, t.Any]]]()
+        self.linked = list[str]()
+        self.counter = itertools.count()
+
+    def compile(
+        self, parser: Parser[t.Any, t.Any, t.Any]
+    ) -> tuple[str, dict[str, t.Any], str]:
+        entry = self.function(parser)
+
+        while self.pending:
+            name, node = self.pending.pop()
+            self.sources.append(self.define(name, node))
+
+        return "\n\n".join(self.sources), self.namespace, entry
+
+    def link(self, namespace: dict[str, t.Any]):
+        # Dispatch tables are built before the functions they refer to exist,
+        # so they hold function names until the generated source has run.
+        for name in self.linked:
+            links: dict[t.Any, tuple[str, ...]] | tuple[str, ...] = namespace[name]
+            match links:
+                case dict():
+                    namespace[name] = {
+                        key: tuple(namespace[function] for function in functions)
+                        for key, functions in links.items()
+                    }
+                case functions:
+                    namespace[name] = tuple(
+                        namespace[function] for function in functions
+                    )
+
+    def constant(self, value: t.Any) -> str:
+        try:
+            return self.constants[id(value)]
+        except KeyError:
+            name = f"k{next(self.counter)}"
+            self.constants[id(value)] = name
+            self.namespace[name] = value
+            return name
+
+    def function(self, node: Parser[t.Any, t.Any, t.Any]) -> str:
+        # The callable used to run `node`: a generated function, or the node's
+        # own `run` for parsers the compiler does not know about.
+        try:
+            return self.functions[id(node)]
+        except KeyError:
+            ...
+
+        if isinstance(node, Recursive) and node.parser is not None:
+            # A declaration shares the function of its definition. Definitions
+            # are compiled lazily, so references back to the declaration from
+            # within its definition resolve to the same function.
+            self.functions[id(node)] = name = self.function(node.parser)
+            return name
+
+        if not self.known(node):
+            name = self.constant(node.run)
+        else:
+            name = f"p{next(self.counter)}_{type(node).__name__.lower()}"
+            self.pending.append((name, node))
+            self.generated[name] = node
+
+        self.functions[id(node)] = name
+        return name
+
+    def known(self, node: Parser[t.Any, t.Any, t.Any]) -> bool:
+        return type(node) in (
+            Require,
+            Cut,
+            Labelled,
+            Spanned,
+            Alternative,
+            To,
+            Then,
+            ThenWithContext,
+            ThenWith,
+            IgnoreThen,
+            ThenIgnore,
+            SeparatedBy,
+            DelimitedBy,
+            OrNot,
+            OrElse,
+            Map,
+            Filter,
+            AndCheck,
+            Repeated,
+            OneOf,
+            Just,
+            Nothing,
+            Boolean,
+            StartsWith,
+            TakeWhile,
+            Trie,
+            Choice,
+            Memoized,
+            Sequence,
+            Factored,
+        )
+
+    def define(self, name: str, node: Parser[t.Any, t.Any, t.Any]) -> str:
+        body = Body(self)
+        if isinstance(node, Factored):
+            self.factored(body, node)
+        else:
+            self.body(body, node)
+        return "\n".join(
+            [f"def {name}(state, position):", *("    " + line for line in body.lines)]
+        )
+
+    def tail(self, name: str, node: Sequence[t.Any, t.Any, t.Any]) -> str:
+        # A branch of `Factored`, which resumes after the shared head.
+        body = Body(self)
+        body.emit("pos = position")
+        item = self.sequence(body, node, ["head"])
+        body.emit(f"state.item = {item}", "return pos")
+        return "\n".join(
+            [
+                f"def {name}(state, position, head):",
+                *("    " + line for line in body.lines),
+            ]
+        )
+
+    def body(self, body: "Body", node: Parser[t.Any, t.Any, t.Any]):
+        match node:
+            case Alternative() | Choice():
+                self.choice(body, node)
+            case Repeated(parser, at_least):
+                self.repeated(body, parser, at_least)
+            case SeparatedBy(
+                parser, separator, allow_leading, allow_trailing, at_least
+            ):
+                self.separated_by(
+                    body, parser, separator, allow_leading, allow_trailing, at_least
+                )
+            case OrNot(maybe):
+                child = self.function(maybe)
+                body.emit(
+                    f"pos = {child}(state, position)",
+                    "if pos >= 0:",
+                    "    state.item = Just(state.item)",
+                    "    return pos",
+                    "if pos == NO_MATCH:",
+                    "    state.item = NOTHING",
+                    "    return position",
+                    "return ERROR",
+                )
+            case OrElse(maybe, default):
+                child = self.function(maybe)
+                body.emit(
+                    f"pos = {child}(state, position)",
+                    "if pos == NO_MATCH:",
+                    f"    state.item = {self.constant(default)}",
+                    "    return position",
+                    "return pos",
+                )
+            case Boolean(parser):
+                child = self.function(parser)
+                body.emit(
+                    f"pos = {child}(state, position)",
+                    "if pos >= 0:",
+                    "    state.item = True",
+                    "    return pos",
+                    "if pos == NO_MATCH:",
+                    "    state.item = False",
+                    "    return position",
+                    "return ERROR",
+                )
+            case Labelled(parser, name):
+                child = self.function(parser)
+                body.emit(
+                    "if state.profile is not None:",
+                    f"    return state.profile.run({self.constant(name)}, {child}, state, position)",
+                )
+                if isinstance(parser, (Recursive, Factored)) or not self.known(parser):
+                    body.emit(f"return {child}(state, position)")
+                else:
+                    self.body(body, parser)
+            case Spanned(parser):
+                child = self.function(parser)
+                body.emit(
+                    f"pos = {child}(state, position)",
+                    "if pos >= 0:",
+                    "    spans = state.spans",
+                    "    state.item = Spanned(state.item, spans[position].span + spans[pos - 1].span)",
+                    "return pos",
+                )
+            case ThenWithContext(first, second):
+                child = self.function(first)
+                body.emit(
+                    f"pos = {child}(state, position)",
+                    "if pos < 0:",
+                    "    return pos",
+                    "context = state.item",
+                    f"pos = state.resume({self.constant(second)}(context, state.input.at(pos)))",
+                    "if pos >= 0:",
+                    "    state.item = (context, state.item)",
+                    "return pos",
+                )
+            case ThenWith(first, second):
+                child = self.function(first)
+                body.emit(
+                    f"pos = {child}(state, position)",
+                    "if pos < 0:",
+                    "    return pos",
+                    "context = state.item",
+                    f"pos = {self.constant(second)}(context).run(state, pos)",
+                    "if pos >= 0:",
+                    "    state.item = (context, state.item)",
+                    "return pos",
+                )
+            case Memoized(parser):
+                memo = self.constant(node)
+                child = self.function(parser)
+                body.emit(
+                    f"memo = {memo}",
+                    "memos = state.memos",
+                    f"table = memos.get({id(node)})",
+                    "if table is None:",
+                    f"    table = memos[{id(node)}] = Memo()",
+                    "if state.cut > table.floor:",
+                    "    table.prune(state.cut)",
+                    "table = table.table",
+                    "try:",
+                    "    pos, value, reach, committed, farthest, expected = table[position]",
+                    "except KeyError:",
+                    "    memo.misses += 1",
+                    "else:",
+                    "    memo.hits += 1",
+                    "    table.move_to_end(position)",
+                    "    if pos >= 0:",
+                    "        state.item = value",
+                    "    elif pos == ERROR:",
+                    "        state.error = value",
+                    "    if reach > state.reach:",
+                    "        state.reach = reach",
+                    "    if committed is not None:",
+                    "        state.committed = committed",
+                    "    state.recall(farthest, expected)",
+                    "    return pos",
+                    "outer = state.reach",
+                    "outer_committed = state.committed",
+                    "outer_farthest, outer_expected = state.farthest, state.expected",
+                    "state.reach = position",
+                    "state.committed = None",
+                    "state.farthest, state.expected = 0, {}",
+                    f"pos = {child}(state, position)",
+                    "reach = state.reach",
+                    "committed = state.committed",
+                    "farthest, expected = state.farthest, state.expected",
+                    "state.reach = outer if outer > reach else reach",
+                    "if committed is None:",
+                    "    state.committed = outer_committed",
+                    "state.farthest, state.expected = outer_farthest, outer_expected",
+                    "state.recall(farthest, expected)",
+                    "table[position] = (pos, state.item if pos >= 0 else state.error, reach, committed, farthest, expected)",
+                    "if len(table) > memo.capacity:",
+                    "    table.popitem(last=False)",
+                    "return pos",
+                )
+            case _:
+                body.emit("pos = position")
+                item = self.inline(body, node)
+                body.emit(f"state.item = {item}", "return pos")
+
+    def inline(self, body: "Body", node: Parser[t.Any, t.Any, t.Any]) -> str:
+        # Emits straight-line code that runs `node` from `pos`, returns from the
+        # generated function on failure and otherwise leaves `pos` after the
+        # match. Returns a side effect free expression for the matched item.
+        match node:
+            case Just(pattern):
+                pattern = self.constant(pattern)
+                body.uses_items()
+                body.emit(
+                    f"if pos >= n or not (items[pos] == {pattern}):",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    "pos += 1",
+                )
+                return pattern
+            case Filter(func):
+                item = body.variable()
+                body.uses_items()
+                body.emit(
+                    "if pos >= n:",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    f"{item} = items[pos]",
+                    f"if not {self.constant(func)}({item}):",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    "pos += 1",
+                )
+                return item
+            case OneOf(choices):
+                item = body.variable()
+                body.uses_items()
+                body.emit(
+                    "if pos >= n:",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    f"{item} = items[pos]",
+                    f"if {item} not in {self.constant(choices)}:",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    "pos += 1",
+                )
+                return item
+            case Nothing():
+                body.uses_items()
+                body.emit(
+                    "if pos < n:",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                )
+                return "NOTHING"
+            case StartsWith(pattern):
+                pattern = self.constant(pattern)
+                body.emit(
+                    f"if not state.input.startswith({pattern}, pos):",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    f"pos += len({pattern})",
+                )
+                return pattern
+            case Trie():
+                trie_node, end, value = (
+                    body.variable(),
+                    body.variable(),
+                    body.variable(),
+                )
+                body.uses_items()
+                body.emit(
+                    f"{trie_node} = {self.constant(node.root)}",
+                    f"{end} = NO_MATCH",
+                    "while pos < n:",
+                    f"    {trie_node} = {trie_node}.get(items[pos])",
+                    f"    if {trie_node} is None:",
+                    "        break",
+                    "    pos += 1",
+                    f'    if "" in {trie_node}:',
+                    f"        {end} = pos",
+                    f'        {value} = {trie_node}[""]',
+                    f"if {end} == NO_MATCH:",
+                    f"    return state.fail(pos + 1, {self.constant(node)})",
+                    f"pos = {end}",
+                )
+                return value
+            case TakeWhile(members, at_least):
+                start = body.variable()
+                condition = f"items[pos] in {self.constant(members.members)}"
+                if members.predicate is not None:
+                    char = body.variable()
+                    condition = (
+                        f"({char} := items[pos]) in {self.constant(members.members)}"
+                        f' or ({char} >= "\\x80" and {self.constant(members.predicate)}({char}))'
+                    )
+                body.uses_items()
+                body.emit(
+                    f"{start} = pos",
+                    f"while pos < n and ({condition}):",
+                    "    pos += 1",
+                )
+                if at_least > 0:
+                    body.emit(
+                        f"if pos - {start} < {at_least}:",
+                        f"    return state.fail(pos + 1, {self.constant(node)})",
+                    )
+                item = body.variable()
+                body.emit(f"{item} = items[{start}:pos]")
+                return item
+            case Then(first, second):
+                first_item = self.inline(body, first)
+                second_item = self.inline(body, second)
+                return f"({first_item}, {second_item})"
+            case IgnoreThen(first, second):
+                self.inline(body, first)
+                return self.inline(body, second)
+            case ThenIgnore(first, second):
+                item = self.inline(body, first)
+                self.inline(body, second)
+                return item
+            case DelimitedBy(parser, start, end):
+                self.inline(body, start)
+                item = self.inline(body, parser)
+                self.inline(body, end)
+                return item
+            case Map(parser, mapper):
+                item = self.inline(body, parser)
+                mapped = body.variable()
+                body.emit(f"{mapped} = {self.constant(mapper)}({item})")
+                return mapped
+            case To(parser, convert_to):
+                self.inline(body, parser)
+                return self.constant(convert_to)
+            case Sequence():
+                return self.sequence(body, node, [])
+            case Cut(parser, error):
+                item = self.inline(body, parser)
+                body.emit(
+                    f"state.committed = {self.constant(error)}",
+                    "if pos > state.cut:",
+                    "    state.cut = pos",
+                )
+                return item
+            case AndCheck(parser, predicate):
+                item = self.inline(body, parser)
+                body.emit(
+                    f"if not {self.constant(predicate)}({item}):",
+                    f"    return state.fail(pos, {self.constant(node)})",
+                )
+                return item
+            case Require(required, error):
+                item = body.variable()
+                body.emit(
+                    f"after = {self.function(required)}(state, pos)",
+                    "if after < 0:",
+                    "    if after == NO_MATCH:",
+                    f"        state.error = Error({self.constant(error)}, state.spans[pos - 1].span)",
+                    "        return ERROR",
+                    "    return after",
+                    "pos = after",
+                    f"{item} = state.item",
+                )
+                return item
+            case _:
+                item = body.variable()
+                body.emit(
+                    f"pos = {self.function(node)}(state, pos)",
+                    "if pos < 0:",
+                    "    return pos",
+                    f"{item} = state.item",
+                )
+                return item
+
+    def sequence(
+        self, body: "Body", node: Sequence[t.Any, t.Any, t.Any], names: list[str]
+    ) -> str:
+        names = names + [self.inline(body, parser) for parser in node.parsers]
+        item = shape_source(node.shape, names.__getitem__)
+        if node.mapper is None:
+            return item
+
+        mapped = body.variable()
+        body.emit(f"{mapped} = {self.constant(node.mapper)}({item})")
+        return mapped
+
+    def factored(self, body: "Body", node: Factored[t.Any, t.Any, t.Any]):
+        # Mirrors `Factored.run`.
+        tails = list[str]()
+        for tail in node.tails:
+            name = f"p{next(self.counter)}_tail"
+            self.sources.append(self.tail(name, tail))
+            tails.append(name)
+        candidates = self.constant(tuple(tails))
+        self.linked.append(candidates)
+
+        body.emit("pos = position")
+        item = self.inline(body, node.head)
+        body.emit(
+            f"head = {item}",
+            "start = pos",
+            "base = state.reach",
+            "committed = state.committed",
+            "reach = base",
+            f"for tail in {candidates}:",
+            "    state.fuel -= 1",
+            "    if state.fuel < 0:",
+            "        state.refuel(position)",
+            "    state.reach = base",
+            "    state.committed = committed",
+            "    pos = tail(state, start, head)",
+            "    if pos != NO_MATCH or state.committed is not None:",
+            "        return pos",
+            "    if state.reach > reach:",
+            "        reach = state.reach",
+            "state.reach = reach",
+            "return NO_MATCH",
+        )
+
+    def choice(
+        self,
+        body: "Body",
+        node: Alternative[t.Any, t.Any, t.Any, t.Any] | Choice[t.Any, t.Any, t.Any],
+    ):
+        # Mirrors `attempt`, which the interpreted choices run.
+        dispatch = node.dispatch()
+
+        if not dispatch.table:
+            candidates = self.constant(
+                tuple(self.function(branch) for branch in branches(node))
+            )
+            self.linked.append(candidates)
+            body.emit(f"candidates = {candidates}")
+        else:
+            table = self.constant(
+                {
+                    key: tuple(self.function(branch) for branch in candidates)
+                    for key, candidates in dispatch.table.items()
+                }
+            )
+            fallback = self.constant(
+                tuple(self.function(branch) for branch in dispatch.fallback)
+            )
+            self.linked.extend((table, fallback))
+
+            body.uses_items()
+            body.emit(
+                "if position < n:",
+                "    try:",
+                f"        candidates = {table}.get(items[position], {fallback})",
+                "    except TypeError:",
+                f"        candidates = {fallback}",
+                "else:",
+                f"    candidates = {table}.get(END, {fallback})",
+            )
+
+        body.emit(
+            "trace = state.trace",
+            "outer = state.reach",
+            "committed = state.committed",
+            "reach = position",
+            "pos = NO_MATCH",
+            "for candidate in candidates:",
+            "    state.fuel -= 1",
+            "    if state.fuel < 0:",
+            "        state.refuel(position)",
+            "    state.reexamined += reach - position",
+            "    state.reach = position",
+            "    state.committed = None",
+            "    pos = candidate(state, position)",
+            "    if trace is not None:",
+            "        trace.record(candidate, position, pos)",
+            "    if state.reach > reach:",
+            "        reach = state.reach",
+            "    if pos != NO_MATCH:",
+            "        break",
+            "    if state.committed is not None:",
+            "        pos = state.abandon(position)",
+            "        break",
+            "state.reach = outer if outer > reach else reach",
+            "state.committed = committed",
+        )
+        if dispatch.table:
+            body.emit(
+                f"if pos == NO_MATCH and len(candidates) < {len(dispatch.branches)}:",
+                f"    return state.fail(position + 1, {self.constant(node)})",
+            )
+        body.emit("return pos")
+
+    def repeated(
+        self, body: "Body", parser: Parser[t.Any, t.Any, t.Any], at_least: int
+    ):
+        body.emit("items_out = []", "pos = position")
+
+        match parser:
+            case Just(pattern):
+                pattern = self.constant(pattern)
+                body.uses_items()
+                body.emit(
+                    f"while pos < n and items[pos] == {pattern}:",
+                    f"    items_out.append({pattern})",
+                    "    pos += 1",
+                )
+            case Filter(func):
+                body.uses_items()
+                body.emit(
+                    "while pos < n:",
+                    "    item = items[pos]",
+                    f"    if not {self.constant(func)}(item):",
+                    "        break",
+                    "    items_out.append(item)",
+                    "    pos += 1",
+                )
+            case OneOf(choices):
+                body.uses_items()
+                body.emit(
+                    "while pos < n:",
+                    "    item = items[pos]",
+                    f"    if item not in {self.constant(choices)}:",
+                    "        break",
+                    "    items_out.append(item)",
+                    "    pos += 1",
+                )
+            case _:
+                body.emit(
+                    "while True:",
+                    f"    after = {self.function(parser)}(state, pos)",
+                    "    if after < 0:",
+                    "        if after == NO_MATCH:",
+                    "            break",
+                    "        return after",
+                    "    items_out.append(state.item)",
+                    "    pos = after",
+                )
+
+        match parser:
+            case Just() | Filter() | OneOf():
+                # The item that ended the loop was examined by a failed match.
+                body.emit(f"state.fail(pos + 1, {self.constant(parser)})")
+            case _:
+                ...
+
+        if at_least > 0:
+            body.emit(f"if len(items_out) < {at_least}:", "    return NO_MATCH")
+        body.emit("state.item = items_out", "return pos")
+
+    def separated_by(
+        self,
+        body: "Body",
+        parser: Parser[t.Any, t.Any, t.Any],
+        separator: Parser[t.Any, t.Any, t.Any],
+        allow_leading: bool,
+        allow_trailing: bool,
+        at_least: int,
+    ):
+        item = self.function(parser)
+        sep = self.function(separator)
+
+        def optional_separator():
+            body.emit(
+                f"after = {sep}(state, pos)",
+                "if after >= 0:",
+                "    pos = after",
+                "elif after == ERROR:",
+                "    return ERROR",
+            )
+
+        body.emit("pos = position")
+        if allow_leading:
+            optional_separator()
+
+        body.emit(f"pos = {item}(state, pos)", "if pos < 0:")
+        if at_least > 0:
+            body.emit("    return pos")
+        else:
+            body.emit(
+                "    if pos == NO_MATCH:",
+                "        state.item = []",
+                "        return position",
+                "    return pos",
+            )
+        body.emit(
+            "items_out = [state.item]",
+            "while True:",
+            f"    after = {sep}(state, pos)",
+            "    if after < 0:",
+            "        if after == NO_MATCH:",
+            "            break",
+            "        return after",
+            f"    after = {item}(state, after)",
+            "    if after < 0:",
+            "        if after == NO_MATCH:",
+            "            break",
+            "        return after",
+            "    items_out.append(state.item)",
+            "    pos = after",
+        )
+
+        if at_least > 1:
+            body.emit(f"if len(items_out) < {at_least}:", "    return NO_MATCH")
+        if allow_trailing:
+            optional_separator()
+
+        body.emit("state.item = items_out", "return pos")
+
+
+class Body:
+    def __init__(self, compiler: Compiler):
+        self.compiler = compiler
+        self.statements = list[str]()
+        self.needs_items = False
+        self.counter = itertools.count()
+
+    @property
+    def lines(self) -> list[str]:
+        prologue = ["items = state.items", "n = len(items)"] if self.needs_items else []
+        return prologue + self.statements
+
+    def emit(self, *lines: str):
+        self.statements.extend(lines)
+
+    def uses_items(self):
+        self.needs_items = True
+
+    def variable(self) -> str:
+        return f"v{next(self.counter)}"
@@ -1,9 +1,11 @@
 import typing as t
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
 
 from opyl.support.union import Maybe
 from opyl.support.span import Spanned, Span
+from opyl.support.buffer import TokenBuffer
+from opyl.support.text import Text
 
 
 @dataclass
@@ -19,13 +21,41 @@ class Source:
 
 @dataclass
 class Stream[ItemType]:
+    # A `Stream` is a cursor into a shared, immutable buffer of spanned items.
+    # Combinators take the buffer and an integer position (`Parser.parse_at`),
+    # so a `Stream` is only materialized at the public `Parser.parse` boundary.
+    # `items` mirrors `spans` without the span wrappers so that the hot path
+    # can index items directly. `spans` may be a `TokenBuffer`, whose items
+    # are read without building its `Spanned` objects, or a `Text`, whose
+    # items are the characters of its string. `items` is built from `spans`
+    # when it is first read, so that a stream that is never parsed, such as
+    # one `lex.relex` makes, costs nothing per item.
     file_handle: os.PathLike[str] | None  # TODO: Not a handle
-    spans: list[Spanned[ItemType]]
+    spans: t.Sequence[Spanned[ItemType]]
     position: int = 0
+    _items: t.Sequence[ItemType] | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def items(self) -> t.Sequence[ItemType]:
+        items = self._items
+        if items is None and isinstance(self.spans, TokenBuffer):
+            items = self._items = t.cast(TokenBuffer[ItemType], self.spans).items()
+        elif items is None and isinstance(self.spans, Text):
+            items = self._items = t.cast(t.Sequence[ItemType], self.spans.text)
+        elif items is None:
+            items = self._items = [spanned.item for spanned in self.spans]
+        return items
+
+    @items.setter
+    def items(self, items: t.Sequence[ItemType]):
+        self._items = items
 
     def __iter__(self) -> t.Generator[Spanned[ItemType], None, None]:
         yield from self.spans
 
+    def __len__(self) -> int:
+        return len(self.spans)
+
     @staticmethod
     def from_source(
         source: str, file_handle: os.PathLike[str] | None = None, span_base: int = 0
@@ -36,8 +66,16 @@ class Stream[ItemType]:
                 Spanned(item, Span(idx, idx + 1))
                 for idx, item in enumerate(source, start=span_base)
             ],
+            _items=source,
         )
 
+    @staticmethod
+    def from_text(
+        source: str, file_handle: os.PathLike[str] | None = None, span_base: int = 0
+    ) -> "Stream[str]":
+        # As `from_source`, without building a `Spanned` per character.
+        return Stream(file_handle=file_handle, spans=Text(source, span_base))
+
     def map[
         NewItemType
     ](self, mapper: t.Callable[[ItemType], NewItemType]) -> "Stream[NewItemType]":
@@ -48,8 +86,16 @@ class Stream[ItemType]:
             ],
         )
 
+    def at(self, position: int) -> t.Self:
+        return self.__class__(
+            file_handle=self.file_handle,
+            spans=self.spans,
+            position=position,
+            _items=self._items,
+        )
+
     def remaining(self) -> list[Spanned[ItemType]]:
-        return self.spans[self.position :]
+        return list(self.spans[self.position :])
 
     def peek(self) -> Maybe.Type[Spanned[ItemType]]:
         try:
@@ -60,27 +106,55 @@ class Stream[ItemType]:
             return Maybe.Just(span)
 
     def advance(self, by: int = 1) -> t.Self:
-        return self.__class__(
-            file_handle=self.file_handle,
-            spans=self.spans,
-            position=min(self.position + by, len(self.spans)),
-        )
+        return self.at(min(self.position + by, len(self.spans)))
+
+    def startswith(
+        self, pattern: t.Sequence[ItemType], position: int | None = None
+    ) -> bool:
+        if position is None:
+            position = self.position
+        items = self.items
 
-    def startswith(self, pattern: t.Sequence[ItemType]) -> bool:
         if len(pattern) == 0:
             return False
-        if len(self.spans) < len(pattern):
+        if isinstance(items, str) and isinstance(pattern, str):
+            return items.startswith(pattern, position)
+        if len(items) - position < len(pattern):
             return False
 
-        subslice = self.spans[self.position :]
-        if len(subslice) == 0:
-            return False
-
-        for pat, spanned in zip(pattern, subslice):
-            if spanned.item != pat:
+        for offset, pat in enumerate(pattern):
+            if items[position + offset] != pat:
                 return False
 
         return True
 
     def end(self) -> Span:
         return self.spans[-1].span
+
+
+@dataclass
+class Window[ItemType]:
+    # Pulls spanned items from `source` on demand, a chunk at a time. Each
+    # chunk is a `Stream` over its own list, so a parser may backtrack
+    # anywhere within the chunk it is given while the items of earlier chunks
+    # are released. `splits` is called with each item pulled after the first
+    # of a chunk, and decides whether the item starts the next chunk instead.
+    source: t.Iterator[Spanned[ItemType]]
+    file_handle: os.PathLike[str] | None = None
+    _next: Spanned[ItemType] | None = field(default=None, init=False, repr=False)
+
+    def take(self, splits: t.Callable[[ItemType], bool]) -> Stream[ItemType] | None:
+        chunk = list[Spanned[ItemType]]()
+        if self._next is not None:
+            chunk.append(self._next)
+            self._next = None
+
+        for spanned in self.source:
+            if chunk and splits(spanned.item):
+                self._next = spanned
+                break
+            chunk.append(spanned)
+
+        if not chunk:
+            return None
+        return Stream(file_handle=self.file_handle, spans=chunk)
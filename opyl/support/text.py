@@ -0,0 +1,57 @@
+import typing as t
+
+from opyl.support.span import Spanned, Span
+
+
+class Text(t.Sequence[Spanned[str]]):
+    # The characters of a source as a sequence of spanned items, stored as the
+    # source alone. The span of each character follows from its offset, so a
+    # `Spanned` and a `Span` are only built for the characters indexed through
+    # the sequence interface, rather than two objects for every character up
+    # front. Parsers over characters read `text` itself, as the items of the
+    # stream.
+    def __init__(self, text: str, span_base: int = 0):
+        self.text = text
+        self.span_base = span_base
+
+    def span(self, index: int) -> Span:
+        start = self.span_base + index
+        return Span(start, start + 1)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @t.overload
+    def __getitem__(self, index: int) -> Spanned[str]:
+        ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> list[Spanned[str]]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Spanned[str] | list[Spanned[str]]:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        # Indexing the text checks the index.
+        char = self.text[index]
+        if index < 0:
+            index += len(self.text)
+        start = self.span_base + index
+        return Spanned(char, Span(start, start + 1))
+
+    def __iter__(self) -> t.Iterator[Spanned[str]]:
+        for index, char in enumerate(self.text):
+            yield Spanned(char, self.span(index))
+
+    def __eq__(self, other: object) -> bool:
+        match other:
+            case Text():
+                return self.text == other.text and self.span_base == other.span_base
+            case list():
+                return list(self) == other
+            case _:
+                return NotImplemented
+
+    def __repr__(self) -> str:
+        # As the list of `Spanned` characters it stands for.
+        return repr(list(self))
@@ -25,7 +25,9 @@ class Maybe:
 
     Nothing: t.Final[t.Literal[Kind.Nothing]] = Kind.Nothing
 
-    type Type[T] = Just[T] | t.Literal[Kind.Nothing]
+    # Qualified, since the checker does not look names up in the class body
+    # from an alias.
+    type Type[T] = Maybe.Just[T] | t.Literal[Maybe.Kind.Nothing]
 
 
 class Result:
@@ -1,3 +1,9 @@
+from pathlib import Path
+import typing as t
+
+import pytest
+
+from opyl.compile import lex
 from opyl.compile.lex import (
     IntegerLiteral,
     Identifier,
@@ -9,8 +15,11 @@ from opyl.compile.lex import (
     character,
     basic,
 )
-from opyl.compile.token import Basic
+from opyl.compile.token import Basic, Keyword, Token
 from opyl.compile.error import LexError
+from opyl.support.combinator import ParseResult
+from opyl.support.buffer import TokenBuffer
+from opyl.support.span import Span
 from .utils import parse_test_err, lex_test
 
 
@@ -74,6 +83,18 @@ class TestIntegerLiteral:
     def test_underscore_in_literal(self):
         lex_test(integer, "4_5", IntegerLiteral(45))
 
+    @pytest.mark.parametrize(
+        "source, integer, end",
+        [("x = 123_", 123, 8), ("x = 19_", 19, 7), ("x = 1_", 1, 5)],
+    )
+    def test_trailing_underscore(self, source: str, integer: int, end: int):
+        # An underscore after the digits belongs to the literal, unless they
+        # are a single digit.
+        spanned = lex.tokenize(source).stream.spans[2]
+
+        assert spanned.item == IntegerLiteral(integer)
+        assert spanned.span == Span(4, end)
+
     def test_invalid_integer_leading_underscore(self):
         lex_test(integer, "_45", None)
 
@@ -100,6 +121,12 @@ class TestIdentifier:
     def test_ident_leading_underscore(self):
         lex_test(identifier, "_foo", Identifier("_foo"))
 
+    def test_keyword(self):
+        lex_test(identifier, "while", Keyword.While)
+
+    def test_keyword_prefix(self):
+        lex_test(identifier, "whiles", Identifier("whiles"))
+
 
 class TestStringLiteral:
     def test_string(self):
@@ -124,3 +151,192 @@ class TestCharacterLiteral:
 
     def test_unterminated_char(self):
         parse_test_err(character, "'a", LexError.UnterminatedCharacterLiteral)
+
+
+CORPUS = sorted(
+    [*Path("examples/").glob("*.opal"), *Path("tests/test_cases/").glob("*.opal")]
+)
+# Without NumPy `Engine.Vector` lexes as `Engine.Regex`, which would pass its
+# cases without running it.
+VECTOR = pytest.param(
+    lex.Engine.Vector,
+    marks=pytest.mark.skipif(lex.np is None, reason="needs NumPy"),
+)
+ENGINES = [lex.Engine.Combinator, lex.Engine.Regex, VECTOR]
+
+
+@pytest.mark.parametrize("engine", [lex.Engine.Regex, VECTOR])
+class TestEngines:
+    def agree(self, source: str, engine: lex.Engine):
+        assert lex.tokenize_with_comments(
+            source, engine=engine
+        ) == lex.tokenize_with_comments(source)
+        assert lex.tokenize(source, engine=engine) == lex.tokenize(source)
+
+    @pytest.mark.parametrize("source_path", CORPUS)
+    def test_corpus(self, source_path: Path, engine: lex.Engine):
+        text = source_path.read_text()
+        self.agree(text, engine)
+        # Every prefix of the file, which cuts tokens and lines short.
+        for end in range(0, len(text), 7):
+            self.agree(text[:end], engine)
+
+    @pytest.mark.parametrize(
+        "source",
+        [
+            "0b\n0b_2\n0b1__0 0x\n0x1_f_\n00\n1__2\n0_1\n1_2__3",
+            "'\n''\n'a\n'ab'\n'é'",
+            '"\n"abc\n"a" "b"',
+            "a \n  \n\t\n \t x\n\x0b\n\x1c",
+            "#\na#b # c\n+=->-=**=//=&&!=::==<<<=>>>=|||",
+            "été ²\n1 ²",
+            "a\x1fb\na \x1fb\n0b1x 012\n$ x\nx é y\n\ud800",
+            'let x = 10 + y >= 0\nif x {\n  "s" z\n}\n0 00 a1 1a\n==== x',
+        ],
+    )
+    def test_edge_cases(self, source: str, engine: lex.Engine):
+        self.agree(source, engine)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_integer_trailing_underscore(engine: lex.Engine):
+    tokens = lex.tokenize("123_ 19_ 1_ 12__3", engine=engine).stream
+
+    assert [(spanned.item, spanned.span) for spanned in tokens.spans] == [
+        (IntegerLiteral(123), Span(0, 4)),
+        (IntegerLiteral(19), Span(5, 8)),
+        (IntegerLiteral(1), Span(9, 10)),
+        (Identifier("_"), Span(10, 11)),
+        (IntegerLiteral(123), Span(12, 17)),
+        (Basic.NewLine, Span(17, 18)),
+    ]
+
+
+def test_vector_without_numpy(monkeypatch: pytest.MonkeyPatch):
+    source = "let x = 1 # one\n'ab'\n\"a\" ²\n0b"
+    monkeypatch.setattr(lex, "np", None)
+
+    assert lex.tokenize(source, engine=lex.Engine.Vector) == lex.tokenize(
+        source, engine=lex.Engine.Regex
+    )
+
+
+def test_vector_longest_operator(monkeypatch: pytest.MonkeyPatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setitem(lex.operators, "...", Basic.Period)
+    monkeypatch.setattr(lex, "operator_widths", [3, 2, 1])
+    tokens = lex.tokenize("a...b..c", engine=lex.Engine.Vector).stream
+
+    assert [spanned.span for spanned in tokens.spans[1:-1]] == [
+        Span(1, 4),
+        Span(4, 5),
+        Span(5, 6),
+        Span(6, 7),
+        Span(7, 8),
+    ]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_iter_tokens(engine: lex.Engine):
+    source = "let x = 1 # one\n'ab'\n\"a\" ²\n0b"
+    errors = list[ParseResult.Error[LexError]]()
+    tokens = list(lex.iter_tokens(source, engine=engine, errors=errors))
+    result = lex.tokenize(source, engine=engine)
+
+    assert tokens == list(result.stream.spans)
+    assert errors == result.errors
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_interned_in_order(engine: lex.Engine):
+    # Lines lexed in bulk and those scanned a token at a time interleave.
+    result = lex.tokenize('b a\n"s" c\nd b 1\n#\ne', engine=engine)
+
+    assert result.names.identifiers == [*map(Identifier, "bacde")]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_interned(engine: lex.Engine):
+    result = lex.tokenize('x y "s"\nx "s" y x', engine=engine)
+    x, y, s, _, x_again, s_again, y_again, x_last, _ = result.stream.items
+
+    assert x is x_again is x_last
+    assert y is y_again
+    assert s is s_again
+    assert x is not y
+    assert result.names.id(Identifier("x")) == 0
+    assert result.names.id(Identifier("y")) == 1
+    assert result.names.identifiers == [Identifier("x"), Identifier("y")]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_trivia(engine: lex.Engine):
+    source = "# head\nlet x = 1 # one\n# two\ny"
+    result = lex.tokenize(source, engine=engine)
+    with_comments = lex.tokenize_with_comments(source, engine=engine)
+
+    assert result.stream.spans == lex.filter_comments(with_comments.stream).spans
+    assert list(result.trivia.positions) == [0, 5, 6]
+    assert [spanned.item for spanned in result.trivia.before(0)] == [
+        lex.Comment(" head")
+    ]
+    # A comment at the end of a line comes before its newline.
+    assert [spanned.item for spanned in result.trivia.before(5)] == [
+        lex.Comment(" one")
+    ]
+    assert result.stream.spans[5].item is Basic.NewLine
+    assert result.trivia.before(1) == []
+    assert len(with_comments.trivia) == 0
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        lex.Edit(0, 0, "let "),
+        lex.Edit(4, 5, "renamed"),
+        lex.Edit(8, 8, "\n\n"),
+        lex.Edit(10, 22, ""),
+        lex.Edit(13, 14, "'"),
+        lex.Edit(26, 26, "\n"),
+        lex.Edit(25, 26, ""),
+    ],
+)
+@pytest.mark.parametrize("comments", [True, False])
+def test_relex(edit: lex.Edit, comments: bool):
+    source = "let x = 1 # one\n'ab'\ny + z"
+    lexer = lex.tokenize_with_comments if comments else lex.tokenize
+    previous = lexer(source)
+    relexed = lex.relex(source, previous, edit, comments=comments)
+
+    assert relexed == lexer(edit.apply(source))
+    assert relexed.names is previous.names
+    # Edits can be chained without lexing the whole source again.
+    again = lex.Edit(0, 1, "L")
+    assert lex.relex(edit.apply(source), relexed, again, comments=comments) == lexer(
+        again.apply(edit.apply(source))
+    )
+
+
+def test_relex_shares():
+    source = "let x = 1\n" * 2000
+    previous = lex.tokenize(source)
+    relexed = lex.relex(source, previous, lex.Edit(10000, 10001, "y"))
+
+    # The tokens after the edit are those of `previous`, moved along.
+    *_, after = t.cast(TokenBuffer[Token], relexed.stream.spans).pieces()
+    assert after.source is previous.stream.spans
+    # Each line is five tokens, and the edit is on line 1000.
+    assert after.start == 5 * 1001
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_parallel(engine: lex.Engine):
+    source = "\n".join(path.read_text() for path in CORPUS) + "\n'x\n0b\n\n"
+    parallel = lex.Parallel(workers=2, threshold=0, chunk=256)
+
+    assert lex.tokenize(source, engine=engine, parallel=parallel) == lex.tokenize(
+        source, engine=engine
+    )
+    assert lex.tokenize_with_comments(
+        source, engine=engine, parallel=parallel
+    ) == lex.tokenize_with_comments(source, engine=engine)
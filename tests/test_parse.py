@@ -3,8 +3,10 @@ from opyl.compile.token import IntegerLiteral
 from opyl.compile.ast import Field, ConstDeclaration, VarDeclaration
 from opyl.compile import ast
 from opyl.compile import expr
+from opyl.compile.error import ParseError
 from opyl.compile.token import Identifier
 from opyl.support.combinator import ParseResult, PR
+from opyl.support.span import Span
 from opyl.support.union import Maybe
 
 from .utils import parse_test
@@ -304,6 +306,75 @@ def test_simple_type_def():
     )
 
 
+def test_func_decl_commits():
+    tokens = lex.tokenize("def f() return 1\n}").stream
+    result = parse.parse(tokens)
+
+    assert result == ParseResult.Error(
+        ParseError(expected="function body", following="function signature"),
+        tokens.spans[4].span,
+    )
+
+
+def test_trait_func_sig_does_not_commit():
+    tokens = lex.tokenize("trait T {\n  def f() x\n}").stream
+    result = parse.parse(tokens)
+
+    assert result == ParseResult.Error(
+        ParseError(expected="}", following="trait definition"),
+        tokens.spans[7].span,
+    )
+
+
+def test_farthest_failure():
+    tokens = lex.tokenize("enum Color {\n  Red,\n  +\n}").stream
+    result = parse.parse(tokens)
+
+    assert result == ParseResult.Error(
+        ParseError(expected="newline or identifier or '}'", following="newline"),
+        tokens.spans[7].span,
+    )
+
+
+def test_decls_requires_end():
+    tokens = lex.tokenize("enum Color {\n  Red,\n  +\n}").stream
+
+    assert parse.decls.parse(tokens) == ParseResult.Error(
+        ParseError(expected="end of input", following="declaration"),
+        tokens.spans[10].span,
+    )
+    assert parse.parse(tokens) != parse.decls.parse(tokens)
+
+
+def test_iter_parse():
+    source = "const A: T = 1\nenum B\n{\n  X\n}\n\ndef f() {\n  let y: T = (\n  1)\n}\n"
+    results = list(parse.iter_parse(lex.iter_tokens(source)))
+
+    assert len(results) == 3
+    assert [decl for result in results for decl in result.item] == parse.parse(
+        lex.tokenize(source).stream
+    ).item
+
+
+def test_iter_parse_error():
+    source = "const A: T = 1\nenum Color {\n  Red,\n  +\n}\nconst B: T = 2"
+    *matches, error = parse.iter_parse(lex.iter_tokens(source))
+
+    assert len(matches) == 1
+    assert error == parse.parse(lex.tokenize(source).stream)
+
+
+def test_iter_parse_error_past_split():
+    # The declaration is split before `def`, which it runs into for lack of
+    # its opening brace.
+    source = "const A: T = 1\ntrait Iterator\n    def next() -> T\n}"
+    *_, error = parse.iter_parse(lex.iter_tokens(source))
+
+    assert error == parse.parse(lex.tokenize(source).stream)
+    assert isinstance(error, ParseResult.Error)
+    assert error.span == Span(34, 37)
+
+
 def test_union_type_def():
     parse_test(
         parse.type_def,
@@ -1,18 +1,57 @@
+import io
+import typing as t
+
 import pytest
 
 from opyl.compile.token import (
     Identifier,
     IntegerLiteral,
     Basic,
+    Keyword,
     Token,
 )
 from opyl.support.stream import Stream
+from opyl.support.buffer import TokenBuffer
+from opyl.support.text import Text
+from opyl.support.span import Span, Spanned
 from opyl.compile import lex
-from opyl.support.atoms import just, integer
-from opyl.support.combinator import OneOf, ParseResult
+from opyl.compile import parse
+from opyl.support.atoms import just, integer, ident
+from opyl.support.combinator import (
+    Just,
+    Recursive,
+    OneOf,
+    ParseResult,
+    Parser,
+    First,
+    State,
+    NO_MATCH,
+    ERROR,
+    Budget,
+    backtracking,
+    recursive,
+    char_class,
+    take_while,
+    take_while1,
+    startswith,
+    trie,
+    optimize,
+    Sequence,
+    Factored,
+    Choice,
+    Failure,
+    Trace,
+    Profile,
+    label,
+)
+from opyl.support.compiler import compile_parser
+from opyl.support.analysis import Issue, GrammarError, analyze, check
+from opyl.support.union import Maybe
 from opyl.compile import error
 
 PR = ParseResult
+# `just` over the characters of text, failing with any error.
+just_char = Just[str, t.Any]
 
 
 @pytest.fixture
@@ -57,6 +96,143 @@ class TestStream:
 
         assert tokens.startswith([Identifier("foo"), IntegerLiteral(4)])
 
+    def test_startswith_past_end(self):
+        stream = Stream.from_source("xfo")
+
+        assert stream.startswith("fo", 1)
+        assert not stream.startswith("foo", 1)
+
+    def test_at_shares_buffer(self):
+        stream = Stream.from_source("foo")
+        moved = stream.at(2)
+
+        assert moved.position == 2
+        assert moved.spans is stream.spans
+        assert moved.items is stream.items
+
+
+class TestText:
+    def test_spans_from_offsets(self):
+        text = Text("ab", span_base=10)
+
+        assert len(text) == 2
+        assert text[1] == Spanned("b", Span(11, 12))
+        assert text[-2] == Spanned("a", Span(10, 11))
+        assert text[:] == list(text) == Stream.from_source("ab", None, 10).spans
+        with pytest.raises(IndexError):
+            text[2]
+
+    def test_stream(self):
+        stream = Stream.from_text("xfoo", None, 10)
+
+        assert stream.items == "xfoo"
+        assert stream.startswith("foo", 1)
+        assert not stream.startswith("foox", 1)
+        assert stream.end() == Span(13, 14)
+        assert stream == Stream.from_source("xfoo", None, 10)
+
+    def test_parsers(self):
+        stream = Stream.from_text("0x1f", None, 10)
+        digits = startswith("0x").ignore_then(
+            take_while1(char_class("0123456789abcdef"))
+        )
+
+        assert digits.spanned().parse_at(stream, 0) == (
+            Spanned("1f", Span(10, 14)),
+            4,
+        )
+        assert OneOf[str, error.LexError]("01").parse_at(stream, 0) == ("0", 1)
+        assert compile_parser(digits.spanned()).parse_at(stream, 0) == (
+            Spanned("1f", Span(10, 14)),
+            4,
+        )
+
+
+class TestTokenBuffer:
+    def test_items_and_spans(self):
+        buffer = TokenBuffer[Token]()
+        buffer.append(Keyword.Let, 0, 3)
+        buffer.append(Identifier("x"), 4, 5)
+        buffer.append(Keyword.Let, 6, 9)
+
+        assert len(buffer) == 3
+        assert buffer.items() == [Keyword.Let, Identifier("x"), Keyword.Let]
+        assert buffer.span(1) == Span(4, 5)
+        assert buffer[-1] == Spanned(Keyword.Let, Span(6, 9))
+        assert buffer[1:] == [
+            Spanned(Identifier("x"), Span(4, 5)),
+            Spanned(Keyword.Let, Span(6, 9)),
+        ]
+        assert len(buffer.payloads) == 1
+
+    def test_truncate(self):
+        buffer = TokenBuffer[Token]()
+        buffer.append(Identifier("x"), 0, 1)
+        buffer.append(Keyword.Let, 2, 5)
+        buffer.append(Identifier("y"), 6, 7)
+        buffer.truncate(1)
+        buffer.append(Identifier("z"), 2, 3)
+
+        assert buffer.items() == [Identifier("x"), Identifier("z")]
+        assert buffer.payloads == [Identifier("x"), Identifier("z")]
+
+    def test_splice(self):
+        buffer = TokenBuffer[Token]()
+        buffer.append(Identifier("x"), 0, 1)
+        buffer.append(Keyword.Let, 2, 5)
+        buffer.append(Identifier("y"), 6, 7)
+        replacement = TokenBuffer[Token]()
+        replacement.append(Identifier("long"), 2, 6)
+        spliced = buffer.splice(1, 2, replacement, 1)
+
+        assert spliced.item(2) == Identifier("y")
+        assert spliced.span(2) == Span(7, 8)
+        assert spliced.bisect(7) == 2
+        assert list(spliced) == [
+            Spanned(Identifier("x"), Span(0, 1)),
+            Spanned(Identifier("long"), Span(2, 6)),
+            Spanned(Identifier("y"), Span(7, 8)),
+        ]
+        assert buffer.items() == [Identifier("x"), Keyword.Let, Identifier("y")]
+
+    def test_splice_shares(self):
+        buffer = TokenBuffer[Token]()
+        for index in range(3000):
+            buffer.append(Identifier("x") if index % 2 else Keyword.Let, index, index)
+        replacement = TokenBuffer[Token]()
+        replacement.append(Identifier("y"), 1500, 1502)
+        spliced = buffer.splice(1500, 1501, replacement, 1)
+
+        # The items on either side of the splice are read from the arrays of
+        # `buffer` rather than copied.
+        before, middle, after = spliced.pieces()
+        assert before.source is buffer and (before.start, before.stop) == (0, 1500)
+        assert middle.source is replacement
+        assert after.source is buffer and (after.start, after.stop) == (1501, 3000)
+        assert after.shift == 1
+        assert spliced.item(1500) == Identifier("y")
+        assert spliced.span(2999) == Span(3000, 3000)
+        assert spliced.bisect(3000) == 2999
+        assert spliced.items()[1499:1502] == [
+            Identifier("x"),
+            Identifier("y"),
+            Identifier("x"),
+        ]
+
+    def test_lexer_output(self):
+        stream = lex.tokenize("let x = 1 # one").stream
+
+        assert stream.items == [
+            Keyword.Let,
+            Identifier("x"),
+            Basic.Equal,
+            IntegerLiteral(1),
+            Basic.NewLine,
+        ]
+        assert stream.spans[3].span == Span(8, 9)
+        assert isinstance(stream.spans, TokenBuffer)
+        assert stream.peek() == Maybe.Just(Spanned(Keyword.Let, Span(0, 3)))
+
 
 class TestCombinator:
     def test_separated_by_dont_allow_trailing_leading(
@@ -117,3 +293,695 @@ class TestCombinator:
                 assert True
             case _:
                 assert False
+
+    def test_take_while(self):
+        digits = take_while("0123456789")
+
+        assert digits.parse_at(Stream.from_source("123ab"), 0) == ("123", 3)
+        assert digits.parse_at(Stream.from_source("ab"), 0) == ("", 0)
+        assert (
+            take_while1(char_class("0123456789")).parse_at(Stream.from_source("ab"), 0)
+            is PR.NoMatch
+        )
+
+    def test_take_while_predicate(self):
+        letters = take_while(str.isalpha)
+
+        assert letters.parse_at(Stream.from_source("héllo wörld"), 0) == ("héllo", 5)
+        assert letters.parse_at(Stream.from_source("héllo wörld"), 6) == ("wörld", 11)
+
+    def test_take_while_long_input(self):
+        # Items are read from the start of the run on, however far into the
+        # input it is.
+        class Counted(list[str]):
+            reads = 0
+
+            def __getitem__(self, index: t.Any) -> t.Any:
+                Counted.reads += 1
+                return t.cast(t.Any, super().__getitem__(index))
+
+            def __iter__(self) -> t.Iterator[str]:
+                for index in range(len(self)):
+                    yield self[index]
+
+        source = "x" * 100_000 + "1" * 10
+        stream = Stream.from_source(source)
+        stream.items = Counted(source)
+        digits = take_while1(char_class("0123456789"))
+
+        assert digits.parse_at(stream, 100_000) == (["1"] * 10, 100_010)
+        assert Counted.reads < 20
+
+    def test_char_class(self):
+        assert "é" in char_class(str.isalpha)
+        assert "é" not in char_class("abc")
+        assert char_class(str.isdigit).members == frozenset("0123456789")
+
+    def test_trie_longest_match(self):
+        operators = trie({"<": "lt", "<<": "shl", "<<<=": "rol", "-": "minus"})
+        stream = Stream.from_source("<<<-<<<=x")
+
+        assert operators.parse_at(stream, 0) == ("shl", 2)
+        assert operators.parse_at(stream, 8) is PR.NoMatch
+        assert compile_parser(operators.repeated()).parse_at(stream, 0) == (
+            ["shl", "lt", "minus", "rol"],
+            8,
+        )
+        assert operators.first_set() == First(frozenset("<-"))
+
+
+class TestCursor:
+    def test_parse_at(self):
+        tokens = lex.tokenize("1, 2").stream
+
+        assert integer.parse_at(tokens, 2) == (IntegerLiteral(2), 3)
+        assert integer.parse_at(tokens, 1) is PR.NoMatch
+        assert integer.parse_at(tokens, 4) is PR.NoMatch
+
+    def test_stream_only_parser(self):
+        class Second(Parser[Token, IntegerLiteral, error.ParseError]):
+            def parse(
+                self,
+                input: Stream[Token],
+                budget: Budget[error.ParseError] | None = None,
+                failure: Failure[Token] | None = None,
+                trace: Trace | None = None,
+                profile: Profile | None = None,
+            ) -> ParseResult.Type[Token, IntegerLiteral, error.ParseError]:
+                return (
+                    just(Basic.Comma)
+                    .ignore_then(integer)
+                    .parse(input, budget, failure, trace, profile)
+                )
+
+        tokens = lex.tokenize("1, 2").stream
+        item, remaining = integer.then(Second()).parse(tokens).unwrap()
+
+        assert item == (IntegerLiteral(1), IntegerLiteral(2))
+        assert remaining.position == 3
+
+    def test_run(self):
+        tokens = lex.tokenize("1, 2").stream
+        state = State(tokens)
+
+        assert integer.run(state, 2) == 3
+        assert state.item == IntegerLiteral(2)
+        assert integer.run(state, 1) == NO_MATCH
+
+        required = just(Basic.Comma).require(
+            error.ParseError(expected="','", following="integer")
+        )
+        assert required.run(state, 2) == ERROR
+        assert state.error == PR.Error(
+            error.ParseError(expected="','", following="integer"), tokens.spans[1].span
+        )
+
+    def test_parse_at_only_parser(self):
+        class Second(Parser[Token, Token, error.ParseError]):
+            def parse_at(
+                self, input: Stream[Token], position: int
+            ) -> ParseResult.Step[Token, error.ParseError]:
+                return just(Basic.Comma).ignore_then(integer).parse_at(input, position)
+
+        tokens = lex.tokenize("1, 2").stream
+        item, remaining = integer.then(Second()).parse(tokens).unwrap()
+
+        assert item == (IntegerLiteral(1), IntegerLiteral(2))
+        assert remaining.position == 3
+
+
+class TestRecursive:
+    @staticmethod
+    def nested() -> Parser[str, int, error.LexError]:
+        # Counts the depth of balanced parentheses, e.g. "(())" -> 2.
+        return recursive(
+            lambda nested: nested.delimited_by(just_char("("), just_char(")"))
+            .map(lambda depth: depth + 1)
+            .or_else(0)
+        )
+
+    def test_recursive(self):
+        nested = self.nested()
+
+        assert nested.parse_at(Stream.from_source("(())"), 0) == (2, 4)
+        assert nested.parse_at(Stream.from_source("(()"), 0) == (0, 0)
+
+    def test_recursive_first_set(self):
+        assert self.nested().first_set() == First(frozenset("("), nullable=True)
+
+    def test_recursive_compiled(self):
+        nested = self.nested()
+        compiled = compile_parser(nested)
+
+        for source in ("", "()", "((()))", "(()"):
+            stream = Stream.from_source(source)
+            assert compiled.parse(stream) == nested.parse(stream)
+
+    def test_undefined(self):
+        with pytest.raises(RuntimeError):
+            Recursive[str, t.Any, t.Any]().parse(Stream.from_source(""))
+
+    def test_then_with(self):
+        repeat = lex.filt(str.isdigit).then_with(
+            lambda digit: just_char("x").repeated().at_least(int(digit))
+        )
+
+        assert repeat.parse_at(Stream.from_source("2xxx"), 0) == (
+            ("2", ["x", "x", "x"]),
+            4,
+        )
+        assert repeat.parse_at(Stream.from_source("3xx"), 0) is PR.NoMatch
+
+
+class TestMemoized:
+    def test_memoized_hit_on_backtrack(self):
+        tokens = lex.tokenize("1 2").stream
+        memo = integer.memoized()
+
+        result = (memo.then(just(Basic.Comma)) | memo).parse(tokens).unwrap()
+
+        assert result[0] == IntegerLiteral(1)
+        assert memo.misses == 1
+        assert memo.hits == 1
+
+    def test_memoized_no_match(self):
+        tokens = lex.tokenize("foo").stream
+        memo = integer.memoized()
+
+        assert (memo | memo).parse(tokens) is PR.NoMatch
+        assert (memo.misses, memo.hits) == (1, 1)
+
+    def test_memoized_scoped_to_parse(self):
+        # A second parse of the same tokens runs every rule again, so it has
+        # the same result as the first.
+        tokens = lex.tokenize("trait Iterator").stream
+        first = parse.parse(tokens)
+
+        assert parse.parse(tokens) == first
+
+    def test_memoized_eviction(self):
+        tokens = lex.tokenize("1 2 3").stream
+        memo = integer.memoized(capacity=2)
+
+        for position in range(3):
+            memo.parse(tokens.advance(position))
+        memo.parse(tokens)
+
+        assert memo.misses == 4
+        assert memo.hits == 0
+
+    def test_memoized_new_buffer_flushes(self):
+        memo = integer.memoized()
+
+        first = memo.parse(lex.tokenize("1").stream).unwrap()
+        second = memo.parse(lex.tokenize("2").stream).unwrap()
+
+        assert first[0] == IntegerLiteral(1)
+        assert second[0] == IntegerLiteral(2)
+        assert memo.hits == 0
+
+
+class TestBudget:
+    def nested(self) -> Parser[str, t.Any, t.Any]:
+        # Backtracks over every open paren twice, so takes exponential time on
+        # unclosed input.
+        nested: Recursive[str, t.Any, t.Any] = recursive(
+            lambda nested: just_char("(").then(nested).then(just_char(")"))
+            | just_char("(").then(nested).then(just_char("]"))
+            | just_char("x")
+        )
+        return nested
+
+    def test_steps_exhausted(self):
+        budget = Budget("too slow", steps=50)
+        result = self.nested().parse(Stream.from_source("(" * 20 + "x"), budget)
+
+        assert isinstance(result, PR.Error)
+        assert result.value == "too slow"
+        assert budget.used == 50
+
+    def test_seconds_exhausted(self):
+        budget = Budget("too slow", seconds=0)
+        result = self.nested().parse(Stream.from_source("(" * 30 + "x"), budget)
+
+        assert isinstance(result, PR.Error)
+        assert result.value == "too slow"
+
+    def test_meter(self):
+        prefix = lex.filt(str.isalpha).repeated()
+        grammar = prefix.then(just_char("1")) | prefix.then(just_char("2"))
+        budget = Budget[t.Any]("too slow")
+
+        assert grammar.parse_at(Stream.from_source("abc2"), 0) == (
+            (["a", "b", "c"], "2"),
+            4,
+        )
+        assert isinstance(grammar.parse(Stream.from_source("abc2"), budget), PR.Match)
+        assert budget.used == 2
+        assert budget.reexamined == 4
+
+    def test_compiled_matches(self):
+        nested = self.nested()
+        compiled = compile_parser(nested)
+
+        for source, steps in (("((x))", None), ("((x)]", None), ("(((((x", 20)):
+            stream = Stream.from_source(source)
+            interpreted_budget = Budget("too slow", steps)
+            compiled_budget = Budget("too slow", steps)
+
+            assert compiled.parse(stream, compiled_budget) == nested.parse(
+                stream, interpreted_budget
+            )
+            assert compiled_budget == interpreted_budget
+
+    def test_parse_budget(self):
+        tokens = lex.tokenize("def f(a: u8) {\n  return a + 1\n}\n").stream
+
+        assert isinstance(parse.parse(tokens, parse.budget()), PR.Match)
+        result = parse.parse(tokens, parse.budget(steps=10))
+        assert isinstance(result, PR.Error)
+        assert isinstance(result.value, error.BudgetExhausted)
+
+
+class TestCut:
+    def test_cut_commits(self):
+        grammar = just_char("a").cut("bad a").then(just_char("b")) | just_char(
+            "a"
+        ).then(just_char("c"))
+        stream = Stream.from_source("ac")
+
+        assert grammar.parse(stream) == PR.Error("bad a", stream.spans[1].span)
+        assert compile_parser(grammar).parse(stream) == grammar.parse(stream)
+
+    def test_cut_is_scoped_to_choice(self):
+        committed = just_char("a").cut("bad a") | just_char("z")
+        grammar = committed.then(just_char("b")) | just_char("a").then(just_char("c"))
+        stream = Stream.from_source("ac")
+
+        assert grammar.parse_at(stream, 0) == (("a", "c"), 2)
+        assert compile_parser(grammar).parse_at(stream, 0) == (("a", "c"), 2)
+
+    def test_cut_drops_memoized(self):
+        memo = just_char("a").memoized()
+        grammar = memo.then(just_char("b")).cut("bad").then(memo)
+
+        state = State(Stream.from_source("aba"))
+
+        assert grammar.run(state, 0) == 3
+        assert list(state.memos[id(memo)].table) == [2]
+
+    def test_cut_through_memoized(self):
+        # The first use of `rule` passes its cut outside of any choice, and the
+        # second commits the choice it is a branch of, from the memo table.
+        def grammar(rule: Parser[str, t.Any, str]) -> Parser[str, t.Any, str]:
+            return rule.or_not().then(rule | just_char("a").then(just_char("c")))
+
+        rule = (
+            just_char("x")
+            .or_not()
+            .cut("bad a")
+            .then(just_char("a"))
+            .then(just_char("b"))
+        )
+        memo = rule.memoized()
+        stream = Stream.from_source("ac")
+        expected = grammar(rule).parse(stream)
+
+        assert expected == PR.Error("bad a", stream.spans[1].span)
+        assert grammar(memo).parse(stream) == expected
+        assert memo.hits == 1
+        assert compile_parser(grammar(memo)).parse(stream) == expected
+
+
+class TestFailure:
+    def test_records_farthest(self):
+        grammar = just_char("a").then(just_char("b")).then(just_char("c")) | just_char(
+            "a"
+        ).then(just_char("d") | just_char("e"))
+        stream = Stream.from_source("abx")
+
+        for parser in grammar, compile_parser(grammar):
+            failure = Failure[str]()
+            assert parser.parse(stream, failure=failure) == PR.NoMatch
+            assert failure.position == 2
+            assert failure.span == stream.spans[2].span
+            assert failure.expected == [just_char("c")]
+
+    def test_merges_expectations(self):
+        # Branches skipped by a dispatch table are recorded as their choice.
+        choice = just_char("b") | just_char("c")
+        grammar = just_char("a").then(choice) | just_char("a").then(just_char("d"))
+        stream = Stream.from_source("ax")
+
+        for parser in grammar, compile_parser(grammar):
+            failure = Failure[str]()
+            assert parser.parse(stream, failure=failure) == PR.NoMatch
+            assert failure.position == 1
+            assert failure.expected == [choice, just_char("d")]
+
+    def test_memoized_replays_failures(self):
+        rule = just_char("a").then(just_char("b").then(just_char("x")) | just_char("c"))
+        memo = rule.memoized()
+        stream = Stream.from_source("ab")
+
+        for parser in memo, compile_parser(memo):
+            state = State(stream)
+            assert parser.run(state, 0) == NO_MATCH
+            recorded = (state.farthest, list(state.expected.values()))
+            assert recorded == (3, [just_char("x")])
+
+            # A hit records the same failures as the run that filled it.
+            state.farthest, state.expected = 0, {}
+            assert parser.run(state, 0) == NO_MATCH
+            assert (state.farthest, list(state.expected.values())) == recorded
+
+
+class TestTrace:
+    def test_records_branches(self):
+        first = just_char("a").then(just_char("b"))
+        second = just_char("a").then(just_char("c"))
+        stream = Stream.from_source("ac")
+
+        for parser in first | second, compile_parser(first | second):
+            trace = Trace()
+            assert parser.parse(stream, trace=trace) == PR.Match(
+                ("a", "c"), stream.at(2)
+            )
+            assert [
+                (getattr(branch, "parser", branch), position, outcome)
+                for branch, position, outcome in trace.events()
+            ] == [(first, 0, NO_MATCH), (second, 0, 2)]
+
+    def test_keeps_last_events(self):
+        grammar = (just_char("a") | just_char("b")).repeated()
+        trace = Trace(capacity=2)
+        grammar.parse(Stream.from_source("abab"), trace=trace)
+
+        assert trace.recorded == 4
+        assert [position for _, position, _ in trace.events()] == [2, 3]
+
+    def test_dumps_on_error(self):
+        output = io.StringIO()
+        grammar = just_char("a").then(just_char("b")) | just_char("a").then(
+            just_char("c")
+        )
+        grammar.parse(Stream.from_source("ab"), trace=Trace(on_error=output))
+        assert output.getvalue() == ""
+
+        grammar.parse(Stream.from_source("ad"), trace=Trace(on_error=output))
+        assert output.getvalue().startswith("last 2 of 2 traced events:")
+
+
+class TestProfile:
+    def test_counts_rules(self):
+        digit = OneOf[str, str](tuple("0123456789")).labelled("digit")
+        number = digit.repeated().at_least(1).labelled("number")
+        grammar = number.then(just_char("+").then(number)).labelled("sum") | number
+        stream = Stream.from_source("12+x")
+
+        for parser in grammar, compile_parser(grammar):
+            profile = Profile()
+            assert parser.parse(stream, profile=profile) == PR.Match(
+                ["1", "2"], stream.at(2)
+            )
+
+            assert profile.rules.keys() == {"sum", "number", "digit"}
+            assert profile.rules["sum"].failures == 1
+            assert profile.rules["sum"].backtracked == 4
+            assert profile.rules["number"].calls == 3
+            assert profile.rules["number"].consumed == 4
+            assert profile.rules["digit"].matches == 4
+            assert profile.rules["digit"].failures == 3
+            assert profile.rules["sum"].inclusive >= profile.rules["sum"].exclusive
+
+            assert set(profile.stacks) == {
+                "sum",
+                "sum;number",
+                "sum;number;digit",
+                "number",
+                "number;digit",
+            }
+            assert all(
+                line.rsplit(" ", 1)[1].isdigit()
+                for line in profile.folded().splitlines()
+            )
+
+    def test_recursion_counted_once(self):
+        nested: Recursive[str, t.Any, t.Any] = recursive()
+        nested.define(
+            just_char("(")
+            .ignore_then(nested.or_not())
+            .then_ignore(just_char(")"))
+            .labelled("nested")
+        )
+        profile = Profile()
+        nested.parse(Stream.from_source("((()))"), profile=profile)
+
+        rule = profile.rules["nested"]
+        assert rule.calls == 4
+        assert rule.inclusive <= sum(profile.stacks.values())
+
+    def test_labels_name_rules(self):
+        rule = just_char("a").then(just_char("c")).labelled("a_rule")
+        trace = Trace()
+        compile_parser(rule | just_char("a")).parse(
+            Stream.from_source("ab"), trace=trace
+        )
+
+        assert [label(branch) for branch, _, _ in trace.events()] == [
+            "a_rule",
+            "Just(pattern='a')",
+        ]
+        assert [
+            str(issue)
+            for issue in analyze(just_char("a").or_not().repeated().labelled("a"))
+        ] == ["NullableRepetition at Labelled('a') > Repeated"]
+
+
+class TestOptimize:
+    def matches(self, grammar: Parser[str, t.Any, t.Any], *sources: str):
+        optimized = optimize(grammar)
+        compiled = compile_parser(optimized)
+        for source in sources:
+            stream = Stream.from_source(source)
+            assert optimized.parse(stream) == grammar.parse(stream)
+            assert compiled.parse(stream) == grammar.parse(stream)
+        return optimized
+
+    def test_flattens_sequences(self):
+        grammar = (
+            just_char("a")
+            .then(just_char("b"))
+            .then_ignore(just_char("c"))
+            .then(just_char("d").delimited_by(just_char("("), just_char(")")))
+        )
+        optimized = self.matches(grammar, "abc(d)", "abcd", "ab", "")
+
+        assert optimized == Sequence(
+            (
+                just_char("a"),
+                just_char("b"),
+                just_char("c"),
+                just_char("("),
+                just_char("d"),
+                just_char(")"),
+            ),
+            ((0, 1), 4),
+        )
+
+    def test_fuses_maps(self):
+        grammar = (
+            just_char("a")
+            .then(just_char("b"))
+            .then(just_char("c"))
+            .map(lambda items: items[0])
+            .map("".join)
+        )
+        optimized = self.matches(grammar, "abc", "abd")
+
+        assert isinstance(optimized, Sequence)
+        assert optimized.parse_at(Stream.from_source("abc"), 0) == ("ab", 3)
+
+    def test_left_factors(self):
+        grammar = (
+            just_char("a")
+            .then(just_char("b"))
+            .then(just_char("c"))
+            .map(lambda items: "abc")
+            | just_char("a").ignore_then(just_char("b")).then(just_char("d"))
+            | just_char("a")
+            | just_char("x")
+        )
+        optimized = self.matches(grammar, "abc", "abd", "ab", "a", "x", "")
+
+        assert isinstance(optimized, Choice)
+        factored = list(optimized.choices)[0]
+        assert isinstance(factored, Factored)
+        assert len(factored.tails) == 3
+
+    def test_left_factored_cut(self):
+        grammar = just_char("a").then(just_char("b").cut("bad b")).then(
+            just_char("c")
+        ) | just_char("a").then(just_char("b")).then(just_char("d"))
+
+        self.matches(grammar, "abc", "abd", "a")
+
+    def test_grammar_is_untouched(self):
+        grammar = just_char("a").then(just_char("b")).then(just_char("c"))
+        optimize(grammar)
+
+        assert grammar == just_char("a").then(just_char("b")).then(just_char("c"))
+
+
+class TestFirstSets:
+    def test_just_first_set(self):
+        assert just(Basic.Comma).first_set() == First(frozenset({Basic.Comma}))
+
+    def test_optional_first_set(self):
+        first = just(Basic.Comma).or_not().then(integer).first_set()
+
+        assert first.items is None
+
+    def test_repeated_first_set(self):
+        first = OneOf[str, error.LexError]("01").repeated().first_set()
+
+        assert first == First(frozenset("01"), nullable=True)
+
+    def test_keyword_dispatch(self):
+        dispatch = parse.decl.dispatch()
+
+        assert len(dispatch.branches) == 7
+        assert all(len(branches) == 1 for branches in dispatch.table.values())
+        assert dispatch.fallback == ()
+        assert dispatch.backtracking() == {}
+
+    def test_dispatch_unhashable_item(self):
+        tokens = lex.tokenize("foo").stream
+        parser = just(Basic.Comma).to(None) | ident.map(lambda _: "ident")
+
+        assert parser.parse_at(tokens, 0) == ("ident", 1)
+
+    def test_dispatch_payload_items(self):
+        # Tables are probed with every upcoming token, which must hash rather
+        # than raise and leave dispatch to its slow path.
+        tokens = lex.tokenize_with_comments("x 1 \"s\" 'c' # c").stream
+        dispatch = (
+            just(Basic.Comma).to(None) | ident.map(lambda _: "ident")
+        ).dispatch()
+
+        assert [dispatch.table.get(item) for item in tokens.items] == [None] * 6
+
+    def test_dispatch_end_of_input(self):
+        stream = Stream.from_source("")
+        parser = lex.just("a") | lex.eof
+
+        assert parser.parse_at(stream, 0) == (Maybe.Nothing, 0)
+
+    def test_backtracking_report(self):
+        parser = lex.just("a").then(lex.just("b")) | lex.just("a") | lex.just("c")
+
+        (alternative, counts), *rest = backtracking(parser)
+
+        assert alternative is parser
+        assert counts == {"a": 2}
+        assert rest == []
+
+
+class TestAnalysis:
+    def test_grammars_are_clean(self):
+        assert analyze(lex.tokenizer) == []
+        assert analyze(parse.decls) == []
+
+    def test_nullable_repetition(self):
+        grammar = just_char("a").or_not().repeated()
+
+        assert [issue.kind for issue in analyze(grammar)] == [
+            Issue.Kind.NullableRepetition
+        ]
+
+    def test_left_recursion(self):
+        grammar: Recursive[str, t.Any, t.Any] = recursive(
+            lambda rule: rule.then(just_char("a")) | just_char("b")
+        )
+
+        assert [issue.kind for issue in analyze(grammar)] == [Issue.Kind.LeftRecursion]
+
+    def test_right_recursion(self):
+        assert (
+            analyze(recursive(lambda rule: just_char("a").then(rule) | just_char("b")))
+            == []
+        )
+
+    def test_shadowed_alternative(self):
+        grammar = just_char("a").or_not() | just_char("b") | just_char("a")
+        issues = analyze(grammar)
+
+        assert [issue.kind for issue in issues] == [
+            Issue.Kind.ShadowedAlternative,
+            Issue.Kind.ShadowedAlternative,
+        ]
+        assert [issue.path for issue in issues] == ["Alternative[1]", "Alternative[2]"]
+
+    def test_check_is_opt_in(self, monkeypatch: pytest.MonkeyPatch):
+        grammar = just_char("a").or_not().repeated()
+
+        monkeypatch.delenv("OPYL_CHECK_GRAMMAR", raising=False)
+        check(grammar, "grammar")
+
+        monkeypatch.setenv("OPYL_CHECK_GRAMMAR", "1")
+        with pytest.raises(GrammarError):
+            check(grammar, "grammar")
+
+
+class TestCompiler:
+    def test_compiled_lexer_matches(self):
+        source = Stream.from_source("let x: u8 = 0x_4_5 + foo(\"bar\", 'c') # done\n")
+        compiled = compile_parser(lex.tokenizer)
+
+        assert compiled.parse(source) == lex.tokenizer.parse(source)
+
+    def test_compiled_lexer_error_matches(self):
+        source = Stream.from_source('"unterminated\n')
+        compiled = compile_parser(lex.tokenizer)
+
+        assert compiled.parse(source) == lex.tokenizer.parse(source)
+        assert isinstance(compiled.parse(source), PR.Error)
+
+    def test_compiled_parser_matches(self):
+        tokens = lex.tokenize("def f(a: u8) -> u8 {\n  return a + 1\n}").stream
+        compiled = compile_parser(parse.decls)
+
+        assert compiled.parse(tokens) == parse.decls.parse(tokens)
+
+    def test_compiled_is_cached(self):
+        assert compile_parser(lex.tokenizer) is compile_parser(lex.tokenizer)
+
+    def test_repeated_filter_is_a_loop(self):
+        compiled = compile_parser(lex.filt(str.isalpha).repeated())
+
+        assert "while pos < n:" in compiled.source
+        assert compiled.parse_at(Stream.from_source("ab1"), 0) == (["a", "b"], 2)
+
+    def test_unknown_parser_fallback(self):
+        class Second(Parser[Token, IntegerLiteral, error.ParseError]):
+            def parse(
+                self,
+                input: Stream[Token],
+                budget: Budget[error.ParseError] | None = None,
+                failure: Failure[Token] | None = None,
+                trace: Trace | None = None,
+                profile: Profile | None = None,
+            ) -> ParseResult.Type[Token, IntegerLiteral, error.ParseError]:
+                return (
+                    just(Basic.Comma)
+                    .ignore_then(integer)
+                    .parse(input, budget, failure, trace, profile)
+                )
+
+        tokens = lex.tokenize("1, 2").stream
+        compiled = compile_parser(integer.then(Second()))
+
+        assert compiled.parse_at(tokens, 0) == (
+            (IntegerLiteral(1), IntegerLiteral(2)),
+            3,
+        )